@@ -56,6 +56,8 @@ from kingpin import exceptions as kingpin_exceptions
 from kingpin.actors import base
 from kingpin.actors import exceptions
 from kingpin.actors.aws import settings as aws_settings
+from kingpin.actors.support import summary
+from kingpin.actors.support import tracing
 
 log = logging.getLogger(__name__)
 
@@ -174,6 +176,8 @@ class AWSBaseActor(base.BaseActor):
             aws_access_key_id=key,
             aws_secret_access_key=secret)
 
+    @tracing.traced('thread', cat='aws')
+    @summary.timed_thread('aws')
     @concurrent.run_on_executor
     @retry(**aws_settings.RETRYING_SETTINGS)
     @utils.exception_logger
@@ -187,7 +191,9 @@ class AWSBaseActor(base.BaseActor):
         to write a wrapper method that is decorated with run_on_executor()
         """
         try:
-            return function(*args, **kwargs)
+            with tracing.span(getattr(function, '__name__', 'thread'),
+                              cat='aws.run', actor=self):
+                return function(*args, **kwargs)
         except boto_exception.BotoServerError as e:
             # If we're using temporary IAM credentials, when those expire we
             # can get back a blank 400 from Amazon. This is confusing, but it
@@ -36,6 +36,19 @@ AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY', None)
 
 SQS_RETRY_DELAY = 30
 
+# How long (in seconds) a region-wide SQS queue listing is re-used by other SQS
+# actors before we ask Amazon for a fresh one.
+SQS_QUEUE_CACHE_TTL = 10
+
+# Upper bound (in seconds) on the polling interval used by the
+# aws.sqs.WaitUntilEmpty actor while the queues are not draining.
+SQS_WAIT_MAX_SLEEP = 30
+
+# Number of message-count samples per queue used by aws.sqs.WaitUntilEmpty to
+# estimate the drain rate of a queue. A full window is also required before the
+# actor will give up early on a queue that cannot drain before its timeout.
+SQS_DRAIN_WINDOW = 10
+
 ECS_RETRY_ATTEMPTS = 3
 ECS_RETRY_DELAY = 5
 
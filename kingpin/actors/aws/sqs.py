@@ -17,8 +17,10 @@
 ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 """
 
+import collections
 import logging
 import re
+import time
 
 from tornado import concurrent
 from tornado import gen
@@ -45,12 +47,24 @@ __author__ = 'Mikhail Simin <mikhail@nextdoor.com>'
 # do this.
 EXECUTOR = concurrent.futures.ThreadPoolExecutor(10)
 
+# Region-name -> (expiration timestamp, Future) map of SQS queue listings.
+# Listing every queue in a region is expensive, and a script with many SQS
+# actors would otherwise ask for the same list over and over again. The Future
+# is stored (rather than the result) so that concurrent actors share a single
+# in-flight get_all_queues() call.
+QUEUE_LIST_CACHE = {}
+
 
 class QueueNotFound(exceptions.RecoverableActorFailure):
 
     """Raised by SQS Actor when a needed queue is not found."""
 
 
+class QueueWillNotDrain(exceptions.RecoverableActorFailure):
+
+    """Raised when a queue is not going to empty before the actor times out."""
+
+
 class QueueDeletionFailed(exceptions.RecoverableActorFailure):
 
     """Raised if Boto fails to delete an SQS queue.
@@ -74,6 +88,48 @@ class SQSBaseActor(base.AWSBaseActor):
     ioloop = ioloop.IOLoop.current()
     executor = EXECUTOR
 
+    def _queue_cache_key(self):
+        """Returns the key used to store our queue listing in the cache."""
+        return self.sqs_conn.region.name
+
+    def _invalidate_queue_cache(self):
+        """Forgets the cached queue listing for our region.
+
+        Must be called any time we create or delete a queue, so that the next
+        _fetch_queues() call sees the change.
+        """
+        QUEUE_LIST_CACHE.pop(self._queue_cache_key(), None)
+
+    @gen.coroutine
+    def _list_queues(self):
+        """Returns all of the queues in our region.
+
+        The listing is shared with every other SQS actor working in the same
+        region for `SQS_QUEUE_CACHE_TTL` seconds.
+
+        Returns:
+            Array of boto.sqs.queue.Queue objects.
+        """
+        key = self._queue_cache_key()
+        cached = QUEUE_LIST_CACHE.get(key)
+        if cached and cached[0] > time.time():
+            self.log.debug('Using cached SQS queue listing')
+            queues = yield cached[1]
+            raise gen.Return(queues)
+
+        fut = self.thread(self.sqs_conn.get_all_queues)
+        expiration = time.time() + aws_settings.SQS_QUEUE_CACHE_TTL
+        QUEUE_LIST_CACHE[key] = (expiration, fut)
+
+        try:
+            queues = yield fut
+        except Exception:
+            # Never leave a failed listing behind for the next actor
+            self._invalidate_queue_cache()
+            raise
+
+        raise gen.Return(queues)
+
     @gen.coroutine
     def _fetch_queues(self, pattern):
         """Searches SQS for all queues with a matching name pattern.
@@ -84,7 +140,7 @@ class SQSBaseActor(base.AWSBaseActor):
         Returns:
             Array of matched queues, even if empty.
         """
-        queues = yield self.thread(self.sqs_conn.get_all_queues)
+        queues = yield self._list_queues()
         match_queues = [q for q in queues if re.search(pattern, q.name)]
         raise gen.Return(match_queues)
 
@@ -140,6 +196,7 @@ class Create(SQSBaseActor):
         if not self._dry:
             self.log.info('Creating a new queue: %s' % name)
             new_queue = yield self.thread(self.sqs_conn.create_queue, name)
+            self._invalidate_queue_cache()
         else:
             self.log.info('Would create a new queue: %s' % name)
             new_queue = mock.Mock(name=name)
@@ -235,6 +292,7 @@ class Delete(SQSBaseActor):
         """
         self.log.info('Deleting Queue: %s...' % queue.url)
         ok = yield self.thread(self.sqs_conn.delete_queue, queue)
+        self._invalidate_queue_cache()
 
         # Raise an exception if the tasks failed
         if not ok:
@@ -258,6 +316,8 @@ class Delete(SQSBaseActor):
                                not self.option('idempotent'))
 
         if not_found_condition:
+            # Make sure that our retry gets a fresh look at the queues
+            self._invalidate_queue_cache()
             raise QueueNotFound(
                 'No queues with pattern "%s" found.' % pattern)
 
@@ -280,6 +340,13 @@ class WaitUntilEmpty(SQSBaseActor):
     so this can return a stale value if the number of messages in the queue
     changes rapidly.
 
+    While waiting, the drain rate of every queue is estimated from its recent
+    message counts and an ETA is logged. The polling interval grows with the
+    ETA, so queues with long backlogs are not polled needlessly often. If the
+    actor has a `timeout` and the drain rate shows that a queue will not be
+    empty before it expires, the actor fails right away rather than waiting
+    for the timeout.
+
 
     **Options**
 
@@ -320,37 +387,152 @@ class WaitUntilEmpty(SQSBaseActor):
     }
 
     @gen.coroutine
-    def _wait(self, queue, sleep=3):
-        """Sleeps until an SQS Queue has emptied out.
+    def _get_message_count(self, queue):
+        """Returns the total number of messages in a queue.
+
+        Both the visible and the in-flight (not visible) messages are fetched
+        in a single GetQueueAttributes call.
 
         Args:
             queue: AWS SQS Queue object
+
+        Returns:
+            Int count of visible plus invisible messages.
+        """
+        self.log.debug('Counting %s' % queue.url)
+        attrs = yield self.thread(queue.get_attributes, 'All')
+        visible = int(attrs.get('ApproximateNumberOfMessages', 0))
+        invisible = int(attrs.get('ApproximateNumberOfMessagesNotVisible', 0))
+        raise gen.Return(visible + invisible)
+
+    def _drain_rate(self, samples):
+        """Estimates how quickly a queue is draining.
+
+        Args:
+            samples: Sequence of (timestamp, message count) tuples, oldest
+            first.
+
+        Returns:
+            Float messages drained per second (negative if the queue is
+            growing), or None if there is not enough data for an estimate.
+        """
+        if len(samples) < 2:
+            return None
+
+        (first_time, first_count) = samples[0]
+        (last_time, last_count) = samples[-1]
+        elapsed = last_time - first_time
+        if elapsed <= 0:
+            return None
+
+        return (first_count - last_count) / float(elapsed)
+
+    def _drain_eta(self, samples):
+        """Estimates the number of seconds until a queue is empty.
+
+        Args:
+            samples: Sequence of (timestamp, message count) tuples, oldest
+            first.
+
+        Returns:
+            Float seconds, float('inf') if the queue is not draining at all,
+            or None if there is not enough data for an estimate.
+        """
+        rate = self._drain_rate(samples)
+        if rate is None:
+            return None
+        if rate <= 0:
+            return float('inf')
+
+        return samples[-1][1] / rate
+
+    def _format_eta(self, eta):
+        """Returns a human readable version of an ETA in seconds."""
+        if eta is None:
+            return 'unknown'
+        if eta == float('inf'):
+            return 'never (not draining)'
+        return '%ds' % eta
+
+    @gen.coroutine
+    def _wait(self, queues, sleep=3):
+        """Sleeps until all of the supplied SQS Queues have emptied out.
+
+        Every non-empty queue is counted concurrently on each pass, and the
+        counts are kept in a sliding window of `SQS_DRAIN_WINDOW` samples per
+        queue to estimate the drain rate and ETA of each queue.
+
+        The polling interval is stretched to a tenth of the longest ETA (up to
+        `SQS_WAIT_MAX_SLEEP`). When the queues are not draining at all, the
+        interval is doubled on each pass instead.
+
+        Args:
+            queues: List of AWS SQS Queue objects
             sleep: Int of seconds to wait between checks
 
         Returns:
-            True: When queue is empty.
+            True: When all queues are empty.
+
+        Raises:
+            QueueWillNotDrain: If the drain rate of a queue shows that it will
+            not be empty before the actor times out.
         """
+        if self._dry:
+            for queue in queues:
+                self.log.info('Pretending that count is 0 for %s' % queue.url)
+            raise gen.Return(True)
 
-        count = 0
+        deadline = None
+        if self._timeout:
+            deadline = time.time() + float(self._timeout)
+
+        windows = dict(
+            (q, collections.deque(maxlen=aws_settings.SQS_DRAIN_WINDOW))
+            for q in queues)
+
+        remaining = list(queues)
+        interval = sleep
         while True:
-            if not self._dry:
-                self.log.debug('Counting %s' % queue.url)
-                visible = yield self.thread(queue.count)
-                attr = 'ApproximateNumberOfMessagesNotVisible'
-                invisible = yield self.thread(queue.get_attributes, attr)
-                invisible_int = int(invisible[attr])
-                count = visible + invisible_int
-            else:
-                self.log.info('Pretending that count is 0 for %s' % queue.url)
-                count = 0
+            counts = yield [self._get_message_count(q) for q in remaining]
+            now = time.time()
+            for queue, count in zip(remaining, counts):
+                self.log.debug('Queue %s has %s messages in it.' %
+                               (queue.name, count))
+                windows[queue].append((now, count))
+
+            remaining = [q for q, c in zip(remaining, counts) if c > 0]
+            if not remaining:
+                self.log.debug('All queues are empty!')
+                break
 
-            self.log.debug('Queue has %s messages in it.' % count)
-            if count > 0:
-                self.log.info('Waiting on %s to become empty...' % queue.name)
-                yield utils.tornado_sleep(sleep)
+            etas = []
+            for queue in remaining:
+                samples = windows[queue]
+                eta = self._drain_eta(samples)
+                self.log.info(
+                    'Waiting on %s to become empty (%s messages, ETA: %s)...'
+                    % (queue.name, samples[-1][1], self._format_eta(eta)))
+
+                # No ETA yet with a single sample, or no time between them
+                window_full = len(samples) == samples.maxlen
+                if (window_full and deadline and eta is not None and
+                        now + eta > deadline):
+                    raise QueueWillNotDrain(
+                        'Queue %s will not be empty before this actor times '
+                        'out (ETA: %s)' % (queue.name, self._format_eta(eta)))
+
+                if eta is not None:
+                    etas.append(eta)
+
+            if not etas:
+                interval = sleep
+            elif max(etas) == float('inf'):
+                interval = min(interval * 2, aws_settings.SQS_WAIT_MAX_SLEEP)
             else:
-                self.log.debug('Queue is empty!')
-                break
+                interval = min(max(max(etas) / 10, sleep),
+                               aws_settings.SQS_WAIT_MAX_SLEEP)
+
+            yield utils.tornado_sleep(interval)
 
         raise gen.Return(True)
 
@@ -371,13 +553,9 @@ class WaitUntilEmpty(SQSBaseActor):
         self.log.info('Waiting for "%s" queues to become empty.' %
                       self.option('name'))
 
-        sleepers = []
-        for q in matched_queues:
-            sleepers.append(self._wait(queue=q))
-
         self.log.info('%s queues need to be empty.' % len(matched_queues))
         self.log.info([q.name for q in matched_queues])
-        yield sleepers
+        yield self._wait(queues=matched_queues)
         self.log.info('All queues report empty.')
 
         raise gen.Return()
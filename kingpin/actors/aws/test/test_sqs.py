@@ -8,7 +8,7 @@ import mock
 from kingpin.actors import exceptions
 from kingpin.actors.aws import settings
 from kingpin.actors.aws import sqs
-from kingpin.actors.test.helper import mock_tornado
+from kingpin.actors.test.helper import mock_tornado, tornado_value
 
 log = logging.getLogger(__name__)
 
@@ -20,6 +20,9 @@ class SQSTestCase(testing.AsyncTestCase):
         settings.AWS_ACCESS_KEY_ID = 'unit-test'
         settings.AWS_SECRET_ACCESS_KEY = 'unit-test'
         settings.RETRYING_SETTINGS = {'stop_max_attempt_number': 1}
+        settings.SQS_WAIT_MAX_SLEEP = 0
+        settings.SQS_QUEUE_CACHE_TTL = 10
+        settings.SQS_DRAIN_WINDOW = 10
         reload(sqs)
 
     @mock.patch.object(boto.sqs.connection, 'SQSConnection')
@@ -49,6 +52,56 @@ class TestSQSBaseActor(SQSTestCase):
 
         self.assertEquals(results, [all_queues[2], all_queues[3]])
 
+    @testing.gen_test
+    def test_fetch_shares_cached_listing(self):
+        q = mock.Mock()
+        q.name = 'unit-test-queue'
+        self.sqs_conn().get_all_queues.return_value = [q]
+
+        actor1 = sqs.SQSBaseActor('Unit Test Action', {
+            'name': 'unit-test-queue',
+            'region': 'us-east-1'})
+        actor2 = sqs.SQSBaseActor('Unit Test Action', {
+            'name': 'unit-test-queue',
+            'region': 'us-east-1'})
+
+        yield [actor1._fetch_queues('unit'), actor2._fetch_queues('unit')]
+        results = yield actor2._fetch_queues('unit')
+        self.assertEquals(results, [q])
+        self.assertEquals(self.sqs_conn().get_all_queues.call_count, 1)
+
+        # Invalidating the cache forces a new listing
+        actor1._invalidate_queue_cache()
+        yield actor2._fetch_queues('unit')
+        self.assertEquals(self.sqs_conn().get_all_queues.call_count, 2)
+
+    @testing.gen_test
+    def test_fetch_cache_expires(self):
+        settings.SQS_QUEUE_CACHE_TTL = -1
+        self.sqs_conn().get_all_queues.return_value = []
+        actor = sqs.SQSBaseActor('Unit Test Action', {
+            'name': 'unit-test-queue',
+            'region': 'us-east-1'})
+
+        yield actor._fetch_queues('unit')
+        yield actor._fetch_queues('unit')
+        self.assertEquals(self.sqs_conn().get_all_queues.call_count, 2)
+
+    @testing.gen_test
+    def test_fetch_failure_not_cached(self):
+        self.sqs_conn().get_all_queues.side_effect = [
+            exceptions.RecoverableActorFailure('boom'), []]
+        actor = sqs.SQSBaseActor('Unit Test Action', {
+            'name': 'unit-test-queue',
+            'region': 'us-east-1'})
+
+        with self.assertRaises(exceptions.RecoverableActorFailure):
+            yield actor._fetch_queues('unit')
+        self.assertEquals(sqs.QUEUE_LIST_CACHE, {})
+
+        results = yield actor._fetch_queues('unit')
+        self.assertEquals(results, [])
+
 
 class TestCreateSQSQueueActor(SQSTestCase):
 
@@ -59,9 +112,11 @@ class TestCreateSQSQueueActor(SQSTestCase):
                                  'region': 'us-west-2'})
 
         self.sqs_conn().create_queue.return_value = boto.sqs.queue.Queue()
+        self.actor._invalidate_queue_cache = mock.Mock()
         ret = yield self.actor.execute()
         self.assertEquals(ret, None)
         self.sqs_conn().create_queue.assert_called_once_with('unit-test-queue')
+        self.actor._invalidate_queue_cache.assert_called_once_with()
 
     @testing.gen_test
     def test_execute_dry(self):
@@ -187,18 +242,59 @@ class TestWaitUntilQueueEmptyActor(SQSTestCase):
             yield actor.execute()
 
     @testing.gen_test
-    def test_wait(self):
+    def test_get_message_count(self):
         actor = sqs.WaitUntilEmpty('UTA!',
                                    {'name': 'unit-test-queue',
                                     'region': 'us-west-2'})
         queue = mock.Mock()
-        queue.count.side_effect = [1, 0, 0]
-        attr = 'ApproximateNumberOfMessagesNotVisible'
-        queue.get_attributes.side_effect = [{attr: u'0'},
-                                            {attr: u'1'},
-                                            {attr: u'0'}]
-        yield actor._wait(queue, sleep=0)
-        self.assertEqual(queue.count.call_count, 3)
+        queue.get_attributes.return_value = {
+            'ApproximateNumberOfMessages': u'3',
+            'ApproximateNumberOfMessagesNotVisible': u'2'}
+        count = yield actor._get_message_count(queue)
+        self.assertEquals(count, 5)
+        queue.get_attributes.assert_called_once_with('All')
+
+    @testing.gen_test
+    def test_wait(self):
+        actor = sqs.WaitUntilEmpty('UTA!',
+                                   {'name': 'unit-test-queue',
+                                    'region': 'us-west-2'})
+        visible = 'ApproximateNumberOfMessages'
+        invisible = 'ApproximateNumberOfMessagesNotVisible'
+        queue1 = mock.Mock()
+        queue1.get_attributes.side_effect = [
+            {visible: u'1', invisible: u'0'},
+            {visible: u'0', invisible: u'1'},
+            {visible: u'0', invisible: u'1'},
+            {visible: u'0', invisible: u'0'}]
+        queue2 = mock.Mock()
+        queue2.get_attributes.side_effect = [
+            {visible: u'0', invisible: u'0'}]
+
+        yield actor._wait([queue1, queue2], sleep=0)
+
+        # One call per queue per pass, and empty queues are not re-counted
+        self.assertEqual(queue1.get_attributes.call_count, 4)
+        self.assertEqual(queue2.get_attributes.call_count, 1)
+        self.assertFalse(queue1.count.called)
+
+    @testing.gen_test
+    def test_wait_backs_off(self):
+        settings.SQS_WAIT_MAX_SLEEP = 8
+        actor = sqs.WaitUntilEmpty('UTA!',
+                                   {'name': 'unit-test-queue',
+                                    'region': 'us-west-2'})
+        actor._get_message_count = mock.Mock(side_effect=[
+            tornado_value(5), tornado_value(5), tornado_value(5),
+            tornado_value(5), tornado_value(5), tornado_value(2),
+            tornado_value(0)])
+
+        with mock.patch.object(sqs.utils, 'tornado_sleep') as sleep:
+            sleep.return_value = tornado_value()
+            yield actor._wait([mock.Mock()], sleep=1)
+
+        intervals = [c[0][0] for c in sleep.call_args_list]
+        self.assertEquals(intervals, [1, 2, 4, 8, 8, 1])
 
     @testing.gen_test
     def test_wait_dry(self):
@@ -207,6 +303,107 @@ class TestWaitUntilQueueEmptyActor(SQSTestCase):
                                     'region': 'us-west-2'},
                                    dry=True)
         queue = mock.Mock()
-        queue.count.side_effect = [1, 2]  # Not zero!
-        yield actor._wait(queue, sleep=0)
-        self.assertEqual(queue.count.call_count, 0)
+        yield actor._wait([queue], sleep=0)
+        self.assertEqual(queue.get_attributes.call_count, 0)
+
+    def test_drain_rate(self):
+        actor = sqs.WaitUntilEmpty('UTA!',
+                                   {'name': 'unit-test-queue',
+                                    'region': 'us-west-2'})
+        self.assertEquals(actor._drain_rate([]), None)
+        self.assertEquals(actor._drain_rate([(10, 5)]), None)
+        self.assertEquals(actor._drain_rate([(10, 5), (10, 4)]), None)
+        self.assertEquals(actor._drain_rate([(10, 50), (15, 40), (20, 30)]),
+                          2.0)
+        self.assertEquals(actor._drain_rate([(10, 30), (20, 40)]), -1.0)
+
+    def test_drain_eta(self):
+        actor = sqs.WaitUntilEmpty('UTA!',
+                                   {'name': 'unit-test-queue',
+                                    'region': 'us-west-2'})
+        self.assertEquals(actor._drain_eta([(10, 5)]), None)
+        self.assertEquals(actor._drain_eta([(10, 50), (20, 30)]), 15.0)
+        self.assertEquals(actor._drain_eta([(10, 30), (20, 30)]),
+                          float('inf'))
+
+        self.assertEquals(actor._format_eta(None), 'unknown')
+        self.assertEquals(actor._format_eta(float('inf')),
+                          'never (not draining)')
+        self.assertEquals(actor._format_eta(15.4), '15s')
+
+    @testing.gen_test
+    def test_wait_stretches_interval_with_eta(self):
+        settings.SQS_WAIT_MAX_SLEEP = 30
+        actor = sqs.WaitUntilEmpty('UTA!',
+                                   {'name': 'unit-test-queue',
+                                    'region': 'us-west-2'})
+        actor._get_message_count = mock.Mock(side_effect=[
+            tornado_value(1000), tornado_value(990), tornado_value(500),
+            tornado_value(0)])
+
+        with mock.patch.object(sqs, 'time') as clock:
+            clock.time.side_effect = [0, 0, 10, 20, 30]
+            with mock.patch.object(sqs.utils, 'tornado_sleep') as sleep:
+                sleep.return_value = tornado_value()
+                yield actor._wait([mock.Mock()], sleep=1)
+
+        # No estimate, then 1msg/s (capped at 30s), then 25msg/s (ETA 20s)
+        intervals = [c[0][0] for c in sleep.call_args_list]
+        self.assertEquals(intervals, [1, 30, 2.0])
+
+    @testing.gen_test
+    def test_wait_fails_fast(self):
+        settings.SQS_DRAIN_WINDOW = 3
+        actor = sqs.WaitUntilEmpty('UTA!',
+                                   {'name': 'unit-test-queue',
+                                    'region': 'us-west-2'},
+                                   timeout=100)
+        actor._get_message_count = mock.Mock(side_effect=[
+            tornado_value(1000), tornado_value(999), tornado_value(998)])
+
+        with mock.patch.object(sqs, 'time') as clock:
+            clock.time.side_effect = [0, 0, 10, 20]
+            with mock.patch.object(sqs.utils, 'tornado_sleep') as sleep:
+                sleep.return_value = tornado_value()
+                with self.assertRaises(sqs.QueueWillNotDrain):
+                    yield actor._wait([mock.Mock()], sleep=1)
+
+        self.assertEquals(sleep.call_count, 2)
+
+    @testing.gen_test
+    def test_wait_without_eta(self):
+        # A single sample (or no time between samples) gives no ETA at all
+        settings.SQS_DRAIN_WINDOW = 1
+        actor = sqs.WaitUntilEmpty('UTA!',
+                                   {'name': 'unit-test-queue',
+                                    'region': 'us-west-2'},
+                                   timeout=100)
+        actor._get_message_count = mock.Mock(side_effect=[
+            tornado_value(10), tornado_value(0)])
+
+        with mock.patch.object(sqs, 'time') as clock:
+            clock.time.side_effect = [0, 0, 10]
+            with mock.patch.object(sqs.utils, 'tornado_sleep') as sleep:
+                sleep.return_value = tornado_value()
+                yield actor._wait([mock.Mock()], sleep=1)
+
+        self.assertEquals(sleep.call_count, 1)
+
+    @testing.gen_test
+    def test_wait_no_timeout_never_fails_fast(self):
+        settings.SQS_DRAIN_WINDOW = 2
+        actor = sqs.WaitUntilEmpty('UTA!',
+                                   {'name': 'unit-test-queue',
+                                    'region': 'us-west-2'},
+                                   timeout=0)
+        actor._get_message_count = mock.Mock(side_effect=[
+            tornado_value(10), tornado_value(10), tornado_value(10),
+            tornado_value(0)])
+
+        with mock.patch.object(sqs, 'time') as clock:
+            clock.time.side_effect = [0, 10, 20, 30]
+            with mock.patch.object(sqs.utils, 'tornado_sleep') as sleep:
+                sleep.return_value = tornado_value()
+                yield actor._wait([mock.Mock()], sleep=1)
+
+        self.assertEquals(sleep.call_count, 3)
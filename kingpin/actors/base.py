@@ -37,6 +37,7 @@ import logging
 import os
 import sys
 import time
+import types
 
 from tornado import gen
 from tornado import httpclient
@@ -44,6 +45,10 @@ from tornado import httputil
 
 from kingpin import utils
 from kingpin.actors import exceptions
+from kingpin.actors.support import checkpoint
+from kingpin.actors.support import http_client
+from kingpin.actors.support import snapshot
+from kingpin.actors.support import tracing
 from kingpin.actors.utils import timer
 from kingpin.constants import REQUIRED, STATE
 
@@ -113,6 +118,11 @@ class BaseActor(object):
     # second 'global runtime context object'.
     strict_init_context = True
 
+    # Options left out of the checksum in the orgchart (see get_orgchart()).
+    # Actors that contain other actors leave out the options describing their
+    # children, because the checkpoint journal hashes the children themselves.
+    checksum_ignores = ()
+
     def __init__(self, desc=None, options={}, dry=False, warn_on_failure=False,
                  condition=True, init_context={}, init_tokens={},
                  timeout=None):
@@ -323,10 +333,13 @@ class BaseActor(object):
         # an alarm if the actor is still executing
         deadline = time.time() + float(self._timeout)
 
-        # Now we yield on the gen_with_timeout function
+        # Now we yield on the gen_with_timeout function. Work that is still
+        # going on when we time out may well time out itself later on (see
+        # api.TaskMonitor.watch()), which is nothing worth logging again.
         try:
             ret = yield gen.with_timeout(
-                deadline, fut, quiet_exceptions=(exceptions.ActorTimedOut))
+                deadline, fut, quiet_exceptions=(exceptions.ActorTimedOut,
+                                                 gen.TimeoutError))
         except gen.TimeoutError:
             msg = ('%s.%s() execution exceeded deadline: %ss' %
                    (self._type, f.__name__, self._timeout))
@@ -445,6 +458,8 @@ class BaseActor(object):
           class: kingpin class name
           desc: actor description
           parent_id: organizational relationship. Same as `id` above.
+          checksum: hash of the class and options (used by the checkpoint
+                    journal)
         """
 
         return [{
@@ -453,6 +468,9 @@ class BaseActor(object):
             'class': self.__class__.__name__,
             # 'options': self._options,  # May include tokens & ENV vars
             'parent_id': parent,
+            'checksum': checkpoint.checksum(self._type, dict(
+                (k, v) for k, v in self._options.items()
+                if k not in self.checksum_ignores)),
         }]
 
     @gen.coroutine
@@ -487,6 +505,10 @@ class BaseActor(object):
                              self._condition)
             raise gen.Return()
 
+        if checkpoint.is_completed(self):
+            self.log.info('Skipping execution. Completed by a previous run.')
+            raise gen.Return()
+
         try:
             result = yield self.timeout(self._execute)
         except exceptions.ActorException as e:
@@ -516,6 +538,8 @@ class BaseActor(object):
             raise exceptions.ActorException(e)
         else:
             self.log.debug('Finished successfully, return value: %s' % result)
+            if not self._dry:
+                checkpoint.record(self)
 
         # If we got here, we're exiting the actor cleanly and moving on.
         raise gen.Return(result)
@@ -557,6 +581,13 @@ class EnsurableBaseActor(BaseActor):
                                method if you're not doing a pure string
                                comparison between the source and destination.
 
+    **Order of Operations**
+
+    The resource `state` is ensured first. Then the rest of the options are
+    compared all at once, and the setters of the ones that do not match are
+    called one by one. Options that have to be set before others are even
+    compared can be listed in `ensure_order`.
+
     **Examples**
 
     .. code-block:: python
@@ -597,6 +628,17 @@ class EnsurableBaseActor(BaseActor):
     # have parameters that are unmutable ('name').
     unmanaged_options = []
 
+    # A list of lists of option names, ensured group by group: the options in
+    # a group are compared concurrently, and then the setters of the ones
+    # that do not match are called in the listed order -- before the next
+    # group is compared. Any options not listed here make up the last group.
+    # For example: [['versioning'], ['lifecycle']]
+    ensure_order = []
+
+    # Getter results of the current execution. See _memoized().
+    _getter_memo = None
+    _getter_memo_hits = 0
+
     def __init__(self, *args, **kwargs):
         # The 'state' parameter is a given, so make sure its set,
         self.all_options['state'] = (
@@ -645,6 +687,14 @@ class EnsurableBaseActor(BaseActor):
                 setattr(self, comparer, _comparer)
                 # self.log.debug('Creating dynamic method %s' % comparer)
 
+            # Comparers and setters call the getters directly, too. If we
+            # have been here before, start over from the unmemoized getter.
+            method = getattr(self, getter)
+            method = getattr(method, '_memo_of', method)
+            if snapshot.is_enabled():
+                method = snapshot.read_through(self, getter, method)
+            setattr(self, getter, self._memoized(getter, method))
+
             self.setters[option] = getattr(self, setter)
             self.getters[option] = getattr(self, getter)
             self.comparers[option] = getattr(self, comparer)
@@ -652,6 +702,44 @@ class EnsurableBaseActor(BaseActor):
     def _is_method(self, name):
         return hasattr(self, name) and inspect.ismethod(getattr(self, name))
 
+    def _memoized(self, name, getter):
+        """Wraps a getter so it is called at most once between setters.
+
+        Custom comparers often call the getter that the default comparer
+        would have called anyway, so without this the same remote state is
+        fetched several times per execution. While `self._getter_memo` is a
+        dict (see `_execute()`), the future returned by the first call of the
+        getter is handed out to every later call. Setters pause and clear the
+        memo (see `_set()`), failed calls are forgotten.
+
+        Returns:
+            A method bound to this actor (or `getter`, if already wrapped).
+        """
+        if getattr(getter, '_memo_of', None):
+            return getter
+
+        def memoized(self, *args, **kwargs):
+            memo = self._getter_memo
+            if memo is None or args or kwargs:
+                return getter(*args, **kwargs)
+
+            if name in memo:
+                self._getter_memo_hits += 1
+                return memo[name]
+
+            future = gen.maybe_future(getter())
+            memo[name] = future
+
+            def forget_failure(future):
+                if future.exception() and memo.get(name) is future:
+                    del memo[name]
+            future.add_done_callback(forget_failure)
+            return future
+
+        memoized.__name__ = name
+        memoized._memo_of = getter
+        return types.MethodType(memoized, self)
+
     @gen.coroutine
     def _precache(self):
         """Override this method to pre-cache data in your actor.
@@ -671,6 +759,30 @@ class EnsurableBaseActor(BaseActor):
     def _set_state(self):
         raise NotImplementedError('_set_state is required for Ensurable')
 
+    @gen.coroutine
+    def _compare(self, option):
+        with tracing.span('_compare_%s' % option, cat='actor', actor=self):
+            equals = yield self.comparers[option]()
+
+        if equals:
+            self.log.debug('Option "%s" matches' % option)
+        raise gen.Return(equals)
+
+    @gen.coroutine
+    def _set(self, option):
+        self.log.debug('Option "%s" DOES NOT match, calling setter' % option)
+        snapshot.mutated(self)
+
+        # Whatever the getters returned so far may be out of date now
+        memo = self._getter_memo
+        self._getter_memo = None
+        try:
+            with tracing.span('_set_%s' % option, cat='actor', actor=self):
+                yield self.setters[option]()
+        finally:
+            if memo is not None:
+                self._getter_memo = {}
+
     @gen.coroutine
     def _ensure(self, option):
         """Compares the desired state with the actual state of a resource.
@@ -682,34 +794,70 @@ class EnsurableBaseActor(BaseActor):
 
         If the states do not match, then the setter method is called.
         """
-        equals = yield self.comparers[option]()
+        yield self._ensure_group([option])
 
-        if equals:
-            self.log.debug('Option "%s" matches' % option)
-            raise gen.Return()
+    @gen.coroutine
+    def _ensure_group(self, options):
+        """Ensures a group of options that do not depend on each other.
 
-        self.log.debug('Option "%s" DOES NOT match, calling setter' % option)
-        yield self.setters[option]()
+        All of the options are compared concurrently, and then the setters of
+        the options that do not match are called in order.
+        """
+        matches = yield [self._compare(option) for option in options]
+
+        for option, equals in zip(options, matches):
+            if not equals:
+                yield self._set(option)
+
+    def _ensure_groups(self):
+        """Returns the ensurable options (except state) in groups.
+
+        See `ensure_order`.
+        """
+        listed = set()
+        groups = []
+        for group in self.ensure_order:
+            group = [o for o in group if o in self._ensurable_options]
+            listed.update(group)
+            if group:
+                groups.append(group)
+
+        rest = [o for o in self._ensurable_options
+                if o != 'state' and o not in listed]
+        if rest:
+            groups.append(rest)
+        return groups
 
     @gen.coroutine
     def _execute(self):
         """A pretty simple execution pipeline for the actor.
 
-        Note: An OrderedDict can be used instead of a plain dict when order
-        actually matters for the option setting.
+        Note: The setters are called in the order of `all_options`, so an
+        OrderedDict can be used instead of a plain dict when order actually
+        matters for the option setting. If an option should not even be
+        compared before another one is set, use `ensure_order`.
         """
-        yield self._precache()
+        with tracing.span('_precache', cat='actor', actor=self):
+            yield self._precache()
+
+        self._getter_memo = {}
+        self._getter_memo_hits = 0
+        try:
+            yield self._ensure_all()
+        finally:
+            self._getter_memo = None
+            self.log.debug('%s getter calls answered from memory' %
+                           self._getter_memo_hits)
 
+    @gen.coroutine
+    def _ensure_all(self):
         yield self._ensure('state')
 
         if self.option('state') == 'absent':
             raise gen.Return()
 
-        for option in self._ensurable_options:
-            # We've already managed state .. so make sure we skip the state
-            # option and only manage the others.
-            if option != 'state':
-                yield self._ensure(option)
+        for group in self._ensure_groups():
+            yield self._ensure_group(group)
 
 
 class HTTPBaseActor(BaseActor):
@@ -729,9 +877,10 @@ class HTTPBaseActor(BaseActor):
     def _get_http_client(self):
         """Returns an asynchronous web client object
 
-        The object is actually of type SimpleAsyncHTTPClient
+        The client is shared by all actors (and connection-pooled when
+        possible), see :py:mod:`kingpin.actors.support.http_client`.
         """
-        return httpclient.AsyncHTTPClient()
+        return http_client.get_client()
 
     def _get_method(self, post):
         """Returns the appropriate HTTP Method based on the supplied Post data.
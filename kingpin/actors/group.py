@@ -23,7 +23,7 @@ or asynchronous stages.
 import logging
 
 from tornado import gen
-import demjson
+from tornado import locks
 
 from kingpin import utils as kp_utils
 from kingpin.actors import base
@@ -36,6 +36,13 @@ log = logging.getLogger(__name__)
 __author__ = 'Matt Wise <matt@nextdoor.com>'
 
 
+# Number of acts a group.Sync may rehearse at once in a dry run. Dry runs
+# make no changes, so the acts do not have to wait for each other -- but the
+# default of 1 keeps their log output in order. Set by deploy.py
+# --rehearsal-concurrency.
+DRY_CONCURRENCY = 1
+
+
 class BaseGroupActor(base.BaseActor):
 
     """Group together a series of other `kingpin.actors.base.BaseActor` objects
@@ -61,6 +68,9 @@ class BaseGroupActor(base.BaseActor):
     # the moment that this actor is instantiated.
     strict_init_context = False
 
+    # The acts are hashed as our children (and carry the init tokens)
+    checksum_ignores = ('acts',)
+
     def __init__(self, *args, **kwargs):
         """Initializes all of the sub actors.
 
@@ -137,6 +147,7 @@ class BaseGroupActor(base.BaseActor):
                 string=context_string,
                 tokens=contexts.get('tokens', {}),
                 strict=True)
+            import demjson
             context_data = demjson.decode(context_string)
         # END DEPRECATION
 
@@ -312,6 +323,10 @@ class Sync(BaseGroupActor):
     This provides the user with an insight to all the errors that are possible
     to encounter, rather than abort and quit on the first one.
 
+    Since dry runs make no changes, ``deploy.py --rehearsal-concurrency N``
+    lets every Sync group dry run up to N of its acts at once. The errors are
+    still reported in the order of the acts.
+
     **Failure**
 
     In the event that an act fails, this actor will return the failure
@@ -333,6 +348,10 @@ class Sync(BaseGroupActor):
             In real run - the first of the exceptions.
         """
 
+        if self._dry and DRY_CONCURRENCY > 1:
+            yield self._rehearse_actions(DRY_CONCURRENCY)
+            raise gen.Return()
+
         errors = []
 
         for act in self._actions:
@@ -349,6 +368,46 @@ class Sync(BaseGroupActor):
                                    '"%s" failed' % act._desc)
                     raise
 
+        self._raise_errors(errors)
+
+    @gen.coroutine
+    def _rehearse_actions(self, concurrency):
+        """Dry runs up to `concurrency` of the actors at once.
+
+        Just like a serial dry run, every act is executed, and the errors are
+        reported (in the order of the acts) once all of them have finished.
+
+        Args:
+            concurrency: Max number of acts to execute at once.
+
+        raises:
+            The worst of all the raised errors.
+        """
+        semaphore = locks.Semaphore(concurrency)
+
+        @gen.coroutine
+        def rehearse(act):
+            with (yield semaphore.acquire()):
+                self.log.debug('Beginning "%s"..' % act._desc)
+                try:
+                    yield act.execute()
+                except exceptions.ActorException as e:
+                    raise gen.Return(e)
+
+        results = yield [rehearse(act) for act in self._actions]
+
+        errors = []
+        for act, e in zip(self._actions, results):
+            if e is None:
+                continue
+            self.log.error('%s failed: %s' % (act._desc, str(e)))
+            errors.append(e)
+        if errors:
+            self.log.warning('Continuing since this is a dry run.')
+
+        self._raise_errors(errors)
+
+    def _raise_errors(self, errors):
         if errors:
             ExcType = self._get_exc_type(errors)
             raise ExcType('Exceptions raised by %s of %s actors in "%s".' % (
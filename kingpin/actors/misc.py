@@ -146,6 +146,10 @@ class Macro(base.BaseActor):
 
     desc = "Macro: {macro}"
 
+    # Usually the whole environment. Tokens that matter end up in the options
+    # of the actors in the macro, which are hashed as our children.
+    checksum_ignores = ('tokens',)
+
     def __init__(self, *args, **kwargs):
         """Pre-parse the script file and compile actors.
 
@@ -52,6 +52,11 @@ USER = os.getenv('PINGDOM_USER', None)
 PASS = os.getenv('PINGDOM_PASS', None)
 TOKEN = os.getenv('PINGDOM_TOKEN', None)
 
+# Every Pingdom actor looks its check up in the full list of checks. This
+# cache is shared by all of them (in both the dry and the real run) so that the
+# list is only downloaded once in a while, rather than once per actor.
+RESPONSE_CACHE = api.ResponseCache(ttl=60)
+
 
 class PingdomAPI(api.RestConsumer):
 
@@ -95,7 +100,8 @@ class PingdomBase(base.BaseActor):
         super(PingdomBase, self).__init__(*args, **kwargs)
 
         rest_client = PingdomClient(
-            headers={'App-Key': TOKEN}
+            headers={'App-Key': TOKEN},
+            cache=RESPONSE_CACHE
         )
         self._pingdom_client = PingdomAPI(client=rest_client)
 
@@ -474,6 +474,11 @@ class AlertSpecBase(base.EnsurableRightScaleBaseActor):
         super(AlertSpecBase, self).__init__(*args, **kwargs)
         self.changed = False
 
+        # Optionally handed to us by a parent actor that has already listed
+        # every AlertSpec on our `href` -- a dict of spec names to the list
+        # of matching AlertSpec resources. See AlertSpecsBase._precache().
+        self.known_specs = None
+
     @gen.coroutine
     def _precache(self):
         name = self.option('spec').get('name')
@@ -486,6 +491,15 @@ class AlertSpecBase(base.EnsurableRightScaleBaseActor):
         self.desired_params = self._generate_rightscale_params(
             'alert_spec', desired_spec)
 
+        # If our parent already fetched the AlertSpecs for this href, there
+        # is no need to go back to the API for our own.
+        if self.known_specs is not None:
+            found = self.known_specs.get(name)
+            self.existing_spec = found[0] if found else None
+            log.debug('Got AlertSpec from parent listing: %s' %
+                      self.existing_spec)
+            raise gen.Return()
+
         # Search for the existing spec. Even though we do an 'exact' search
         # here, this is kind of misleading. We are searching on multiple keys
         # (name, subject_href) and the find_by_name_and_keys() code isn't smart
@@ -665,11 +679,6 @@ class AlertSpecsBase(base.EnsurableRightScaleBaseActor):
                     'spec': spec
                 },
                 dry=self._dry)
-
-            # Replace the new child actors RightScale client with our own --
-            # this way we only have to log in once rather than
-            # once-per-alert-spec.
-            a._client = self._client
             self.alert_actors.append(a)
 
     @gen.coroutine
@@ -681,6 +690,13 @@ class AlertSpecsBase(base.EnsurableRightScaleBaseActor):
         if not isinstance(all_resource_specs, list):
             all_resource_specs = [all_resource_specs]
 
+        # Index the listing by name so that the AlertSpecBase actors below
+        # can look themselves up in it, rather than each of them making its
+        # own API call.
+        known_specs = {}
+        for spec in all_resource_specs:
+            known_specs.setdefault(spec.soul['name'], []).append(spec)
+
         # Now quickly compare this list to the list of desired specs. For each
         # one thats found that doesn't match, create a new AlertSpecBase actor
         # that will purge this AlertSpec.
@@ -717,9 +733,10 @@ class AlertSpecsBase(base.EnsurableRightScaleBaseActor):
         # the defined alert specs.
         tasks = []
         for actor in self.alert_actors:
-            # Do all the heavy lifting by throwing these _precache() calls onto
-            # a task list and then yield the whole list at once. This makes the
-            # rest of the get/set comparison calls super fast.
+            # The _precache() calls are purely local now that they have been
+            # handed the listing above. This makes the rest of the get/set
+            # comparison calls super fast.
+            actor.known_specs = known_specs
             tasks.append(actor._precache())
         yield tasks
 
@@ -47,21 +47,35 @@ translation.
 """
 
 from datetime import datetime
+from datetime import timedelta
 from os import path
+import copy
 import functools
+import heapq
+import itertools
 import logging
+import random
+import sys
+import threading
+import time
+import weakref
 
 from retrying import retry as sync_retry
 from rightscale import util as rightscale_util
 from tornado import concurrent
 from tornado import gen
 from tornado import ioloop
+from tornado import locks
 import requests
+import requests.adapters
 import rightscale
+import rightscale.httpclient
+import rightscale.rightscale
 import simplejson
 
 from kingpin import utils
 from kingpin.actors.rightscale import settings
+from kingpin.actors.support import summary
 
 log = logging.getLogger(__name__)
 
@@ -77,7 +91,14 @@ DEFAULT_ENDPOINT = 'https://my.rightscale.com'
 # decorator. We would like this to be a class variable so its shared
 # across RightScale objects, but we see testing IO errors when we
 # do this.
-EXECUTOR = concurrent.futures.ThreadPoolExecutor(10)
+EXECUTOR_THREADS = 10
+EXECUTOR = summary.TimedExecutor(EXECUTOR_THREADS, 'rightscale')
+
+# (token, endpoint) -> rightscale.RightScale client. Every RightScale object
+# created for the same account shares one client, and therefore one OAuth
+# access token and one pool of HTTP connections. See get_session().
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
 
 
 class RightScaleError(Exception):
@@ -106,6 +127,730 @@ class ServerArrayException(Exception):
     """Raised when an operation on or looking for a ServerArray fails"""
 
 
+class PartialExecutionFailure(ServerArrayException):
+
+    """Raised when a script could only be queued on some of the instances.
+
+    Args:
+        message: The exception message.
+        tasks: List of (instance, task) tuples that *were* queued.
+        failures: List of (instance, exception) tuples that were not.
+    """
+
+    def __init__(self, message, tasks, failures):
+        super(PartialExecutionFailure, self).__init__(message)
+        self.tasks = tasks
+        self.failures = failures
+
+
+class SharedHTTPClient(rightscale.httpclient.HTTPClient):
+
+    """Thread-safe python-rightscale HTTPClient that is shared between actors.
+
+    The stock HTTPClient logs in lazily from whichever thread happens to
+    notice that the access token has expired, so a burst of threads hitting
+    an expired token will all log in at once. It also disables HTTP
+    keepalives, so every single API call opens a brand new TLS connection.
+
+    This client only lets one thread refresh the access token at a time, and
+    starts refreshing it `settings.TOKEN_REFRESH_WINDOW` seconds before it
+    actually expires. Until it really expires, other threads carry on with
+    the current token rather than waiting on the login.
+
+    Connections are kept alive, but never shared between threads: every
+    thread gets its own `requests` session (and connection), like
+    python-rightscale's stock client gets its own session per client. The
+    sessions all share one set of headers, so the access token only has to be
+    set once.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._local = threading.local()
+        self._login_lock = threading.Lock()
+        super(SharedHTTPClient, self).__init__(*args, **kwargs)
+
+    @property
+    def s(self):
+        """The `requests` session of the current thread."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._new_session()
+        return session
+
+    @s.setter
+    def s(self, session):
+        # HTTPClient.__init__() sets up a single session. Only its headers are
+        # kept, less the 'Connection: close' that turns keepalives off.
+        self._headers = session.headers
+        self._headers.pop('Connection', None)
+
+    def _new_session(self):
+        session = requests.session()
+        session.headers = self._headers
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=1)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _token_is_fresh(self):
+        return (time.time() <
+                self.auth_expires_at - settings.TOKEN_REFRESH_WINDOW)
+
+    def ensure_token(self):
+        """Logs in if the access token is missing or about to expire."""
+        if self._token_is_fresh():
+            return
+
+        # Only block if the current token is entirely unusable. Otherwise, if
+        # another thread is already refreshing it, just keep using it.
+        blocking = time.time() >= self.auth_expires_at
+        if not self._login_lock.acquire(blocking):
+            return
+
+        try:
+            # Another thread may have logged in while we waited on the lock
+            if not self._token_is_fresh():
+                self.login()
+        finally:
+            self._login_lock.release()
+
+    def request(self, method, path='/', url=None, ignore_codes=[], **kwargs):
+        self.ensure_token()
+
+        start = time.time()
+        try:
+            ret = self._request(method, path, url, ignore_codes, **kwargs)
+        except Exception:
+            summary.record_call('rightscale', time.time() - start, error=True)
+            raise
+        summary.record_call('rightscale', time.time() - start)
+        return ret
+
+
+def get_session(token, endpoint=DEFAULT_ENDPOINT):
+    """Returns the shared rightscale.RightScale client for an account.
+
+    Clients are created once per (token, endpoint) pair and then handed out
+    to every caller, so that a deployment with hundreds of RightScale actors
+    logs in once rather than once per actor.
+
+    Args:
+        token: A RightScale RefreshToken
+        endpoint: API URL Endpoint
+
+    Returns:
+        rightscale.RightScale object
+    """
+    key = (token, endpoint)
+    with SESSIONS_LOCK:
+        if key not in SESSIONS:
+            client = rightscale.RightScale(refresh_token=token,
+                                           api_endpoint=endpoint)
+
+            # python-rightscale falls back to the ~/.rightscalerc credentials
+            # when no token (or endpoint) is given, so take the ones it chose.
+            client.client = SharedHTTPClient(
+                client.api_endpoint, {'X-API-Version': '1.5'},
+                rightscale.rightscale.OAUTH2_RES_PATH,
+                client.client.refresh_token)
+            SESSIONS[key] = client
+            log.debug('Created new RightScale session (endpoint=%s)' %
+                      endpoint)
+        return SESSIONS[key]
+
+
+def reset_sessions():
+    """Forgets all of the shared RightScale sessions (and lookup caches)."""
+    with SESSIONS_LOCK:
+        SESSIONS.clear()
+        LOOKUP_CACHES.clear()
+        TAG_BATCHERS.clear()
+
+
+class LookupCache(object):
+
+    """Run-scoped memo of RightScale find_*() lookups.
+
+    Entries are keyed by the lookup and the collection (path) it searched.
+    The first caller for a key triggers the real API call, and anybody else
+    asking for the same key while it is in flight gets the same Future.
+
+    Only successful, non-empty results are kept. A lookup that finds nothing
+    is very likely to be repeated after something (say, a Clone actor)
+    creates the resource, so it is always retried.
+
+    Every caller gets its own copy of the result (of the list, and of the
+    resources in it), so that one actor changing a resource it looked up
+    can't change what the other actors see.
+    """
+
+    def __init__(self):
+        self._futures = {}
+
+    def __len__(self):
+        return len(self._futures)
+
+    def get(self, key, fetch):
+        """Returns the cached Future for `key`, or the Future from fetch().
+
+        Args:
+            key: Tuple whose first element is the collection path.
+            fetch: Function that returns a Future with the lookup result.
+        """
+        future = self._futures.get(key)
+        if future is not None:
+            log.debug('Lookup cache hit: %s' % (key,))
+            return self._copy(future)
+
+        future = fetch()
+        self._futures[key] = future
+
+        def discard(f):
+            if f.exception() is None and f.result():
+                return
+            if self._futures.get(key) is f:
+                del self._futures[key]
+
+        future.add_done_callback(discard)
+        return self._copy(future)
+
+    @staticmethod
+    def _copy(future):
+        """Returns a Future that resolves to a copy of `future`'s result."""
+        copied = concurrent.Future()
+
+        def done(f):
+            if f.exception() is not None:
+                copied.set_exc_info(f.exc_info())
+            else:
+                copied.set_result(_copy_result(f.result()))
+
+        future.add_done_callback(done)
+        return copied
+
+    def invalidate(self, path=None):
+        """Drops every lookup of (or under) a collection path.
+
+        Nested collections are aliases of the top-level ones (an AlertSpec
+        changed through `/api/server_templates/1/alert_specs/2` shows up in
+        `/api/alert_specs` too), so those are dropped as well.
+
+        Args:
+            path: Collection path (eg. `/api/server_arrays`), or resource href
+                  (eg. `/api/server_arrays/1`). If this isn't a string, the
+                  whole cache is dropped.
+        """
+        if not isinstance(path, basestring):
+            self._futures.clear()
+            return
+
+        segments = path.split('/')
+        for key in self._futures.keys():
+            collection = key[0]
+            if not isinstance(collection, basestring):
+                del self._futures[key]
+            elif path == collection or path.startswith(collection + '/'):
+                del self._futures[key]
+            elif collection.split('/')[-1] in segments:
+                del self._futures[key]
+
+
+# (token, endpoint) -> LookupCache shared by every RightScale object that
+# uses the same session.
+LOOKUP_CACHES = {}
+
+
+def get_lookup_cache(token, endpoint=DEFAULT_ENDPOINT):
+    """Returns the shared LookupCache for an account."""
+    with SESSIONS_LOCK:
+        return LOOKUP_CACHES.setdefault((token, endpoint), LookupCache())
+
+
+class TagBatcher(object):
+
+    """Batches RightScale tag reads and writes into multi-resource calls.
+
+    The RightScale tags API (by_resource, multi_add and multi_delete) takes
+    a list of resource hrefs, but each actor tags its own resources one at a
+    time. Every request made through this object is held for
+    `settings.TAG_BATCH_WINDOW` seconds, and then all of the requests that
+    came in during that window (from any actor) are sent together:
+
+      * All reads become by_resource calls.
+      * Writes of the same tags become one multi_add (or multi_delete) call.
+
+    Requests are never re-ordered across kinds -- a run of reads is sent
+    before a later run of writes, and so on -- so the batching is invisible to
+    the callers.
+
+    Args:
+        window: Seconds to collect requests for before sending them.
+        size: Maximum number of resources per API call.
+    """
+
+    executor = EXECUTOR
+
+    def __init__(self,
+                 window=settings.TAG_BATCH_WINDOW,
+                 size=settings.TAG_BATCH_SIZE):
+        self._window = window
+        self._size = size
+        self._pending = []
+        self._scheduled = False
+
+    def get(self, client, href):
+        """Returns a Future with the list of tags on a resource.
+
+        Args:
+            client: rightscale.RightScale object to make the call with.
+            href: Href of the resource.
+        """
+        return self._queue('by_resource', client, href, ())
+
+    def add(self, client, href, tags):
+        """Returns a Future that resolves once tags are added to a resource.
+
+        Args:
+            client: rightscale.RightScale object to make the call with.
+            href: Href of the resource.
+            tags: List of tags to add.
+        """
+        return self._queue('multi_add', client, href, tuple(sorted(tags)))
+
+    def delete(self, client, href, tags):
+        """Returns a Future that resolves once tags are removed from a resource.
+
+        Args:
+            client: rightscale.RightScale object to make the call with.
+            href: Href of the resource.
+            tags: List of tags to delete.
+        """
+        return self._queue('multi_delete', client, href, tuple(sorted(tags)))
+
+    def _queue(self, kind, client, href, tags):
+        future = concurrent.Future()
+        self._pending.append((kind, client, href, tags, future))
+
+        if not self._scheduled:
+            self._scheduled = True
+            ioloop.IOLoop.current().call_later(self._window, self._flush)
+
+        return future
+
+    def _batches(self, pending):
+        """Splits requests into ordered phases of concurrent batches.
+
+        Consecutive requests of the same kind form a phase. Within a phase,
+        requests for the same client and tags are grouped into batches of up
+        to `size` distinct resources.
+
+        Returns:
+            A list of phases. Each phase is a list of batches, and each batch
+            is a list of requests.
+        """
+        phases = []
+        for request in pending:
+            kind, client, href, tags, _ = request
+            if not phases or phases[-1][0] != kind:
+                phases.append((kind, []))
+
+            batches = phases[-1][1]
+            for batch in batches:
+                first = batch[0]
+                if first[1] is not client or first[3] != tags:
+                    continue
+                hrefs = set(r[2] for r in batch)
+                if href in hrefs or len(hrefs) < self._size:
+                    batch.append(request)
+                    break
+            else:
+                batches.append([request])
+
+        return [phase[1] for phase in phases]
+
+    @gen.coroutine
+    def _flush(self):
+        pending = self._pending
+        self._pending = []
+        self._scheduled = False
+
+        # This runs from IOLoop.call_later, where nobody would see an error,
+        # so they are handed to the callers instead.
+        log.debug('Sending %s batched tag requests' % len(pending))
+        try:
+            for batches in self._batches(pending):
+                yield [self._send(batch) for batch in batches]
+        except Exception:
+            exc_info = sys.exc_info()
+            log.error('Batched tag requests failed: %s' % exc_info[1])
+            for request in pending:
+                if not request[4].done():
+                    request[4].set_exc_info(exc_info)
+
+    @gen.coroutine
+    def _send(self, batch):
+        kind, client, _, tags, _ = batch[0]
+
+        hrefs = []
+        for _, _, href, _, _ in batch:
+            if href not in hrefs:
+                hrefs.append(href)
+
+        try:
+            ret = yield self._call(client, kind, hrefs, tags)
+        except Exception:
+            exc_info = sys.exc_info()
+            for request in batch:
+                request[4].set_exc_info(exc_info)
+            return
+
+        if kind == 'by_resource':
+            ret = self._tags_by_href(hrefs, ret)
+            for _, _, href, _, future in batch:
+                future.set_result(ret.get(href, []))
+        else:
+            for request in batch:
+                request[4].set_result(ret)
+
+    @staticmethod
+    def _tags_by_href(hrefs, raw):
+        """Maps the results of a by_resource call back to resource hrefs."""
+        if len(hrefs) == 1 and raw:
+            return {hrefs[0]: [tag['name'] for tag in raw[0].soul['tags']]}
+
+        found = {}
+        for res in raw:
+            tags = [tag['name'] for tag in res.soul['tags']]
+            for link in res.soul['links']:
+                if link['rel'] == 'resource':
+                    found[link['href']] = tags
+        return found
+
+    @concurrent.run_on_executor
+    @sync_retry(**settings.RETRYING_SETTINGS)
+    @rightscale_error_logger
+    @utils.exception_logger
+    def _call(self, client, kind, hrefs, tags):
+        params = [('resource_hrefs[]', href) for href in hrefs]
+        params.extend(('tags[]', tag) for tag in tags)
+        return getattr(client.tags, kind)(params=params)
+
+
+# (token, endpoint) -> TagBatcher shared by every RightScale object that uses
+# the same session.
+TAG_BATCHERS = {}
+
+
+def get_tag_batcher(token, endpoint=DEFAULT_ENDPOINT):
+    """Returns the shared TagBatcher for an account."""
+    with SESSIONS_LOCK:
+        return TAG_BATCHERS.setdefault((token, endpoint), TagBatcher())
+
+
+def _path(resource):
+    """Returns the collection path or href of a rightscale resource."""
+    return getattr(resource, 'path', None) or getattr(resource, 'href', None)
+
+
+def _collection_path(name):
+    """Returns the path of a named top-level rightscale collection.
+
+    Note: Looking the collection up on the rightscale.RightScale object itself
+    can make a (blocking) API call, so we build the path by hand.
+    """
+    return '%s/%s' % (rightscale.rightscale.DEFAULT_API_PREPATH, name)
+
+
+def _copy_result(value):
+    """Copies a lookup result: lists, and the souls of the resources.
+
+    The resources keep sharing their (thread-safe) HTTP client.
+    """
+    if isinstance(value, list):
+        copied = copy.copy(value)
+        copied[:] = [_copy_result(item) for item in value]
+        return copied
+    if isinstance(value, rightscale.rightscale.Resource):
+        copied = copy.copy(value)
+        copied.soul = copy.deepcopy(value.soul)
+        copied._links = None
+        return copied
+    return value
+
+
+def _lookup_key(value):
+    """Returns the part of a LookupCache key for a lookup argument.
+
+    python-rightscale builds a new collection object every time one is
+    accessed (`client.clouds`), and those hash by identity -- so resources
+    and collections are keyed by their path instead.
+    """
+    if isinstance(value, basestring):
+        return value
+    return _path(value) or value
+
+
+def cached_lookup(collection=None):
+    """Memoizes a RightScale.find_*() method in the shared LookupCache.
+
+    Args:
+        collection: Name of the rightscale.RightScale collection the method
+                    searches. If None, the collection is the `collection`
+                    argument of the method.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if collection:
+                path = _collection_path(collection)
+            elif 'collection' in kwargs:
+                path = _path(kwargs['collection'])
+            else:
+                path = _path(args[0])
+
+            key = ((path, func.__name__) +
+                   tuple(_lookup_key(arg) for arg in args) +
+                   tuple(sorted((name, _lookup_key(value))
+                                for name, value in kwargs.items())))
+            return self._cache.get(
+                key, lambda: func(self, *args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def invalidates_lookups(path_of):
+    """Drops the cached lookups affected by a mutating RightScale method.
+
+    Args:
+        path_of: Function that takes the method arguments and returns the
+                 collection path (or resource href) being modified, None if
+                 the whole cache has to be dropped, or False if the call
+                 doesn't modify anything.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            path = path_of(self, *args, **kwargs)
+            if path is False:
+                return func(self, *args, **kwargs)
+
+            self._cache.invalidate(path)
+            future = func(self, *args, **kwargs)
+            # Also drop anything looked up while the change was in flight
+            future.add_done_callback(lambda f: self._cache.invalidate(path))
+            return future
+        return wrapper
+    return decorator
+
+
+class TaskMonitor(object):
+
+    """Polls the status of many RightScale tasks from a single loop.
+
+    Waiting on a task used to mean one polling coroutine per task, all
+    competing for the same small executor. With hundreds of tasks in flight,
+    whichever coroutines won the race got polled over and over while the
+    rest waited -- stretching the effective poll interval to minutes.
+
+    Instead, every task is put into one schedule ordered by when it is next
+    due. The monitor wakes up when the earliest task is due and starts its
+    status check, with at most `batch` checks in flight at once. Each check
+    reschedules its own task when it finishes, so one slow (or retrying)
+    check never holds up the checks of other tasks. Tasks that run longer
+    than expected back off, and every interval is jittered so that tasks
+    started together drift apart.
+
+    Tasks are watched until they finish, until their `timeout` runs out, or
+    until the caller stops waiting with `unwatch()`.
+
+    Args:
+        batch: Maximum number of status requests in flight at once.
+        backoff: Interval multiplier for tasks running longer than expected.
+        max_interval: Maximum number of seconds between two polls of a task.
+        jitter: Fraction by which each interval is randomly adjusted.
+    """
+
+    def __init__(self,
+                 batch=settings.TASK_POLL_BATCH,
+                 backoff=settings.TASK_POLL_BACKOFF,
+                 max_interval=settings.TASK_POLL_MAX_INTERVAL,
+                 jitter=settings.TASK_POLL_JITTER):
+        self._slots = locks.Semaphore(batch)
+        self._backoff = backoff
+        self._max_interval = max_interval
+        self._jitter = jitter
+
+        # Heap of (due time, sequence, entry) tuples
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._wakeup = locks.Event()
+        self._running = False
+
+    def __len__(self):
+        return len(self._schedule)
+
+    def watch(self, task, fetch, interval=5, expected=None, loc_log=log,
+              check=None, timeout=None):
+        """Starts monitoring a task.
+
+        The first status check is made right away.
+
+        Anything that has to be polled until it reaches some state can be
+        watched, not just RightScale Tasks -- see `check`.
+
+        Args:
+            task: RightScale Task resource object.
+            fetch: Function that returns a Future with the task status
+                   resource (e.g. RightScale._get_task_info).
+            interval: Seconds between status checks.
+            expected: Seconds after which the task starts to back off.
+                      (default: `interval`)
+            loc_log: logging.getLogger() object to log the task status with.
+            check: Optional function that takes the result of `fetch` and
+                   returns True (succeeded), False (failed) or None (keep
+                   polling). By default, the summary of a RightScale Task
+                   status resource is checked.
+            timeout: Optional number of seconds after which the task is no
+                     longer polled, and the returned Future raises a
+                     gen.TimeoutError.
+
+        Returns:
+            A Future that resolves to a (success, status resource) tuple once
+            the task has succeeded or failed.
+        """
+        now = time.time()
+        entry = {
+            'task': task,
+            'fetch': fetch,
+            'check': check or (lambda output: self._task_status(output,
+                                                                loc_log)),
+            'interval': interval,
+            'expected': interval if expected is None else expected,
+            'started': now,
+            'deadline': now + float(timeout) if timeout else None,
+            'future': concurrent.Future(),
+        }
+        self._push(entry, delay=0)
+        return entry['future']
+
+    def unwatch(self, future):
+        """Stops polling the task behind a Future returned by `watch()`.
+
+        The Future raises a gen.TimeoutError, and the task is dropped from
+        the schedule the next time it comes up.
+        """
+        if not future.done():
+            future.set_exception(gen.TimeoutError('No longer watched'))
+
+    def _push(self, entry, delay):
+        heapq.heappush(
+            self._schedule,
+            (time.time() + delay, next(self._sequence), entry))
+        self._wakeup.set()
+
+        if not self._running:
+            self._run()
+
+    def _next_delay(self, entry):
+        """Returns the (jittered) delay until the next poll of a task."""
+        if time.time() - entry['started'] > entry['expected']:
+            entry['interval'] = min(entry['interval'] * self._backoff,
+                                    self._max_interval)
+
+        jitter = random.uniform(-self._jitter, self._jitter)
+        delay = entry['interval'] * (1 + jitter)
+
+        # Make the last check right when the task times out
+        if entry['deadline'] is not None:
+            delay = min(delay, max(entry['deadline'] - time.time(), 0))
+        return delay
+
+    @gen.coroutine
+    def _run(self):
+        self._running = True
+        try:
+            while self._schedule:
+                wait = self._schedule[0][0] - time.time()
+                if wait > 0:
+                    yield self._sleep(wait)
+                    continue
+
+                entry = heapq.heappop(self._schedule)[2]
+                if entry['future'].done():
+                    # Nobody is waiting on this task anymore
+                    continue
+
+                yield self._slots.acquire()
+                self._poll(entry)
+        finally:
+            self._running = False
+
+    @gen.coroutine
+    def _sleep(self, seconds):
+        """Waits `seconds`, or until a task is pushed onto the schedule."""
+        self._wakeup.clear()
+        try:
+            yield self._wakeup.wait(timeout=timedelta(seconds=seconds))
+        except gen.TimeoutError:
+            pass
+
+    @gen.coroutine
+    def _poll(self, entry):
+        future = entry['future']
+        try:
+            output = yield entry['fetch'](entry['task'])
+            status = entry['check'](output)
+        except Exception:
+            if not future.done():
+                future.set_exc_info(sys.exc_info())
+            return
+        finally:
+            self._slots.release()
+
+        if future.done():
+            return
+
+        if status is not None:
+            future.set_result((status, output))
+            return
+
+        deadline = entry['deadline']
+        if deadline is not None and time.time() >= deadline:
+            future.set_exception(gen.TimeoutError(
+                'Still waiting on %s after %.0fs' %
+                (entry['task'], deadline - entry['started'])))
+            return
+
+        self._push(entry, delay=self._next_delay(entry))
+
+    def _task_status(self, output, loc_log):
+        """Default `check` -- reads the summary of a Task status resource."""
+        summary = output.soul['summary'].lower()
+
+        if 'success' in summary or 'completed' in summary:
+            return True
+
+        if 'failed' in summary:
+            return False
+
+        loc_log.debug('Task (%s) status: %s (updated at: %s)' %
+                      (output.path, output.soul['summary'], datetime.now()))
+
+
+# IOLoop -> TaskMonitor. The monitor's loop runs on a particular IOLoop, so
+# each IOLoop gets its own.
+_TASK_MONITORS = weakref.WeakKeyDictionary()
+
+
+def get_task_monitor():
+    """Returns the TaskMonitor for the current IOLoop."""
+    loop = ioloop.IOLoop.current()
+    if loop not in _TASK_MONITORS:
+        _TASK_MONITORS[loop] = TaskMonitor()
+    return _TASK_MONITORS[loop]
+
+
 class RightScale(object):
 
     # Get references to existing objects that are used by the
@@ -116,14 +861,19 @@ class RightScale(object):
     def __init__(self, token, endpoint=DEFAULT_ENDPOINT):
         """Initializes the RightScaleOperator Object for a RightScale Account.
 
+        These objects are cheap to create -- the underlying authenticated
+        python-rightscale client is shared by every object created with the
+        same token and endpoint. See get_session().
+
         Args:
             token: A RightScale RefreshToken
             api: API URL Endpoint
         """
         self._token = token
         self._endpoint = endpoint
-        self._client = rightscale.RightScale(refresh_token=self._token,
-                                             api_endpoint=self._endpoint)
+        self._client = get_session(self._token, self._endpoint)
+        self._cache = get_lookup_cache(self._token, self._endpoint)
+        self._tags = get_tag_batcher(self._token, self._endpoint)
 
         # Quiet down the urllib requests library, its noisy even in
         # INFO mode and muddies up the logs.
@@ -144,6 +894,7 @@ class RightScale(object):
         """
         return int(path.split(resource.self.path)[-1])
 
+    @cached_lookup('server_arrays')
     @concurrent.run_on_executor
     @sync_retry(**settings.RETRYING_SETTINGS)
     @rightscale_error_logger
@@ -192,6 +943,7 @@ class RightScale(object):
         """
         return resource.show()
 
+    @cached_lookup('cookbooks')
     @concurrent.run_on_executor
     @rightscale_error_logger
     @utils.exception_logger
@@ -225,6 +977,7 @@ class RightScale(object):
 
         return recipe
 
+    @cached_lookup('right_scripts')
     @concurrent.run_on_executor
     @sync_retry(**settings.RETRYING_SETTINGS)
     @rightscale_error_logger
@@ -250,6 +1003,7 @@ class RightScale(object):
 
         return found_script
 
+    @cached_lookup()
     @concurrent.run_on_executor
     @sync_retry(**settings.RETRYING_SETTINGS)
     @rightscale_error_logger
@@ -289,6 +1043,7 @@ class RightScale(object):
 
         return found
 
+    @invalidates_lookups(lambda self, res: _path(res))
     @concurrent.run_on_executor
     @sync_retry(**settings.RETRYING_SETTINGS)
     @rightscale_error_logger
@@ -301,6 +1056,7 @@ class RightScale(object):
         """
         return res.self.destroy()
 
+    @invalidates_lookups(lambda self, res, params: _path(res))
     @concurrent.run_on_executor
     @sync_retry(**settings.RETRYING_SETTINGS)
     @rightscale_error_logger
@@ -317,6 +1073,8 @@ class RightScale(object):
         """
         return res.create(params=params)
 
+    @invalidates_lookups(
+        lambda self, res, res_type, *args, **kwargs: _path(res_type))
     @concurrent.run_on_executor
     @sync_retry(**settings.RETRYING_SETTINGS)
     @rightscale_error_logger
@@ -339,62 +1097,51 @@ class RightScale(object):
             params = {'commit_message': message}
         return res_type.commit(res_id=res_id, params=params)
 
-    @concurrent.run_on_executor
-    @sync_retry(**settings.RETRYING_SETTINGS)
-    @rightscale_error_logger
-    @utils.exception_logger
+    @invalidates_lookups(lambda self, res, tags: _path(res))
     def add_resource_tags(self, res, tags):
         """Tags a RightScale resource
 
+        The request is batched up with other tag requests, see TagBatcher.
+
         Args:
             res: Resource object to commit
             tag: The tag(s) to add to the resource
 
         Returns:
-            The Rightscale Resource itself
+            A Future
         """
-        params = [('resource_hrefs[]', res.href)]
-        for tag in tags:
-            params.append(('tags[]', tag))
-        return self._client.tags.multi_add(params=params)
+        return self._tags.add(self._client, res.href, tags)
 
-    @concurrent.run_on_executor
-    @sync_retry(**settings.RETRYING_SETTINGS)
-    @rightscale_error_logger
-    @utils.exception_logger
+    @invalidates_lookups(lambda self, res, tags: _path(res))
     def delete_resource_tags(self, res, tags):
         """Deletes tags from a RightScale resource
 
+        The request is batched up with other tag requests, see TagBatcher.
+
         Args:
             res: Resource object to commit
             tag: The tag(s) to delete from the resource
 
         Returns:
-            The Rightscale Resource itself
+            A Future
         """
-        params = [('resource_hrefs[]', res.href)]
-        for tag in tags:
-            params.append(('tags[]', tag))
-        return self._client.tags.multi_delete(params=params)
+        return self._tags.delete(self._client, res.href, tags)
 
-    @concurrent.run_on_executor
-    @sync_retry(**settings.RETRYING_SETTINGS)
-    @rightscale_error_logger
-    @utils.exception_logger
     def get_resource_tags(self, res):
         """Returns a list of tags associated with a RightScale resource.
 
+        The request is batched up with other tag requests, see TagBatcher.
+
         Args:
             res: Resource object to search for
 
         Returns:
-            [List, of, tags]
+            A Future with the [List, of, tags]
         """
-        params = [('resource_hrefs[]', res.href)]
-        raw = self._client.tags.by_resource(params=params)[0]
-        tags = [tag['name'] for tag in raw.soul['tags']]
-        return tags
+        return self._tags.get(self._client, res.href)
 
+    @invalidates_lookups(
+        lambda self, array: _collection_path('server_arrays'))
     @concurrent.run_on_executor
     @rightscale_error_logger
     @utils.exception_logger
@@ -416,6 +1163,8 @@ class RightScale(object):
         log.debug('New ServerArray %s created!' % new_array.soul['name'])
         return new_array
 
+    @invalidates_lookups(
+        lambda self, array: _collection_path('server_arrays'))
     @concurrent.run_on_executor
     @rightscale_error_logger
     @utils.exception_logger
@@ -435,6 +1184,7 @@ class RightScale(object):
         self._client.server_arrays.destroy(res_id=array_id)
         log.debug('Array Destroyed')
 
+    @invalidates_lookups(lambda self, resource, params: _path(resource))
     @concurrent.run_on_executor
     @rightscale_error_logger
     @utils.exception_logger
@@ -509,6 +1259,7 @@ class RightScale(object):
         next_inst = array.next_instance.show()
         next_inst.inputs.multi_update(params=inputs)
 
+    @invalidates_lookups(lambda self, array, count=1: _path(array))
     @concurrent.run_on_executor
     @sync_retry(**settings.RETRYING_SETTINGS)
     @rightscale_error_logger
@@ -580,6 +1331,7 @@ class RightScale(object):
         params = {'filter[]': filters}
         return array.current_instances.index(params=params)
 
+    @invalidates_lookups(lambda self, array: _path(array))
     @concurrent.run_on_executor
     @rightscale_error_logger
     @utils.exception_logger
@@ -619,14 +1371,15 @@ class RightScale(object):
                       task_name=None,
                       sleep=5,
                       loc_log=log,
-                      instance=None):
+                      instance=None,
+                      timeout=None):
         """Monitors a RightScale task for completion.
 
         RightScale tasks are provided as URLs that we can query for the
-        run-status of the task. This method repeatedly queries a task for
-        completion (every 5 seconds), and returns when the task has finished.
-
-        TODO: Add a task-timeout option.
+        run-status of the task. The task is handed to the shared TaskMonitor,
+        which queries it for completion (every `sleep` seconds, at most 5,
+        backing off once the task runs longer than that), and this method
+        returns when the task has finished.
 
         Note: This is a completely retryable operation in the event that an
         intermittent network connection causes any kind of a connection
@@ -641,6 +1394,11 @@ class RightScale(object):
                     actor, and you want to use the actor's specific logger.
                     If nothing is passed - local `log` object is used.
             instance: RightScale instance object on which the task is executed.
+            timeout: Optional number of seconds after which the task is no
+                     longer polled.
+
+        Raises:
+            gen.TimeoutError: If the task did not finish within `timeout`.
 
         Returns:
             bool: success status
@@ -660,30 +1418,17 @@ class RightScale(object):
         now = datetime.utcnow()
         tasks_start = now.strftime('%Y/%m/%d %H:%M:%S +0000')
 
-        while True:
-            # Get the task status
-            output = yield self._get_task_info(task)
-            summary = output.soul['summary'].lower()
-            stamp = datetime.now()
-
-            if 'success' in summary or 'completed' in summary:
-                status = True
-                break
-
-            if 'failed' in summary:
-                status = False
-                break
-
-            loc_log.debug('Task (%s) status: %s (updated at: %s)' %
-                          (output.path, output.soul['summary'], stamp))
-
-            yield utils.tornado_sleep(min(sleep, 5))
-
+        try:
+            status, output = yield get_task_monitor().watch(
+                task, self._get_task_info, interval=min(sleep, 5),
+                expected=sleep, loc_log=loc_log, timeout=timeout)
+        finally:
+            if timeout_id:
+                utils.clear_repeating_log(timeout_id)
+
+        summary = output.soul['summary'].lower()
         loc_log.debug('Task (%s) status: %s (updated at: %s)' %
-                      (output.path, output.soul['summary'], stamp))
-
-        if timeout_id:
-            utils.clear_repeating_log(timeout_id)
+                      (output.path, output.soul['summary'], datetime.now()))
 
         if status is True:
             raise gen.Return(True)
@@ -728,16 +1473,15 @@ class RightScale(object):
         """
         return task.self.show()
 
-    @concurrent.run_on_executor
-    @sync_retry(**settings.RETRYING_SETTINGS)
-    @rightscale_error_logger
-    @utils.exception_logger
+    @gen.coroutine
     def get_audit_logs(self, instance, start, end, match=None):
         """Fetch a set of audit logs belonging to an instance.
 
         http://reference.rightscale.com/api1.5/resources/
         ResourceAuditEntries.html
 
+        The details of all of the matching entries are fetched concurrently.
+
         Args:
             instance: RightScale instance object.
             start: String as expected by start_date of the API
@@ -751,36 +1495,49 @@ class RightScale(object):
             a substring in the summary. May return an empty list.
 
         """
-
-        href = instance.links['self']
-        all_entries = self._client.audit_entries.index(params={
-            'filter[]': ['auditee_href==%s' % href],
-            'limit': 10,
-            'start_date': start,
-            'end_date': end
-        })
-
+        all_entries = yield self._get_audit_entries(instance, start, end)
         log.debug('Found %s audit logs.' % len(all_entries))
 
-        logs = []
+        details = []
         for entry in all_entries:
             summary = entry.soul['summary']
             if match and match not in summary:
                 log.debug('Skipping details for "%s"' % summary)
                 continue
             log.debug('Fetching details for "%s"' % summary)
+            details.append(self._get_audit_entry_detail(entry))
 
-            # grabbing raw output because RightScale doesn't reply via JSON
-            # when accessing details of a log.
-            detail_res = self._client.client.get(entry.detail.path)
-            details = detail_res.raw_response.text
+        logs = yield details
+        raise gen.Return(logs)
 
-            logs.append(details)
+    @concurrent.run_on_executor
+    @sync_retry(**settings.RETRYING_SETTINGS)
+    @rightscale_error_logger
+    @utils.exception_logger
+    def _get_audit_entries(self, instance, start, end):
+        """Returns the (up to 10) audit entries of an instance."""
+        href = instance.links['self']
+        return self._client.audit_entries.index(params={
+            'filter[]': ['auditee_href==%s' % href],
+            'limit': 10,
+            'start_date': start,
+            'end_date': end
+        })
 
-        return logs
+    @concurrent.run_on_executor
+    @sync_retry(**settings.RETRYING_SETTINGS)
+    @rightscale_error_logger
+    @utils.exception_logger
+    def _get_audit_entry_detail(self, entry):
+        """Returns the raw text detail of an audit entry."""
+        # grabbing raw output because RightScale doesn't reply via JSON
+        # when accessing details of a log.
+        detail_res = self._client.client.get(entry.detail.path)
+        return detail_res.raw_response.text
 
     @gen.coroutine
-    def run_executable_on_instances(self, name, inputs, instances):
+    def run_executable_on_instances(self, name, inputs, instances,
+                                    concurrency=None):
         """Execute a script on a set of RightScale Instances.
 
         This method bypasses the python-rightscale native properties and
@@ -790,10 +1547,14 @@ class RightScale(object):
             https://github.com/brantai/python-rightscale/issues/6
 
         Instead, we take in a list of rightscale.Resource objects that point to
-        instances. For each instance we iterate over and directly call the
+        instances. For each instance we directly call the
         <instance_path>/run_executable URL. This is done below in the
         make_generic_request() method for us.
 
+        At most `concurrency` of these requests are in flight at once, and
+        their results are collected as they complete -- so one slow (or
+        retrying) request does not hold up the rest.
+
         Note, the inputs dictionary should look like this:
             { '' }
 
@@ -801,6 +1562,14 @@ class RightScale(object):
             name: Recipe or RightScript String Name
             inputs: Dict of Key/Value Input Pairs
             instances: A list of rightscale.Resource instances objects.
+            concurrency: Max number of requests in flight at once.
+                         (default: settings.DISPATCH_CONCURRENCY)
+
+        Raises:
+            ServerArrayException: If the RightScript can't be found, or the
+                execution could not be queued on any of the instances.
+            PartialExecutionFailure: If the execution was queued on some, but
+                not all, of the instances.
 
         Returns:
             list of tuples - (instance, <rightscale.Resource task object>)
@@ -825,50 +1594,51 @@ class RightScale(object):
 
         log.debug('Executing %s with params: %s' % (script_type, params))
 
-        # Walk through the list of instances and fire off the execution on each
-        # instance. For each execution, we will store a reference to the
-        # instane itself, and the task thats executing. Note, as soon as we
-        # call the make_generic_request() method, a thread is fired off and
-        # begins acting on that request. Outside of this loop (below), we will
-        # iterate over the responses to these requests.
-        task_pairs = []
-        for i in instances:
-            log.debug('Executing %s on %s' % (name, i.soul['name']))
-            url = '%s/run_executable' % i.links['self']
-            req = self.make_generic_request(url, post=params)
-            task_pairs.append((i, req))
-
-        # At this point, all of our tasks are executing in the background. We
-        # can now yield on each task *individually* in order to get the "result
-        # object" back. This looks synchronous, but remember that the real API
-        # calls are actually happening in the background simultaneously.
-        yielded_tasks = []
-        exceptions_caught = []
-        for (i, task) in task_pairs:
+        semaphore = locks.Semaphore(concurrency or
+                                    settings.DISPATCH_CONCURRENCY)
+
+        @gen.coroutine
+        def dispatch(instance):
+            with (yield semaphore.acquire()):
+                log.debug('Executing %s on %s' % (name, instance.soul['name']))
+                url = '%s/run_executable' % instance.links['self']
+                task = yield self.make_generic_request(url, post=params)
+            raise gen.Return(task)
+
+        # Fire off all of the dispatches (the semaphore keeps all but
+        # `concurrency` of them waiting), and then collect the results in
+        # whatever order they finish.
+        waiter = gen.WaitIterator(*[dispatch(i) for i in instances])
+        results = {}
+        failures = []
+        while not waiter.done():
             try:
-                result = yield task
-                yielded_tasks.append((i, result))
+                results[waiter.current_index] = yield waiter.next()
             except (requests.exceptions.HTTPError, RightScaleError) as e:
-                msg = ('Failed to queue execution on %s: %s' %
-                       (i.soul['name'], e))
-                exceptions_caught.append(msg)
+                instance = instances[waiter.current_index]
+                log.error('Failed to queue execution on %s: %s' %
+                          (instance.soul['name'], e))
+                failures.append((instance, e))
 
-        # Rather than a single try/except and raising a group of exceptions,
-        # Tornado's 'multi_future' method raises the first exception in a list
-        # of tasks. This behavior is described in a bug, and we are working
-        # with the Tornado team to try to come up with a reasonable solution.
-        # Until then, we do this hackery to create a single exception from
-        # many, and then raise that exception:
-        #
-        # https://github.com/tornadoweb/tornado/issues/1378
-        if exceptions_caught:
-            exc_string = ', '.join(exceptions_caught)
-            exc_length = len(exceptions_caught)
-            raise ServerArrayException('%s failures: %s' %
-                                       (exc_length, exc_string))
-
-        raise gen.Return(yielded_tasks)
+        # Hand the tasks back in the same order as the instances came in
+        tasks = [(instances[i], results[i]) for i in sorted(results)]
 
+        # Tornado's 'multi_future' method raises the first exception in a list
+        # of tasks, so instead we collect every failure above and report them
+        # all together here.
+        if failures:
+            msg = '%s of %s failures: %s' % (
+                len(failures), len(instances),
+                ', '.join('Failed to queue execution on %s: %s' %
+                          (i.soul['name'], e) for i, e in failures))
+            if tasks:
+                raise PartialExecutionFailure(msg, tasks, failures)
+            raise ServerArrayException(msg)
+
+        raise gen.Return(tasks)
+
+    @invalidates_lookups(
+        lambda self, url, post=None: post is not None and url)
     @concurrent.run_on_executor
     @sync_retry(**settings.RETRYING_SETTINGS)
     @rightscale_error_logger
@@ -30,6 +30,12 @@ below for using each actor.
 :RIGHTSCALE_ENDPOINT:
   Your account-specific API Endpoint
   (defaults to https://my.rightscale.com)
+
+**Optional Environment Variables**
+
+:RIGHTSCRIPT_DIGEST_CACHE:
+  Path to a JSON file used to remember the digests of RightScript sources
+  between runs, so that unchanged scripts are not downloaded again
 """
 
 from random import randint
@@ -25,10 +25,12 @@ import logging
 import mock
 
 from tornado import gen
+from tornado import locks
 
 from kingpin.actors import exceptions
 from kingpin.actors.utils import dry
 from kingpin.actors.rightscale import base
+from kingpin.actors.rightscale import settings as rs_settings
 from kingpin.constants import SchemaCompareBase
 from kingpin.constants import REQUIRED
 from kingpin.constants import STATE
@@ -229,18 +231,19 @@ class MCIBaseActor(base.RightScaleBaseActor):
             raise exceptions.InvalidOptions(
                 'Invalid Cloud name supplied: %s' % settings['cloud'])
 
-        # Find our image by searching for the resource_uid that matches.
-        image = yield self._client.find_by_name_and_keys(
-            collection=cloud.images,
-            resource_uid=settings['image'])
+        # Find our image (by searching for the resource_uid that matches) and
+        # our instance type at the same time.
+        image, instance = yield [
+            self._client.find_by_name_and_keys(
+                collection=cloud.images,
+                resource_uid=settings['image']),
+            self._client.find_by_name_and_keys(
+                collection=cloud.instance_types,
+                name=settings['instance_type'])]
         if not image:
             raise exceptions.InvalidOptions(
                 'Invalid cloud image name supplied: %s' % settings['image'])
 
-        # Find our instance type now too
-        instance = yield self._client.find_by_name_and_keys(
-            collection=cloud.instance_types,
-            name=settings['instance_type'])
         if not instance:
             raise exceptions.InvalidOptions(
                 'Invalid cloud instance_type supplied: %s' %
@@ -521,8 +524,10 @@ class MCI(MCIBaseActor):
         new = yield tasks
 
         # First, lets create-or-update anything thats not in the
-        # existing list of configured settings.
-        tasks = []
+        # existing list of configured settings. Each change is queued up as a
+        # (method, kwargs) tuple, and they're all run (with bounded
+        # concurrency) at the end.
+        changes = []
         for new_setting in new:
             # Dive into the list of tuples for this cloud image setting and
             # find its HREF.
@@ -539,10 +544,10 @@ class MCI(MCIBaseActor):
             # If the configured image doesn't exist in our existing list of
             # cloud images, then lets just create it.
             if len(existing_setting) == 0:
-                tasks.append(self._create_mci_setting(
-                    cloud=new_cloud_href,
-                    mci=mci,
-                    params=new_setting))
+                changes.append((self._create_mci_setting, {
+                    'cloud': new_cloud_href,
+                    'mci': mci,
+                    'params': new_setting}))
                 continue
 
             # Now, if the cloud IS defined already in the MCi, then we have to
@@ -554,28 +559,38 @@ class MCI(MCIBaseActor):
             # this is == 1.
             if len(existing_setting) == 1:
                 if self._diff_setting(existing_setting[0], new_setting):
-                    tasks.append(self._update_mci_setting(
-                        mci_setting=existing_setting[0],
-                        params=new_setting))
+                    changes.append((self._update_mci_setting, {
+                        'mci_setting': existing_setting[0],
+                        'params': new_setting}))
+                    continue
 
                 # Temporary -- when rightscale lets us check the user_data
-                # value via the api, we won't have to do this anymore.
-                tasks.append(self._force_mci_setting_user_data(
-                    mci_setting=existing_setting[0],
-                    params=new_setting))
+                # value via the api, we won't have to do this anymore. (An
+                # update above already sets the user_data along with
+                # everything else.)
+                changes.append((self._force_mci_setting_user_data, {
+                    'mci_setting': existing_setting[0],
+                    'params': new_setting}))
 
         # Now that we've added or updated the cloud images we _want_, lets
         # purge any that are no longer listed.
+        new_cloud_hrefs = [
+            dict(s)['multi_cloud_image_setting[cloud_href]'] for s in new]
         for existing_setting in existing:
             existing_cloud_href = existing_setting.links['cloud']
-            new_cloud_hrefs = [
-                dict(s)['multi_cloud_image_setting[cloud_href]'] for s in new]
 
             if existing_cloud_href not in new_cloud_hrefs:
-                tasks.append(self._delete_mci_setting(
-                    mci_setting=existing_setting))
+                changes.append((self._delete_mci_setting, {
+                    'mci_setting': existing_setting}))
+
+        semaphore = locks.Semaphore(rs_settings.MCI_SETTING_CONCURRENCY)
+
+        @gen.coroutine
+        def bounded(method, kwargs):
+            with (yield semaphore.acquire()):
+                yield method(**kwargs)
 
-        yield tasks
+        yield [bounded(method, kwargs) for method, kwargs in changes]
 
     @gen.coroutine
     @dry('Would have committed HEAD to a revision')
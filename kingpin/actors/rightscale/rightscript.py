@@ -17,13 +17,18 @@
 ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 """
 
+import hashlib
+import json
 import logging
+import os
+import tempfile
 
 from tornado import gen
 
 from kingpin import utils
 from kingpin.actors import exceptions
 from kingpin.actors.rightscale import base
+from kingpin.actors.rightscale import settings
 from kingpin.actors.utils import dry
 from kingpin.constants import REQUIRED, STATE
 
@@ -32,6 +37,61 @@ log = logging.getLogger(__name__)
 __author__ = 'Matt Wise <matt@nextdoor.com>'
 
 
+# 'href|revision|updated_at' -> SHA256 digest of a RightScript source, as last
+# seen in RightScale. Shared by every RightScript actor, so that the source of
+# an unchanged script is downloaded at most once per run (or not at all, if
+# settings.RIGHTSCRIPT_DIGEST_CACHE is set).
+SOURCE_DIGESTS = {}
+_digests_loaded = False
+
+
+def source_digest(source):
+    """Returns the SHA256 hex digest of a RightScript source."""
+    if isinstance(source, unicode):
+        source = source.encode('utf-8')
+    return hashlib.sha256(source).hexdigest()
+
+
+def _load_digests():
+    """Loads the on-disk digest cache into SOURCE_DIGESTS (once)."""
+    global _digests_loaded
+    if _digests_loaded or not settings.RIGHTSCRIPT_DIGEST_CACHE:
+        return
+    _digests_loaded = True
+
+    try:
+        with open(settings.RIGHTSCRIPT_DIGEST_CACHE) as fh:
+            SOURCE_DIGESTS.update(json.load(fh))
+    except (IOError, ValueError) as e:
+        log.debug('Not using RightScript digest cache %s: %s' %
+                  (settings.RIGHTSCRIPT_DIGEST_CACHE, e))
+
+
+def _save_digests():
+    """Writes SOURCE_DIGESTS out to the on-disk digest cache.
+
+    The cache is written to a temporary file that then replaces the old one,
+    so a run that dies half way (or another kingpin reading the cache at the
+    same time) never sees a truncated file.
+    """
+    cache = settings.RIGHTSCRIPT_DIGEST_CACHE
+    if not cache:
+        return
+
+    tmp = None
+    try:
+        fd, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(cache)), suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(SOURCE_DIGESTS, fh)
+        os.rename(tmp, cache)
+    except (IOError, OSError) as e:
+        log.warning('Could not write RightScript digest cache %s: %s' %
+                    (cache, e))
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+
+
 class RightScript(base.EnsurableRightScaleBaseActor):
 
     """Manages the state of a RightScale Script
@@ -111,6 +171,9 @@ class RightScript(base.EnsurableRightScaleBaseActor):
         """Validate the user-supplied parameters at instantiation time."""
         super(RightScript, self).__init__(*args, **kwargs)
         self.changed = False
+        self.source = None
+        self.source_digest = None
+        self._params_updated = False
 
         # The rightscale API allows you to push an invalid list of packages
         # (multiple spaces, newlines, etc). We need to sanitize the list
@@ -120,6 +183,7 @@ class RightScript(base.EnsurableRightScaleBaseActor):
                 self.option('packages').split())
 
         self._desired_source = self._read_source()
+        self._desired_digest = source_digest(self._desired_source)
         self._desired_params = self._generate_rightscale_params(
             prefix='right_script',
             params={
@@ -158,6 +222,23 @@ class RightScript(base.EnsurableRightScaleBaseActor):
 
         return parsed
 
+    def _digest_key(self, script):
+        """Returns the SOURCE_DIGESTS key for a RightScript, or None.
+
+        The HEAD revision (0) of a script is mutable, so it is only cacheable
+        together with its `updated_at` timestamp.
+        """
+        soul = getattr(script, 'soul', None)
+        if not isinstance(soul, dict):
+            return None
+
+        revision = soul.get('revision')
+        updated_at = soul.get('updated_at')
+        if not revision and not updated_at:
+            return None
+
+        return '%s|%s|%s' % (script.href, revision, updated_at)
+
     @gen.coroutine
     def _precache(self):
         # First go off and find our script object
@@ -178,10 +259,28 @@ class RightScript(base.EnsurableRightScaleBaseActor):
 
         log.debug('Got RightScript: %s' % found[0])
         self.script = found[0]
+        self.source = None
+
+        # If we've seen this exact revision of the script before, we already
+        # know the digest of its source and can skip downloading it.
+        _load_digests()
+        key = self._digest_key(self.script)
+        if key in SOURCE_DIGESTS:
+            log.debug('Using cached source digest for %s' % key)
+            self.source_digest = SOURCE_DIGESTS[key]
+            raise gen.Return()
 
         # Next, get the source of the script
         self.source = yield self._client.make_generic_request(
             self.script.source.path)
+        self.source_digest = source_digest(self.source or '')
+        self._remember_digest(key, self.source_digest)
+
+    def _remember_digest(self, key, digest):
+        if key is None:
+            return
+        SOURCE_DIGESTS[key] = digest
+        _save_digests()
 
     @gen.coroutine
     def _set_state(self):
@@ -222,11 +321,22 @@ class RightScript(base.EnsurableRightScaleBaseActor):
     @gen.coroutine
     @dry('Would have updated the RightScript parameters')
     def _update_params(self):
+        # The source, description and packages are all pushed in a single
+        # update call -- there's no point in repeating it for each of them.
+        if self._params_updated:
+            raise gen.Return()
+
         self.log.info('Updating RightScript parameters...')
         self.script = yield self._client.update(
             self.script, self._desired_params)
+        self._params_updated = True
         self.changed = True
 
+        self.source = self._desired_source
+        self.source_digest = self._desired_digest
+        self._remember_digest(
+            self._digest_key(self.script), self._desired_digest)
+
     @gen.coroutine
     def _set_source(self):
         self.log.warning('Source does not match')
@@ -239,8 +349,10 @@ class RightScript(base.EnsurableRightScaleBaseActor):
     @gen.coroutine
     def _compare_source(self):
         existing = yield self._get_source()
-        equals = (self._desired_source == existing)
-        raise gen.Return(equals)
+        if existing is not None:
+            raise gen.Return(self._desired_source == existing)
+
+        raise gen.Return(self._desired_digest == self.source_digest)
 
     @gen.coroutine
     def _set_description(self):
@@ -277,6 +389,10 @@ class RightScript(base.EnsurableRightScaleBaseActor):
 
         self.log.info('Committed revision %s' % ret.soul['revision'])
 
+        # The new revision holds the source we just pushed, so the next run
+        # doesn't have to download it.
+        self._remember_digest(self._digest_key(ret), self._desired_digest)
+
     @gen.coroutine
     def _execute(self):
         yield super(RightScript, self)._execute()
@@ -23,6 +23,7 @@
 
 import logging
 import math
+import time
 
 from tornado import gen
 import mock
@@ -32,6 +33,7 @@ from kingpin import utils
 from kingpin.actors import exceptions
 from kingpin.actors.rightscale import api
 from kingpin.actors.rightscale import base
+from kingpin.actors.rightscale import settings
 from kingpin.constants import REQUIRED
 
 log = logging.getLogger(__name__)
@@ -49,6 +51,11 @@ class TaskExecutionFailed(exceptions.RecoverableActorFailure):
     """Raised when one or more RightScale Task executions fail."""
 
 
+class BatchNotHealthy(exceptions.RecoverableActorFailure):
+
+    """Raised when the instances of a batch do not become Operational."""
+
+
 class ServerArrayBaseActor(base.RightScaleBaseActor):
 
     """Abstract ServerArray Actor that provides some utility methods."""
@@ -83,6 +90,44 @@ class ServerArrayBaseActor(base.RightScaleBaseActor):
         ret = yield tasks
         raise gen.Return(ret)
 
+    @gen.coroutine
+    def _wait_for_instances(self, array, done, filters=None,
+                            sleep=settings.ARRAY_POLL_INTERVAL, expected=0):
+        """Polls the current instances of an array until `done` is satisfied.
+
+        The array is watched by the shared api.TaskMonitor, so checks are
+        made every `sleep` seconds and back off once the wait runs longer
+        than `expected`, and many arrays waited on at once are all polled from
+        a single loop. The array is no longer polled once this actor has
+        timed out.
+
+        Args:
+            array: rightscale.Resource array object
+            done: Function that takes the list of current instances and
+                  returns True once we're done waiting.
+            filters: Optional list of filters used to list the instances.
+            sleep: Initial number of seconds between checks.
+            expected: Seconds after which the checks start to back off.
+
+        Returns:
+            The list of instances that satisfied `done`.
+        """
+        kwargs = {}
+        if filters is not None:
+            kwargs['filters'] = filters
+
+        def fetch(array):
+            return self._client.get_server_array_current_instances(
+                array, **kwargs)
+
+        def check(instances):
+            return True if done(instances) else None
+
+        _, instances = yield api.get_task_monitor().watch(
+            array, fetch, interval=sleep, expected=expected, loc_log=self.log,
+            check=check, timeout=self._timeout)
+        raise gen.Return(instances)
+
 
 class Clone(ServerArrayBaseActor):
 
@@ -677,40 +722,35 @@ class Terminate(ServerArrayBaseActor):
         # fails all the time when there are hosts still in a
         # 'terminated state' when this call is made. Just wait for it to
         # finish.
-        yield self._client.wait_for_task(task)
+        yield self._client.wait_for_task(task, timeout=self._timeout)
 
         raise gen.Return()
 
     @gen.coroutine
-    def _wait_until_empty(self, array, sleep=60):
-        """Sleep until all array instances are terminated.
+    def _wait_until_empty(self, array, sleep=settings.ARRAY_POLL_INTERVAL):
+        """Wait until all array instances are terminated.
 
-        This loop monitors the server array for its current live instance count
-        and waits until the count hits zero before progressing.
+        Monitors the server array for its current live instance count and
+        waits until the count hits zero before progressing.
 
         TODO: Add a timeout setting.
 
         Args:
             array: rightscale.Resource array object
-            sleep: Integer time to sleep between checks (def: 60)
+            sleep: Initial number of seconds between checks (backs off)
         """
         if self._dry:
                 self.log.info('Pretending that array %s instances '
                               'are terminated.' % array.soul['name'])
                 raise gen.Return()
 
-        while True:
-            instances = yield self._client.get_server_array_current_instances(
-                array)
-            count = len(instances)
-            self.log.info('%s instances found' % count)
+        def empty(instances):
+            self.log.info('%s instances found' % len(instances))
+            return len(instances) < 1
 
-            if count < 1:
-                raise gen.Return()
-
-            # At this point, sleep
-            self.log.debug('Sleeping..')
-            yield utils.tornado_sleep(sleep)
+        yield self._wait_for_instances(
+            array, empty, sleep=sleep,
+            expected=settings.ARRAY_TERMINATE_EXPECTED)
 
     @gen.coroutine
     def _disable_array(self, array):
@@ -954,23 +994,29 @@ class Launch(ServerArrayBaseActor):
         # Base class does everything to set up a generic class
         super(Launch, self).__init__(*args, **kwargs)
 
+        # Instance HREF -> seconds it took to show up as operational, measured
+        # from when we started waiting on its array.
+        self.time_to_operational = {}
+
         try:
             int(self._options.get('count', False))
         except ValueError:
             raise exceptions.InvalidOptions('`count` must be an integer.')
 
     @gen.coroutine
-    def _wait_until_healthy(self, array, sleep=60):
-        """Sleep until a server array has its max_count servers running.
+    def _wait_until_healthy(self, array, sleep=settings.ARRAY_POLL_INTERVAL):
+        """Wait until a server array has its max_count servers running.
 
-        This loop monitors the server array for its current live instance count
-        and waits until the count hits zero before progressing.
+        Monitors the server array for its current operational instance count
+        and waits until the count is high enough before progressing. Along the
+        way, the time it took each instance to become operational is recorded
+        in `self.time_to_operational`.
 
         TODO: Add a timeout setting.
 
         Args:
             array: rightscale.Resource array object
-            sleep: Integer time to sleep between checks (def: 60)
+            sleep: Initial number of seconds between checks (backs off)
         """
         if self._dry:
             self.log.info('Pretending that array %s instances are launched.'
@@ -984,19 +1030,30 @@ class Launch(ServerArrayBaseActor):
                             ['bounds']['max_count'])
 
         enough_count = int(math.ceil(max_count * (success_pct / 100.0)))
+        start = time.time()
+
+        def healthy(instances):
+            for instance in instances:
+                href = getattr(instance, 'href', instance)
+                if href not in self.time_to_operational:
+                    self.time_to_operational[href] = time.time() - start
 
-        while True:
-            instances = yield self._client.get_server_array_current_instances(
-                array, filters=['state==operational'])
             count = len(instances)
             self.log.info('%s instances found, waiting for %s/%s' %
                           (count, enough_count, max_count))
+            return count >= enough_count
 
-            if count >= enough_count:
-                raise gen.Return()
+        instances = yield self._wait_for_instances(
+            array, healthy, filters=['state==operational'], sleep=sleep,
+            expected=settings.ARRAY_LAUNCH_EXPECTED)
 
-            self.log.debug('Sleeping..')
-            yield gen.sleep(sleep)
+        times = [self.time_to_operational[getattr(i, 'href', i)]
+                 for i in instances]
+        if times:
+            self.log.info(
+                'Array %s: instances became operational within %.1fs '
+                '(avg %.1fs)' % (array.soul['name'], max(times),
+                                 sum(times) / len(times)))
 
     @gen.coroutine
     def _launch_instances(self, array, count=False):
@@ -1136,8 +1193,37 @@ class Execute(ServerArrayBaseActor):
       (str) Boolean whether or not to search for the exact array name.
       (default: `true`)
 
+    :batch:
+      (str, int) Rolling mode. Execute on this many instances (or this
+      percentage of the instances, eg. `25%`) at a time. Each batch has to
+      finish, and its instances have to be back in the *operational* state
+      (within `settings.BATCH_HEALTHY_TIMEOUT` seconds), before the next batch
+      starts. Can not be combined with `concurrency`.
+
+    :batch_pause:
+      (int) Rolling mode. Seconds to pause between batches.
+      (default: `0`)
+
+    :max_failures:
+      (int) Rolling mode. Number of failed executions to tolerate. As soon as
+      more than this many executions have failed, no further batches are
+      started and the actor fails.
+      (default: `0`)
+
     **Examples**
 
+    .. code-block:: json
+
+        { "desc": "Rolling restart of my-array, 10% at a time",
+          "actor": "rightscale.server_array.Execute",
+          "options": {
+            "array": "my-array",
+            "script": "restart app",
+            "batch": "10%",
+            "max_failures": 2
+          }
+        }
+
     .. code-block:: json
 
         { "desc":" Execute script on my-array",
@@ -1184,9 +1270,57 @@ class Execute(ServerArrayBaseActor):
         'expected_runtime': (int, 5, 'Expected number of seconds to execute.'),
         'concurrency': (int, 0, "Max number of concurrent executions."),
         'inputs': (dict, {}, (
-            'Inputs needed by the script. Read _generate_rightscale_params.'))
+            'Inputs needed by the script. Read _generate_rightscale_params.')),
+        'batch': ((int, str), None, (
+            'Rolling mode: number, or percentage, of instances to execute on '
+            'at a time.')),
+        'batch_pause': (int, 0, (
+            'Rolling mode: seconds to pause between batches.')),
+        'max_failures': (int, 0, (
+            'Rolling mode: number of failed executions to tolerate.')),
     }
 
+    def __init__(self, *args, **kwargs):
+        """Check Actor prerequisites."""
+
+        # Base class does everything to set up a generic class
+        super(Execute, self).__init__(*args, **kwargs)
+
+        batch = self.option('batch')
+        if batch is None:
+            return
+
+        if self.option('concurrency'):
+            raise exceptions.InvalidOptions(
+                '`batch` and `concurrency` can not be used together.')
+
+        # A percentage may be fractional, a number of instances may not
+        batch = str(batch)
+        try:
+            if batch.endswith('%'):
+                size = float(batch.rstrip('%'))
+            else:
+                size = int(batch)
+        except ValueError:
+            size = 0
+        if size <= 0 or (batch.endswith('%') and size > 100):
+            raise exceptions.InvalidOptions(
+                '`batch` must be a positive integer, or a percentage.')
+
+    def _batch_size(self, count):
+        """Returns the number of instances to execute on in each batch.
+
+        Args:
+            count: Total number of instances being executed on.
+        """
+        batch = str(self.option('batch'))
+        if batch.endswith('%'):
+            size = int(math.ceil(count * float(batch.rstrip('%')) / 100))
+        else:
+            size = int(batch)
+
+        return max(size, 1)
+
     @gen.coroutine
     def _get_operational_instances(self, array):
         """Gets a list of Operational instances and returns it.
@@ -1275,7 +1409,8 @@ class Execute(ServerArrayBaseActor):
                 task_name=task_name,
                 sleep=self.option('expected_runtime'),
                 loc_log=self.log,
-                instance=instance
+                instance=instance,
+                timeout=self._timeout
             ))
 
         self.log.info('Waiting for %s tasks to finish...' % task_count)
@@ -1306,7 +1441,7 @@ class Execute(ServerArrayBaseActor):
         # run_executable_on_instances returns (instance, task) tuple
         success = yield self._client.wait_for_task(
             task=tasks[0][1], task_name=name, sleep=sleep, loc_log=self.log,
-            instance=instance)
+            instance=instance, timeout=self._timeout)
 
         raise gen.Return(success)
 
@@ -1368,6 +1503,165 @@ class Execute(ServerArrayBaseActor):
         statuses = yield tasks
         raise gen.Return(all(statuses))
 
+    @gen.coroutine
+    def _wait_until_batch_healthy(self, arrays, batch, sleep=10,
+                                  timeout=None):
+        """Waits until every instance of a batch is Operational again.
+
+        Instances that have disappeared from their array (terminated, or
+        scaled down) while the batch ran are not waited on.
+
+        Args:
+            arrays: List of rightscale.Resource ServerArray objects
+            batch: List of rightscale.Resource instance objects
+            sleep: Integer time to sleep between checks (def: 10)
+            timeout: Seconds to wait before giving up.
+                     (default: settings.BATCH_HEALTHY_TIMEOUT)
+
+        Raises:
+            BatchNotHealthy: If the batch isn't healthy within `timeout`.
+        """
+        if timeout is None:
+            timeout = settings.BATCH_HEALTHY_TIMEOUT
+
+        hrefs = set(i.links['self'] for i in batch)
+        deadline = time.time() + timeout
+
+        while True:
+            current = []
+            for array in arrays:
+                instances = yield (
+                    self._client.get_server_array_current_instances(
+                        array, filters=['state<>terminated']))
+                current.extend(instances)
+
+            waiting = [i for i in current if i.links['self'] in hrefs and
+                       i.soul['state'] != 'operational']
+            if not waiting:
+                raise gen.Return()
+
+            names = ', '.join(i.soul['name'] for i in waiting)
+            if time.time() >= deadline:
+                raise BatchNotHealthy(
+                    '%s instances not Operational after %ss: %s' % (
+                        len(waiting), timeout, names))
+
+            self.log.info('Waiting for %s instances to become Operational: '
+                          '%s' % (len(waiting), names))
+            yield utils.tornado_sleep(sleep)
+
+    @gen.coroutine
+    def _execute_batch(self, batch, inputs, allowed):
+        """Executes the script on every instance of a batch.
+
+        Executions that have started can not be called back, so even once
+        more than `allowed` executions have failed, the rest of the batch is
+        waited on (and counted) before returning.
+
+        Args:
+            batch: List of rightscale.Resource instance objects
+            inputs: A string of inputs generated by
+                    self._generate_rightscale_params()
+            allowed: Number of failures left in the `max_failures` budget.
+
+        Returns:
+            The number of failed executions.
+        """
+        waiter = gen.WaitIterator(*[
+            self._exec_and_wait(
+                name=self.option('script'),
+                inputs=inputs,
+                instance=instance,
+                sleep=self.option('expected_runtime'))
+            for instance in batch])
+
+        failures = 0
+        while not waiter.done():
+            try:
+                success = yield waiter.next()
+            except (api.ServerArrayException, api.RightScaleError) as e:
+                self.log.error('Execution on %s failed: %s' % (
+                    batch[waiter.current_index].soul['name'], e))
+                success = False
+
+            if not success:
+                failures += 1
+                if failures == allowed + 1 and not waiter.done():
+                    self.log.error(
+                        'Exceeded the max_failures budget, waiting for the '
+                        'executions already started in this batch.')
+
+        raise gen.Return(failures)
+
+    @gen.coroutine
+    def _execute_array_in_batches(self, arrays, inputs):
+        """Executes a script on many arrays, a batch of instances at a time.
+
+        args:
+            arrays: A list of, or a single instance of rightscale.Resource
+                    ServerArray objects
+            inputs: A string of inputs generated by
+                    self._generate_rightscale_params()
+        """
+        if not isinstance(arrays, list):
+            arrays = [arrays]
+
+        instances = []
+        for array in arrays:
+            new_inst = yield self._get_operational_instances(array)
+            instances.extend(new_inst)
+
+        count = len(instances)
+        size = self._batch_size(count)
+        batches = [instances[i:i + size] for i in range(0, count, size)]
+
+        if self._dry:
+            self.log.info(
+                'Would have executed "%s" with inputs "%s" on %s instances '
+                'in %s batches of up to %s.' % (
+                    self.option('script'), inputs, count, len(batches), size))
+            raise gen.Return()
+
+        failed = 0
+        for number, batch in enumerate(batches, 1):
+            if number > 1 and self.option('batch_pause'):
+                self.log.info('Pausing %ss before the next batch' %
+                              self.option('batch_pause'))
+                yield utils.tornado_sleep(self.option('batch_pause'))
+
+            self.log.info('Starting batch %s/%s (%s instances)' %
+                          (number, len(batches), len(batch)))
+            start = time.time()
+            failures = yield self._execute_batch(
+                batch, inputs, self.option('max_failures') - failed)
+            failed += failures
+            exec_time = time.time() - start
+
+            if failed > self.option('max_failures'):
+                self.log.critical(
+                    'Batch %s/%s: %s failures, %s total. Exceeded the '
+                    'max_failures budget of %s, aborting.' % (
+                        number, len(batches), failures, failed,
+                        self.option('max_failures')))
+                raise TaskExecutionFailed(
+                    '%s executions failed (max_failures: %s)' % (
+                        failed, self.option('max_failures')))
+
+            yield self._wait_until_batch_healthy(arrays, batch)
+            self.log.info(
+                'Batch %s/%s finished: %s instances, %s failures, executed '
+                'in %.1fs, healthy after %.1fs' % (
+                    number, len(batches), len(batch), failures, exec_time,
+                    time.time() - start))
+
+        if failed:
+            self.log.warning('Completed %s tasks, %s failed (within the '
+                             'max_failures budget of %s).' % (
+                                 count, failed,
+                                 self.option('max_failures')))
+        else:
+            self.log.info('Completed %s tasks.' % count)
+
     @gen.coroutine
     def _execute_array(self, array, inputs):
         """Executes a script on an array.
@@ -1403,6 +1697,16 @@ class Execute(ServerArrayBaseActor):
         try:
             task_pairs = yield self._client.run_executable_on_instances(
                 self.option('script'), inputs, instances)
+        except api.PartialExecutionFailure as e:
+            # The script is already running on some of the instances. Don't
+            # walk away from those -- wait for them, and then fail.
+            self.log.critical('Script execution error: %s' % e)
+            self.log.warning('Waiting on the %s tasks that were queued' %
+                             len(e.tasks))
+            yield self._wait_for_all_tasks(e.tasks)
+            raise TaskExecutionFailed(
+                'Failed to queue execution on %s of %s instances.' %
+                (len(e.failures), count))
         except api.ServerArrayException as e:
             self.log.critical('Script execution error: %s' % e)
             raise exceptions.RecoverableActorFailure(
@@ -1448,7 +1752,9 @@ class Execute(ServerArrayBaseActor):
         # against.
         arrays = yield self._find_server_arrays(
             self.option('array'), exact=self.option('exact'))
-        if self.option('concurrency'):
+        if self.option('batch'):
+            yield self._execute_array_in_batches(arrays, inputs)
+        elif self.option('concurrency'):
             yield self._execute_array_with_concurrency(arrays, inputs)
         else:
             yield self._apply(self._execute_array, arrays, inputs)
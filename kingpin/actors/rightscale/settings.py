@@ -21,8 +21,12 @@ Common settings used by many of the `kingpin.actors.rightscale` modules.
 
 
 import logging
+import os
+
 import requests
 
+from kingpin.actors.support import summary
+
 __author__ = 'Matt Wise <matt@nextdoor.com>'
 
 log = logging.getLogger(__name__)
@@ -48,13 +52,29 @@ def is_retriable_exception(exception):
     return not any(code in str(exception) for code in not_retry_codes)
 
 
+# Maximum number of attempts at a RightScale API call
+MAX_ATTEMPTS = 10
+
+
+def should_stop_retrying(attempt_number, delay_since_first_attempt_ms):
+    """Return true once MAX_ATTEMPTS calls have been attempted.
+
+    Only called once a call has failed with a retriable exception, so this is
+    where we know that another attempt is really going to be made.
+    """
+    if attempt_number >= MAX_ATTEMPTS:
+        return True
+    summary.record_retry('rightscale')
+    return False
+
+
 RETRYING_SETTINGS = {
     # Verify if we need to retry with the is_retriable_exception
     # method described above.
     'retry_on_exception': is_retriable_exception,
 
     # Wait up to 10 times
-    'stop_max_attempt_number': 10,
+    'stop_func': should_stop_retrying,
 
     # Add 250ms of random jitter to every retry
     'wait_jitter_max': 250,
@@ -70,3 +90,68 @@ RETRYING_SETTINGS = {
     'wait_exponential_multiplier': 100,
     'wait_exponential_max': 30000
 }
+
+# Number of seconds before the RightScale OAuth access token expires at which
+# the shared session (see api.get_session()) starts refreshing it. Requests
+# that come in while the token is being refreshed keep using the old (still
+# valid) token rather than queueing up behind the login.
+TOKEN_REFRESH_WINDOW = 300
+
+# Settings for the TaskMonitor that polls the status of running RightScale
+# tasks (see api.RightScale.wait_for_task()).
+#
+# Maximum number of task status requests in flight at once. This matches the
+# size of the api.EXECUTOR thread pool, so status checks never queue up behind
+# each other in the executor.
+TASK_POLL_BATCH = 10
+
+# Once a task has been running longer than its expected runtime, the time
+# between polls is multiplied by TASK_POLL_BACKOFF (up to
+# TASK_POLL_MAX_INTERVAL seconds).
+TASK_POLL_BACKOFF = 1.5
+TASK_POLL_MAX_INTERVAL = 30
+
+# Every poll interval is randomly stretched or shrunk by up to this fraction,
+# so that tasks started at the same time don't all get polled together.
+TASK_POLL_JITTER = 0.1
+
+# Seconds between the first few checks of a ServerArray's instance count while
+# waiting for it to launch or terminate (see
+# server_array.ServerArrayBaseActor._wait_for_instances()). Arrays are watched
+# by the same TaskMonitor as tasks, so the checks back off towards
+# TASK_POLL_MAX_INTERVAL the longer the wait goes on.
+ARRAY_POLL_INTERVAL = 5
+
+# Seconds that new instances usually take to become Operational, and that
+# terminated instances usually take to go away. The checks of an array only
+# start to back off once the wait runs longer than that, so that launches and
+# terminations that finish on time are noticed quickly.
+ARRAY_LAUNCH_EXPECTED = 600
+ARRAY_TERMINATE_EXPECTED = 180
+
+# Seconds that a rolling server_array.Execute waits for the instances of a
+# batch to be Operational again before it gives up.
+BATCH_HEALTHY_TIMEOUT = 1800
+
+# Maximum number of run_executable requests that
+# api.RightScale.run_executable_on_instances() has in flight at once. This is
+# kept below the size of the api.EXECUTOR thread pool so that task polling
+# and other API calls aren't starved while a script is dispatched to a large
+# array.
+DISPATCH_CONCURRENCY = 8
+
+# Tag reads and writes (see api.TagBatcher) issued within this many seconds of
+# each other are batched up into multi-resource API calls of up to
+# TAG_BATCH_SIZE resources each.
+TAG_BATCH_WINDOW = 0.05
+TAG_BATCH_SIZE = 50
+
+# Maximum number of MultiCloudImage settings that rightscale.mci.MCI creates,
+# updates or deletes at once.
+MCI_SETTING_CONCURRENCY = 5
+
+# Optional path to a JSON file that persists the RightScript source digests
+# (see rightscript.SOURCE_DIGESTS) between runs. If unset, digests are only
+# kept in memory -- which still lets the real run skip re-downloading the
+# sources that the dry run already compared.
+RIGHTSCRIPT_DIGEST_CACHE = os.getenv('RIGHTSCRIPT_DIGEST_CACHE')
@@ -5,6 +5,7 @@ from tornado import testing
 import requests
 
 from kingpin.actors import exceptions
+from kingpin.actors.rightscale import api
 from kingpin.actors.rightscale import base
 from kingpin.actors.rightscale import alerts
 from kingpin.actors.test import helper
@@ -302,6 +303,19 @@ class TestAlertSpecBase(testing.AsyncTestCase):
         yield self.actor._precache()
         self.assertEquals(self.actor.existing_spec, fake_spec)
 
+    @testing.gen_test
+    def test_precache_known_specs(self):
+        fake_spec = mock.MagicMock(name='fake_spec')
+        self.actor.known_specs = {'high load alarm': [fake_spec]}
+        yield self.actor._precache()
+        self.assertEquals(self.actor.existing_spec, fake_spec)
+
+        self.actor.known_specs = {'high load alarm 2': [fake_spec]}
+        yield self.actor._precache()
+        self.assertEquals(self.actor.existing_spec, None)
+
+        self.assertFalse(self.client_mock.find_by_name_and_keys.called)
+
     @testing.gen_test
     def test_precache_missing(self):
         fake_spec = None
@@ -513,6 +527,63 @@ class TestAlertSpecsBase(testing.AsyncTestCase):
         self.assertTrue(self.actor.alert_actors[0]._precache.called)
         self.assertTrue(self.actor.alert_actors[1]._precache.called)
 
+    @testing.gen_test
+    def test_precache_single_listing(self):
+        second_spec = dict(self._spec)
+        second_spec['name'] = 'high load alarm 2'
+        actor = alerts.AlertSpecsBase(
+            options={
+                'href': '/api/template/abcd',
+                'specs': [self._spec, second_spec],
+            }
+        )
+        actor._client = self.client_mock
+
+        wanted_fake_spec = mock.MagicMock(name='wanted_fake_spec')
+        wanted_fake_spec.soul = {'name': 'high load alarm'}
+        self.client_mock.find_by_name_and_keys.side_effect = [
+            helper.tornado_value(wanted_fake_spec)
+        ]
+        yield actor._precache()
+
+        # Only the parent went to the API -- the children used its listing
+        self.assertEquals(1, self.client_mock.find_by_name_and_keys.call_count)
+        self.assertEquals(
+            wanted_fake_spec, actor.alert_actors[0].existing_spec)
+        self.assertEquals(None, actor.alert_actors[1].existing_spec)
+
+    @testing.gen_test
+    def test_precache_listings_coalesced(self):
+        existing = mock.MagicMock(name='existing')
+        existing.soul = {'name': 'high load alarm'}
+        listings = []
+
+        class FakeRightScaleClient(object):
+
+            # python-rightscale builds a new collection on every access
+            @property
+            def alert_specs(self):
+                collection = mock.MagicMock(name='alert_specs')
+                collection.path = '/api/alert_specs'
+                collection.index.side_effect = (
+                    lambda params: listings.append(params) or [existing])
+                return collection
+
+        api.reset_sessions()
+        client = api.RightScale('unittest')
+        client._client = FakeRightScaleClient()
+
+        # Say, two templates that share their alerts with the same array
+        for _ in range(2):
+            actor = alerts.AlertSpecsBase(
+                options={'href': '/api/template/abcd', 'specs': [self._spec]})
+            actor._client = client
+            yield actor._precache()
+            self.assertEquals(
+                existing, actor.alert_actors[0].existing_spec)
+
+        self.assertEquals(1, len(listings))
+
     @testing.gen_test
     def test_precache_only_one_returned(self):
         wanted_fake_spec = mock.MagicMock(name='wanted_fake_spec')
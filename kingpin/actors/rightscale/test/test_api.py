@@ -1,7 +1,10 @@
 import logging
+import threading
+import time
 import mock
 import simplejson
 
+from tornado import concurrent
 from tornado import gen
 from tornado import testing
 import requests
@@ -18,6 +21,7 @@ class TestRightScale(testing.AsyncTestCase):
     def setUp(self, *args, **kwargs):
         super(TestRightScale, self).setUp()
 
+        api.reset_sessions()
         self.token = 'test'
         self.client = api.RightScale(self.token)
         self.mock_client = mock.MagicMock()
@@ -152,6 +156,7 @@ class TestRightScale(testing.AsyncTestCase):
         collection.index.assert_called_once_with(
             params={'filter[]': ['href==/123', 'name==FakeResource']})
         collection.reset_mock()
+        self.client._cache.invalidate()
 
         # Same search -- but we return two resources instead of one. We should
         # get both back.
@@ -163,6 +168,7 @@ class TestRightScale(testing.AsyncTestCase):
         collection.index.assert_called_once_with(
             params={'filter[]': ['href==/123', 'name==FakeResource']})
         collection.reset_mock()
+        self.client._cache.invalidate()
 
         # Now do the same search, but with exact=False
         collection.index.return_value = [res_mock]
@@ -173,6 +179,7 @@ class TestRightScale(testing.AsyncTestCase):
         collection.index.assert_called_once_with(
             params={'filter[]': ['href==/123', 'name==FakeResource']})
         collection.reset_mock()
+        self.client._cache.invalidate()
 
     @testing.gen_test
     def test_destroy_resource(self):
@@ -503,6 +510,13 @@ class TestRightScale(testing.AsyncTestCase):
         ret = yield self.client.wait_for_task(mock_task, sleep=0.01)
         self.assertEquals(ret, True)
 
+        # task never finishes
+        mock_task = mock.MagicMock(name='fake task')
+        mock_task.self.show.return_value = queued
+        with self.assertRaises(gen.TimeoutError):
+            yield self.client.wait_for_task(
+                mock_task, sleep=0.01, timeout=0.05)
+
     @testing.gen_test
     def test_get_audit_logs(self):
         mock_instance = mock.MagicMock(name='unittest-instance')
@@ -600,6 +614,92 @@ class TestRightScale(testing.AsyncTestCase):
             yield self.client.run_executable_on_instances(
                 'my::recipe', {}, [mock_instance])
 
+    def _mock_instances(self, count):
+        instances = []
+        for i in range(count):
+            instance = mock.MagicMock(name='instance-%s' % i)
+            instance.soul = {'name': 'instance-%s' % i}
+            instance.links = {'self': '/instances/%s' % i}
+            instances.append(instance)
+        return instances
+
+    @testing.gen_test
+    def test_run_executable_on_instances_partial_failure(self):
+        instances = self._mock_instances(3)
+
+        @gen.coroutine
+        def fake_web_request(url, post):
+            if url == '/instances/1/run_executable':
+                raise api.RightScaleError('broken')
+            raise gen.Return(url)
+        self.client.make_generic_request = fake_web_request
+
+        with self.assertRaises(api.PartialExecutionFailure) as e:
+            yield self.client.run_executable_on_instances(
+                'my::recipe', {}, instances)
+
+        self.assertEquals(
+            [(instances[0], '/instances/0/run_executable'),
+             (instances[2], '/instances/2/run_executable')],
+            e.exception.tasks)
+        self.assertEquals(instances[1], e.exception.failures[0][0])
+        self.assertIn('1 of 3 failures', str(e.exception))
+
+    @testing.gen_test
+    def test_run_executable_on_instances_concurrency(self):
+        instances = self._mock_instances(6)
+        in_flight = []
+        max_in_flight = []
+
+        @gen.coroutine
+        def fake_web_request(url, post):
+            in_flight.append(url)
+            max_in_flight.append(len(in_flight))
+            # The first request is slow, the rest finish quickly
+            if url == '/instances/0/run_executable':
+                yield gen.sleep(0.01)
+            else:
+                yield gen.moment
+            in_flight.remove(url)
+            raise gen.Return(url)
+        self.client.make_generic_request = fake_web_request
+
+        ret = yield self.client.run_executable_on_instances(
+            'my::recipe', {}, instances, concurrency=2)
+
+        self.assertEquals(2, max(max_in_flight))
+        # Results come back in the original instance order
+        self.assertEquals(instances, [i for i, _ in ret])
+
+    @testing.gen_test
+    def test_get_audit_logs_fetches_details_concurrently(self):
+        mock_instance = mock.MagicMock(name='unittest-instance')
+        mock_instance.links = {'self': '/foo/bar'}
+
+        entries = []
+        for i in range(3):
+            entry = mock.Mock()
+            entry.soul = {'summary': 'failed: %s' % i}
+            entries.append(entry)
+        self.client._get_audit_entries = helper.mock_tornado(entries)
+
+        in_flight = []
+        max_in_flight = []
+
+        @gen.coroutine
+        def fake_detail(entry):
+            in_flight.append(entry)
+            max_in_flight.append(len(in_flight))
+            yield gen.moment
+            in_flight.remove(entry)
+            raise gen.Return(entry.soul['summary'])
+        self.client._get_audit_entry_detail = fake_detail
+
+        logs = yield self.client.get_audit_logs(
+            mock_instance, 'start', 'end', 'failed')
+        self.assertEquals(['failed: 0', 'failed: 1', 'failed: 2'], logs)
+        self.assertEquals(3, max(max_in_flight))
+
     @testing.gen_test
     def test_make_generic_request(self):
         # Mock out the requests library client that the rightscale object
@@ -654,3 +754,578 @@ class TestRightScale(testing.AsyncTestCase):
             'a', 'b', 0)
         ret = yield self.client.make_generic_request('/foo')
         self.assertEquals('test', ret)
+
+
+class TestSessions(testing.AsyncTestCase):
+
+    def setUp(self, *args, **kwargs):
+        super(TestSessions, self).setUp()
+        api.reset_sessions()
+
+    def tearDown(self):
+        api.reset_sessions()
+        super(TestSessions, self).tearDown()
+
+    def test_get_session_is_shared(self):
+        a = api.RightScale('token')
+        b = api.RightScale('token')
+        c = api.RightScale('token', endpoint='https://us-4.rightscale.com')
+
+        self.assertIs(a._client, b._client)
+        self.assertIsNot(a._client, c._client)
+        self.assertIsInstance(a._client.client, api.SharedHTTPClient)
+        self.assertEquals(2, len(api.SESSIONS))
+
+    def test_get_session_rc_credentials(self):
+        rc_creds = ('https://rc.rightscale.com', 'rc-token')
+        with mock.patch('rightscale.rightscale.get_rc_creds',
+                        return_value=rc_creds):
+            client = api.get_session(None, endpoint=None).client
+
+        self.assertEquals('https://rc.rightscale.com', client.endpoint)
+        self.assertEquals('rc-token', client.refresh_token)
+
+    def test_shared_client_keepalive(self):
+        client = api.get_session('token').client
+        self.assertNotIn('Connection', client.s.headers)
+        self.assertEquals('1.5', client.s.headers['X-API-Version'])
+
+    def test_shared_client_session_per_thread(self):
+        client = api.get_session('token').client
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(client.s))
+        thread.start()
+        thread.join()
+
+        self.assertIs(client.s, client.s)
+        self.assertIsNot(client.s, sessions[0])
+
+        # The access token set from one thread is used by all of them
+        client.s.headers['Authorization'] = 'Bearer abc'
+        self.assertEquals('Bearer abc',
+                          sessions[0].headers['Authorization'])
+
+    def test_ensure_token_logs_in_once(self):
+        client = api.get_session('token').client
+
+        def login():
+            client.auth_expires_at = 10000
+
+        with mock.patch.object(client, 'login', side_effect=login) as m:
+            with mock.patch.object(api, 'time') as clock:
+                clock.time.return_value = 1000
+                client.ensure_token()
+                client.ensure_token()
+        m.assert_called_once_with()
+
+    def test_ensure_token_refreshes_early(self):
+        client = api.get_session('token').client
+        client.auth_expires_at = 1100
+
+        with mock.patch.object(client, 'login') as m:
+            with mock.patch.object(api, 'time') as clock:
+                clock.time.return_value = 1000
+                client.ensure_token()
+        m.assert_called_once_with()
+
+    def test_ensure_token_skips_refresh_in_progress(self):
+        client = api.get_session('token').client
+        client.auth_expires_at = 1100
+
+        # Another thread is already refreshing the (still valid) token
+        client._login_lock.acquire()
+        try:
+            with mock.patch.object(client, 'login') as m:
+                with mock.patch.object(api, 'time') as clock:
+                    clock.time.return_value = 1000
+                    client.ensure_token()
+        finally:
+            client._login_lock.release()
+        self.assertFalse(m.called)
+
+    def test_request(self):
+        client = api.get_session('token').client
+        with mock.patch.object(client, 'ensure_token') as ensure:
+            with mock.patch.object(client, '_request') as request:
+                request.return_value = 'response'
+                ret = client.request('get', '/foo')
+        ensure.assert_called_once_with()
+        request.assert_called_once_with('get', '/foo', None, [])
+        self.assertEquals('response', ret)
+
+    def test_request_failed(self):
+        client = api.get_session('token').client
+        with mock.patch.object(client, 'ensure_token'):
+            with mock.patch.object(client, '_request') as request:
+                request.side_effect = requests.exceptions.HTTPError('bad')
+                with mock.patch.object(api.summary, 'record_call') as record:
+                    with self.assertRaises(requests.exceptions.HTTPError):
+                        client.request('get', '/foo')
+        record.assert_called_once_with('rightscale', mock.ANY, error=True)
+
+
+class TestTaskMonitor(testing.AsyncTestCase):
+
+    def _status(self, summary):
+        output = mock.MagicMock(name=summary)
+        output.soul = {'summary': summary}
+        return output
+
+    @testing.gen_test
+    def test_watch(self):
+        monitor = api.TaskMonitor(jitter=0)
+        statuses = {
+            'a': [self._status('queued'), self._status('success: done')],
+            'b': [self._status('failed: oops')],
+        }
+
+        @gen.coroutine
+        def fetch(task):
+            raise gen.Return(statuses[task].pop(0))
+
+        a = monitor.watch('a', fetch, interval=0.01)
+        b = monitor.watch('b', fetch, interval=0.01)
+
+        (a_status, a_output), (b_status, b_output) = yield [a, b]
+        self.assertTrue(a_status)
+        self.assertEquals('success: done', a_output.soul['summary'])
+        self.assertFalse(b_status)
+        self.assertEquals(0, len(monitor))
+
+    @testing.gen_test
+    def test_watch_limits_batch_size(self):
+        monitor = api.TaskMonitor(batch=2, jitter=0)
+        in_flight = []
+        max_in_flight = []
+
+        @gen.coroutine
+        def fetch(task):
+            in_flight.append(task)
+            max_in_flight.append(len(in_flight))
+            yield gen.moment
+            in_flight.remove(task)
+            raise gen.Return(self._status('completed'))
+
+        yield [monitor.watch(i, fetch) for i in range(5)]
+        self.assertEquals(2, max(max_in_flight))
+
+    @testing.gen_test
+    def test_watch_raises(self):
+        monitor = api.TaskMonitor()
+
+        @gen.coroutine
+        def fetch(task):
+            raise api.RightScaleError('broken')
+
+        with self.assertRaises(api.RightScaleError):
+            yield monitor.watch('a', fetch)
+
+    @testing.gen_test
+    def test_watch_custom_check(self):
+        monitor = api.TaskMonitor(jitter=0)
+        counts = [3, 2, 0]
+
+        @gen.coroutine
+        def fetch(array):
+            raise gen.Return(counts.pop(0))
+
+        def check(count):
+            return True if count == 0 else None
+
+        status, output = yield monitor.watch(
+            'array', fetch, interval=0.01, expected=0, check=check)
+        self.assertTrue(status)
+        self.assertEquals(0, output)
+        self.assertEquals([], counts)
+
+    def test_next_delay(self):
+        monitor = api.TaskMonitor(backoff=2, max_interval=15, jitter=0)
+        entry = {'interval': 5, 'expected': 30, 'started': 1000,
+                 'deadline': None}
+
+        with mock.patch.object(api, 'time') as clock:
+            # Still within the expected runtime -- no backoff
+            clock.time.return_value = 1010
+            self.assertEquals(5, monitor._next_delay(entry))
+
+            # Running long -- back off, up to the max interval
+            clock.time.return_value = 1040
+            self.assertEquals(10, monitor._next_delay(entry))
+            self.assertEquals(15, monitor._next_delay(entry))
+            self.assertEquals(15, monitor._next_delay(entry))
+
+    def test_next_delay_jitter(self):
+        monitor = api.TaskMonitor(jitter=0.1)
+        entry = {'interval': 10, 'expected': 30, 'started': time.time(),
+                 'deadline': None}
+        for _ in range(20):
+            delay = monitor._next_delay(entry)
+            self.assertTrue(9 <= delay <= 11)
+
+    def test_next_delay_deadline(self):
+        monitor = api.TaskMonitor(jitter=0)
+        entry = {'interval': 10, 'expected': 30, 'started': 1000,
+                 'deadline': 1004}
+
+        with mock.patch.object(api, 'time') as clock:
+            clock.time.return_value = 1001
+            self.assertEquals(3, monitor._next_delay(entry))
+            clock.time.return_value = 1005
+            self.assertEquals(0, monitor._next_delay(entry))
+
+    @testing.gen_test
+    def test_slow_poll_does_not_stall_others(self):
+        monitor = api.TaskMonitor(batch=2, jitter=0)
+        slow = concurrent.Future()
+        fast = [self._status('queued')] * 3 + [self._status('completed')]
+
+        def fetch(task):
+            if task == 'slow':
+                return slow
+            return helper.tornado_value(fast.pop(0))
+
+        slow_watch = monitor.watch('slow', fetch, interval=0.01)
+        status, _ = yield monitor.watch('fast', fetch, interval=0.01)
+
+        # 'fast' was polled four times while 'slow' hung on its first poll
+        self.assertTrue(status)
+        self.assertEquals([], fast)
+        self.assertFalse(slow_watch.done())
+
+        slow.set_result(self._status('completed'))
+        status, _ = yield slow_watch
+        self.assertTrue(status)
+
+    @testing.gen_test
+    def test_watch_timeout(self):
+        monitor = api.TaskMonitor(jitter=0)
+        fetch = mock.Mock(
+            side_effect=lambda task: helper.tornado_value(
+                self._status('queued')))
+
+        with self.assertRaises(gen.TimeoutError):
+            yield monitor.watch('a', fetch, interval=0.01, timeout=0.03)
+
+        polls = fetch.call_count
+        yield gen.sleep(0.05)
+        self.assertEquals(polls, fetch.call_count)
+        self.assertEquals(0, len(monitor))
+
+    @testing.gen_test
+    def test_unwatch(self):
+        monitor = api.TaskMonitor(jitter=0)
+        fetch = mock.Mock(
+            side_effect=lambda task: helper.tornado_value(
+                self._status('queued')))
+
+        future = monitor.watch('a', fetch, interval=0.01)
+        yield gen.sleep(0.03)
+        monitor.unwatch(future)
+        with self.assertRaises(gen.TimeoutError):
+            yield future
+
+        # Dropped from the schedule once it comes up again
+        yield gen.sleep(0.03)
+        polls = fetch.call_count
+        yield gen.sleep(0.03)
+        self.assertEquals(polls, fetch.call_count)
+        self.assertEquals(0, len(monitor))
+
+        # Unwatching a finished task is a no-op
+        monitor.unwatch(future)
+
+    @testing.gen_test
+    def test_unwatch_during_poll(self):
+        monitor = api.TaskMonitor(jitter=0)
+        polls = [concurrent.Future(), concurrent.Future()]
+        in_flight = polls[0]
+        future = monitor.watch('a', lambda task: polls.pop(0), interval=0)
+        yield gen.moment
+        monitor.unwatch(future)
+
+        # The poll that was in flight is ignored, and not repeated
+        in_flight.set_result(self._status('queued'))
+        yield gen.sleep(0.01)
+        with self.assertRaises(gen.TimeoutError):
+            yield future
+        self.assertEquals(1, len(polls))
+
+    def test_get_task_monitor(self):
+        self.assertIs(api.get_task_monitor(), api.get_task_monitor())
+
+
+class TestLookupCache(testing.AsyncTestCase):
+
+    def setUp(self, *args, **kwargs):
+        super(TestLookupCache, self).setUp()
+        api.reset_sessions()
+        self.client = api.RightScale('test')
+        self.mock_client = mock.MagicMock()
+        self.client._client = self.mock_client
+
+    @testing.gen_test
+    def test_get_coalesces_in_flight(self):
+        cache = api.LookupCache()
+        future = concurrent.Future()
+        fetch = mock.Mock(return_value=future)
+
+        first = cache.get(('/api/x', 'a'), fetch)
+        second = cache.get(('/api/x', 'a'), fetch)
+        self.assertEquals(fetch.call_count, 1)
+
+        future.set_result('result')
+        ret = yield [first, second]
+        self.assertEquals(['result', 'result'], ret)
+
+    @testing.gen_test
+    def test_get_coalesces_failures(self):
+        cache = api.LookupCache()
+        future = concurrent.Future()
+        first = cache.get(('/api/x', 'a'), lambda: future)
+        second = cache.get(('/api/x', 'a'), lambda: future)
+
+        future.set_exception(api.RightScaleError())
+        for f in (first, second):
+            with self.assertRaises(api.RightScaleError):
+                yield f
+
+    @testing.gen_test
+    def test_get_returns_copies(self):
+        cache = api.LookupCache()
+        res = api.rightscale.rightscale.Resource(
+            soul={'name': 'array', 'tags': ['a']}, path='/api/x/1')
+
+        def fetch():
+            return helper.tornado_value([res])
+
+        first = yield cache.get(('/api/x', 'a'), fetch)
+        first[0].soul['tags'].append('b')
+        first.append('junk')
+
+        second = yield cache.get(('/api/x', 'a'), fetch)
+        self.assertEquals(1, len(second))
+        self.assertEquals(['a'], second[0].soul['tags'])
+        self.assertEquals('/api/x/1', second[0].path)
+        self.assertIsNot(first[0], second[0])
+
+    def test_get_forgets_empty_and_failed_lookups(self):
+        cache = api.LookupCache()
+        for result in ([], None):
+            cache.get(('/api/x', 'a'), lambda: helper.tornado_value(result))
+            self.assertEquals(0, len(cache))
+
+        failed = concurrent.Future()
+        failed.set_exception(api.RightScaleError())
+        cache.get(('/api/x', 'a'), lambda: failed)
+        self.assertEquals(0, len(cache))
+
+    def test_invalidate(self):
+        cache = api.LookupCache()
+        cache.get(('/api/server_arrays', 'a'),
+                  lambda: helper.tornado_value('a'))
+        cache.get(('/api/server_templates', 'b'),
+                  lambda: helper.tornado_value('b'))
+
+        cache.invalidate('/api/server_arrays/123')
+        self.assertEquals(1, len(cache))
+        cache.invalidate('/api/server_template')
+        self.assertEquals(1, len(cache))
+        cache.invalidate('/api/server_templates')
+        self.assertEquals(0, len(cache))
+
+    def test_invalidate_collection_object(self):
+        # Lookups on collections that have no path can't be matched against
+        # the changed path, so any change drops them.
+        cache = api.LookupCache()
+        cache.get((object(), 'a'), lambda: helper.tornado_value('a'))
+
+        cache.invalidate('/api/server_arrays/1')
+        self.assertEquals(0, len(cache))
+
+    def test_invalidate_nested_collection(self):
+        cache = api.LookupCache()
+        cache.get(('/api/alert_specs', 'a'),
+                  lambda: helper.tornado_value('a'))
+
+        cache.invalidate('/api/server_templates/1/alert_specs/2')
+        self.assertEquals(0, len(cache))
+
+    @testing.gen_test
+    def test_find_server_arrays_cached(self):
+        array = mock.MagicMock(name='array')
+        array.soul = {'name': 'array'}
+        with mock.patch.object(api.rightscale_util, 'find_by_name') as u_mock:
+            u_mock.return_value = array
+            ret = yield [self.client.find_server_arrays('array'),
+                         self.client.find_server_arrays('array')]
+            ret.append((yield api.RightScale('test').find_server_arrays(
+                'array')))
+            self.assertEquals([array, array, array], ret)
+            self.assertEquals(u_mock.call_count, 1)
+
+            # Other searches are not
+            yield self.client.find_server_arrays('array', exact=False)
+            self.assertEquals(u_mock.call_count, 2)
+
+    @testing.gen_test
+    def test_find_by_name_and_keys_cached_by_path(self):
+        # Every access to a python-rightscale collection returns a new object
+        found = mock.MagicMock(name='spec')
+        found.soul = {'name': 'spec'}
+        index = mock.MagicMock(name='index', return_value=[found])
+        collections = []
+        for _ in range(2):
+            collection = mock.MagicMock(name='alert_specs')
+            collection.path = '/api/alert_specs'
+            collection.index = index
+            collections.append(collection)
+
+        for collection in collections:
+            ret = yield self.client.find_by_name_and_keys(
+                collection, exact=True, name='spec', subject_href='/a/1')
+            self.assertEquals(found, ret)
+        self.assertEquals(1, index.call_count)
+        self.assertEquals(1, len(self.client._cache))
+
+    @testing.gen_test
+    def test_mutations_invalidate(self):
+        array = mock.MagicMock(name='array')
+        array.soul = {'name': 'array'}
+        array.path = '/api/server_arrays/1'
+        script = mock.MagicMock(name='script')
+        with mock.patch.object(api.rightscale_util, 'find_by_name') as u_mock:
+            u_mock.side_effect = lambda coll, name, exact: (
+                array if coll is self.mock_client.server_arrays else script)
+            yield self.client.find_server_arrays('array')
+            yield self.client.find_right_script('script')
+            self.assertEquals(2, len(self.client._cache))
+
+            # Updating an array only drops the array lookups
+            yield self.client.update(array, {})
+            self.assertEquals(1, len(self.client._cache))
+
+            # A GET doesn't change anything, a POST might
+            yield self.client.find_server_arrays('array')
+            self.mock_client.client.get.return_value.json.return_value = {}
+            self.mock_client.client.get.return_value.headers = {}
+            yield self.client.make_generic_request('/api/right_scripts/1')
+            self.assertEquals(2, len(self.client._cache))
+            self.mock_client.client.post.return_value = (
+                self.mock_client.client.get.return_value)
+            yield self.client.make_generic_request(
+                '/api/right_scripts/1/commit', post={})
+            self.assertEquals(1, len(self.client._cache))
+
+            yield self.client.clone_server_array(array)
+            self.assertEquals(0, len(self.client._cache))
+
+    @testing.gen_test
+    def test_launch_terminate_and_tags_invalidate(self):
+        array = mock.MagicMock(name='array')
+        array.soul = {'name': 'array'}
+        array.path = '/api/server_arrays/1'
+        self.client._tags = mock.MagicMock(name='tags')
+        self.client._tags.add.return_value = helper.tornado_value()
+        self.client._tags.delete.return_value = helper.tornado_value()
+        mutations = [
+            lambda: self.client.launch_server_array(array),
+            lambda: self.client.terminate_server_array_instances(array),
+            lambda: self.client.add_resource_tags(array, ['x']),
+            lambda: self.client.delete_resource_tags(array, ['x']),
+        ]
+
+        with mock.patch.object(api.rightscale_util, 'find_by_name') as u_mock:
+            u_mock.return_value = array
+            for mutation in mutations:
+                yield self.client.find_server_arrays('array')
+                self.assertEquals(1, len(self.client._cache))
+                yield mutation()
+                self.assertEquals(0, len(self.client._cache))
+
+
+class TestTagBatcher(testing.AsyncTestCase):
+
+    def setUp(self, *args, **kwargs):
+        super(TestTagBatcher, self).setUp()
+        self.batcher = api.TagBatcher(window=0.001, size=2)
+        self.client = mock.MagicMock(name='client')
+
+    def _tags(self, href, *tags):
+        res = mock.MagicMock(name=href)
+        res.soul = {'tags': [{'name': t} for t in tags],
+                    'links': [{'rel': 'resource', 'href': href}]}
+        return res
+
+    @testing.gen_test
+    def test_get_batched(self):
+        self.client.tags.by_resource.return_value = [
+            self._tags('/a', 'x'), self._tags('/b', 'y', 'z')]
+
+        ret = yield [self.batcher.get(self.client, '/a'),
+                     self.batcher.get(self.client, '/b'),
+                     self.batcher.get(self.client, '/a')]
+
+        self.assertEquals([['x'], ['y', 'z'], ['x']], ret)
+        self.client.tags.by_resource.assert_called_once_with(params=[
+            ('resource_hrefs[]', '/a'), ('resource_hrefs[]', '/b')])
+
+    @testing.gen_test
+    def test_get_missing_resource(self):
+        self.client.tags.by_resource.return_value = [self._tags('/a', 'x')]
+        ret = yield [self.batcher.get(self.client, '/a'),
+                     self.batcher.get(self.client, '/b')]
+        self.assertEquals([['x'], []], ret)
+
+    @testing.gen_test
+    def test_writes_grouped_by_tags(self):
+        yield [self.batcher.add(self.client, '/a', ['x']),
+               self.batcher.add(self.client, '/b', ['y']),
+               self.batcher.add(self.client, '/c', ['x']),
+               self.batcher.add(self.client, '/d', ['x'])]
+
+        # /a and /c share a call, /d spills over the batch size
+        self.client.tags.multi_add.assert_has_calls([
+            mock.call(params=[('resource_hrefs[]', '/a'),
+                              ('resource_hrefs[]', '/c'),
+                              ('tags[]', 'x')]),
+            mock.call(params=[('resource_hrefs[]', '/b'),
+                              ('tags[]', 'y')]),
+            mock.call(params=[('resource_hrefs[]', '/d'),
+                              ('tags[]', 'x')]),
+        ], any_order=True)
+        # call_count isn't thread safe, the list is
+        self.assertEquals(3, len(self.client.tags.multi_add.call_args_list))
+
+    def test_batches_keep_order_across_kinds(self):
+        pending = [
+            ('multi_add', self.client, '/a', ('x',), None),
+            ('multi_delete', self.client, '/a', ('x',), None),
+            ('multi_add', self.client, '/b', ('x',), None),
+        ]
+        phases = self.batcher._batches(pending)
+        self.assertEquals(3, len(phases))
+        self.assertEquals([[pending[0]]], phases[0])
+        self.assertEquals([[pending[1]]], phases[1])
+        self.assertEquals([[pending[2]]], phases[2])
+
+    @testing.gen_test
+    def test_flush_errors_raised_to_every_caller(self):
+        futures = [self.batcher.add(self.client, '/a', ['x']),
+                   self.batcher.get(self.client, '/b')]
+        with mock.patch.object(self.batcher, '_batches') as batches:
+            batches.side_effect = ValueError('bad')
+            for future in futures:
+                with self.assertRaises(ValueError):
+                    yield future
+
+        # The batcher keeps working afterwards
+        yield self.batcher.add(self.client, '/a', ['x'])
+
+    @testing.gen_test
+    def test_errors_raised_to_every_caller(self):
+        self.client.tags.multi_delete.side_effect = ValueError('bad')
+        futures = [self.batcher.delete(self.client, '/a', ['x']),
+                   self.batcher.delete(self.client, '/b', ['x'])]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                yield future
@@ -1,9 +1,11 @@
 import logging
 import mock
 
+from tornado import gen
 from tornado import testing
 
 from kingpin.actors import exceptions
+from kingpin.actors.rightscale import api
 from kingpin.actors.rightscale import base
 from kingpin.actors.rightscale import mci
 from kingpin.actors.test import helper
@@ -11,6 +13,35 @@ from kingpin.actors.test import helper
 log = logging.getLogger(__name__)
 
 
+class FakeCollection(object):
+
+    """A python-rightscale collection -- a new one on every access."""
+
+    def __init__(self, path, calls):
+        self.path = path
+        self._calls = calls
+
+    def index(self, params):
+        self._calls.append(self.path)
+        resource = mock.MagicMock(name=self.path)
+        resource.href = resource.path = '%s/1' % self.path
+        resource.images = FakeCollection(resource.path + '/images',
+                                         self._calls)
+        resource.instance_types = FakeCollection(
+            resource.path + '/instance_types', self._calls)
+        return [resource]
+
+
+class FakeRightScaleClient(object):
+
+    def __init__(self):
+        self.calls = []
+
+    @property
+    def clouds(self):
+        return FakeCollection('/api/clouds', self.calls)
+
+
 class TestMCIBaseActor(testing.AsyncTestCase):
 
     def setUp(self, *args, **kwargs):
@@ -125,6 +156,21 @@ class TestMCIBaseActor(testing.AsyncTestCase):
         with self.assertRaises(exceptions.InvalidOptions):
             yield self.actor._get_mci_setting_def(self._images[0])
 
+    @testing.gen_test
+    def test_get_mci_setting_def_looks_up_cloud_once(self):
+        api.reset_sessions()
+        self.actor._client = api.RightScale('unittest')
+        self.actor._client._client = FakeRightScaleClient()
+
+        yield [self.actor._get_mci_setting_def(
+            {'cloud': 'cloudA', 'image': image, 'instance_type': 'm1.small'})
+            for image in ('ami-A', 'ami-B')]
+
+        self.assertEquals(
+            ['/api/clouds', '/api/clouds/1/images',
+             '/api/clouds/1/images', '/api/clouds/1/instance_types'],
+            sorted(self.actor._client._client.calls))
+
     @testing.gen_test
     def test_get_mci(self):
         mci = mock.MagicMock(name='mci')
@@ -487,6 +533,64 @@ class TestMCIActor(testing.AsyncTestCase):
             mock.call(mci_setting_c)
         ])
 
+    @testing.gen_test
+    def test_ensure_settings_forces_user_data_when_unchanged(self):
+        mci_obj = mock.MagicMock(name='mci')
+
+        # mci_setting_a already matches the desired settings
+        mci_setting_a = mock.MagicMock(name='mci_setting_a')
+        mci_setting_a.links = {
+            'cloud': '/api/clouds/A',
+            'image': '/api/clouds/A/images/abc',
+            'instance_type': '/api/clouds/A/instance_types/abc'}
+        self.client_mock.show.return_value = helper.tornado_value(
+            [mci_setting_a])
+        self.actor._get_mci_setting_def = helper.mock_tornado(
+            self.clouda_href_tuples)
+        self.actor._options['images'] = self._images[:1]
+        self.client_mock.update.return_value = helper.tornado_value(None)
+
+        yield self.actor._ensure_settings(mci_obj)
+
+        # Only the user_data is force-set, and the MCI isn't marked changed
+        self.client_mock.update.assert_called_once_with(
+            mci_setting_a, self.clouda_href_tuples)
+        self.assertFalse(self.actor.changed)
+
+    @testing.gen_test
+    def test_ensure_settings_bounded_concurrency(self):
+        mci_obj = mock.MagicMock(name='mci')
+        self.client_mock.show.return_value = helper.tornado_value([])
+
+        images = []
+        defs = []
+        for i in range(6):
+            images.append({'cloud': 'cloud%s' % i, 'image': 'ami',
+                           'instance_type': 'm1.small'})
+            defs.append(helper.tornado_value([
+                ('multi_cloud_image_setting[cloud_href]',
+                 '/api/clouds/%s' % i)]))
+        self.actor._options['images'] = images
+        self.actor._get_mci_setting_def = mock.MagicMock()
+        self.actor._get_mci_setting_def.side_effect = defs
+
+        in_flight = []
+        max_in_flight = []
+
+        @gen.coroutine
+        def create_resource(collection, params):
+            in_flight.append(params)
+            max_in_flight.append(len(in_flight))
+            yield gen.moment
+            in_flight.remove(params)
+        self.client_mock.create_resource = create_resource
+
+        with mock.patch.object(mci.rs_settings, 'MCI_SETTING_CONCURRENCY', 2):
+            yield self.actor._ensure_settings(mci_obj)
+
+        self.assertEquals(6, len(max_in_flight))
+        self.assertEquals(2, max(max_in_flight))
+
     @testing.gen_test
     def test_commit(self):
         mci = mock.MagicMock(name='mci')
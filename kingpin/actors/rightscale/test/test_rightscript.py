@@ -1,6 +1,12 @@
+import json
 import logging
+import os
+import tempfile
+
 import mock
 
+from tornado import concurrent
+from tornado import gen
 from tornado import testing
 
 from kingpin.actors import exceptions
@@ -32,6 +38,10 @@ class TestRightScript(testing.AsyncTestCase):
         self.client_mock = mock.MagicMock()
         self.actor._client = self.client_mock
 
+        digests = mock.patch.dict(rightscript.SOURCE_DIGESTS, clear=True)
+        digests.start()
+        self.addCleanup(digests.stop)
+
     def test_read_source(self):
         # Should work fine
         ret = self.actor._read_source()
@@ -85,6 +95,117 @@ class TestRightScript(testing.AsyncTestCase):
         self.assertEquals(None, self.actor.script)
         self.assertEquals(None, self.actor.source)
 
+    @testing.gen_test
+    def test_precache_cached_digest(self):
+        fake_script = mock.MagicMock(name='FakeScript')
+        fake_script.href = '/api/right_scripts/1'
+        fake_script.soul = {'name': 'FakeScript', 'revision': 3}
+        self.client_mock.find_by_name_and_keys.side_effect = [
+            helper.tornado_value(fake_script),
+            helper.tornado_value(fake_script)]
+        self.client_mock.make_generic_request.side_effect = [
+            helper.tornado_value('echo script1\n')]
+
+        # The first lookup downloads the source and remembers its digest
+        yield self.actor._precache()
+        self.assertEquals('echo script1\n', self.actor.source)
+        self.assertEquals(
+            rightscript.source_digest('echo script1\n'),
+            rightscript.SOURCE_DIGESTS['/api/right_scripts/1|3|None'])
+
+        # The second one skips the download, and still compares by digest
+        yield self.actor._precache()
+        self.assertEquals(None, self.actor.source)
+        self.assertEquals(
+            1, self.client_mock.make_generic_request.call_count)
+        ret = yield self.actor._compare_source()
+        self.assertTrue(ret)
+
+    @testing.gen_test
+    def test_precache_head_revision_not_cached(self):
+        fake_script = mock.MagicMock(name='FakeScript')
+        fake_script.href = '/api/right_scripts/1'
+        fake_script.soul = {'name': 'FakeScript', 'revision': 0}
+        self.client_mock.find_by_name_and_keys.side_effect = [
+            helper.tornado_value(fake_script)]
+        self.client_mock.make_generic_request.side_effect = [
+            helper.tornado_value('test script')]
+        yield self.actor._precache()
+        self.assertEquals({}, rightscript.SOURCE_DIGESTS)
+
+    @testing.gen_test
+    def test_compare_source_by_digest(self):
+        self.actor.source = None
+        self.actor.source_digest = rightscript.source_digest('other')
+        ret = yield self.actor._compare_source()
+        self.assertFalse(ret)
+
+        self.actor.source_digest = rightscript.source_digest(
+            'echo script1\n')
+        ret = yield self.actor._compare_source()
+        self.assertTrue(ret)
+
+    def test_digest_cache_file(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, tmpdir)
+        path = os.path.join(tmpdir, 'cache')
+        self.addCleanup(os.remove, path)
+
+        with mock.patch.object(rightscript.settings,
+                               'RIGHTSCRIPT_DIGEST_CACHE', path):
+            rightscript.SOURCE_DIGESTS['a|1|None'] = 'abc'
+            rightscript._save_digests()
+            self.assertEquals({'a|1|None': 'abc'}, json.load(open(path)))
+
+            rightscript.SOURCE_DIGESTS.clear()
+            with mock.patch.object(rightscript, '_digests_loaded', False):
+                rightscript._load_digests()
+            self.assertEquals({'a|1|None': 'abc'}, rightscript.SOURCE_DIGESTS)
+
+            # Nothing but the cache itself is left behind
+            self.assertEquals(['cache'], os.listdir(tmpdir))
+
+    def test_source_digest_unicode(self):
+        self.assertEquals(rightscript.source_digest('caf\xc3\xa9'),
+                          rightscript.source_digest(u'caf\xe9'))
+
+    def test_load_digests_unreadable(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, tmpdir)
+        missing = os.path.join(tmpdir, 'missing')
+        fd, garbage = tempfile.mkstemp(dir=tmpdir)
+        os.write(fd, 'not json')
+        os.close(fd)
+        self.addCleanup(os.remove, garbage)
+
+        for path in (missing, garbage):
+            with mock.patch.object(rightscript.settings,
+                                   'RIGHTSCRIPT_DIGEST_CACHE', path):
+                with mock.patch.object(rightscript, '_digests_loaded', False):
+                    rightscript._load_digests()
+            self.assertEquals({}, rightscript.SOURCE_DIGESTS)
+
+    def test_save_digests_unwritable(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, tmpdir)
+        rightscript.SOURCE_DIGESTS['a|1|None'] = 'abc'
+
+        # The directory can't be written to at all
+        path = os.path.join(tmpdir, 'missing', 'cache')
+        with mock.patch.object(rightscript.settings,
+                               'RIGHTSCRIPT_DIGEST_CACHE', path):
+            rightscript._save_digests()
+        self.assertEquals([], os.listdir(tmpdir))
+
+        # The temporary file is written, but can't replace the cache
+        path = os.path.join(tmpdir, 'cache')
+        with mock.patch.object(rightscript.settings,
+                               'RIGHTSCRIPT_DIGEST_CACHE', path):
+            with mock.patch.object(rightscript.os, 'rename') as rename:
+                rename.side_effect = OSError('nope')
+                rightscript._save_digests()
+        self.assertEquals([], os.listdir(tmpdir))
+
     @testing.gen_test
     def test_set_state_absent_already_gone(self):
         self.actor.script = None
@@ -169,6 +290,22 @@ class TestRightScript(testing.AsyncTestCase):
                  ('right_script[description]', u'test description'),
                  ('right_script[name]', u'test-name')])])
 
+    @testing.gen_test
+    def test_update_params_once(self):
+        self.actor.script = mock.MagicMock(name='script')
+        updated = mock.MagicMock(name='updated')
+        updated.href = '/api/right_scripts/1'
+        updated.soul = {'revision': 0, 'updated_at': '2016/01/01'}
+        self.client_mock.update.return_value = helper.tornado_value(updated)
+
+        yield self.actor._set_source()
+        yield self.actor._set_description()
+        yield self.actor._set_packages()
+        self.assertEquals(1, self.client_mock.update.call_count)
+        self.assertEquals(
+            rightscript.source_digest('echo script1\n'),
+            rightscript.SOURCE_DIGESTS['/api/right_scripts/1|0|2016/01/01'])
+
     @testing.gen_test
     def test_commit(self):
         self.actor.script = mock.MagicMock(name='script')
@@ -177,12 +314,68 @@ class TestRightScript(testing.AsyncTestCase):
         self.client_mock.commit_resource.side_effect = [
             helper.tornado_value(commit_result)
         ]
+        commit_result.href = '/api/right_scripts/2'
+        self.client_mock.commit_resource.side_effect = [
+            helper.tornado_value(commit_result)
+        ]
         self.actor.log = mock.MagicMock(name='log')
         yield self.actor._commit()
         self.actor.log.assert_has_calls([
             mock.call.info('Committing a new revision'),
             mock.call.info('Committed revision 2')
         ])
+        self.assertEquals(
+            rightscript.source_digest('echo script1\n'),
+            rightscript.SOURCE_DIGESTS['/api/right_scripts/2|2|None'])
+
+    @testing.gen_test
+    def test_update_and_commit_concurrently(self):
+        # Nothing in the actor serializes the API calls, so every RightScript
+        # in a group.Async waits on RightScale at the same time.
+        updates = []
+        commits = []
+
+        def pending(calls):
+            def call(*args, **kwargs):
+                calls.append(concurrent.Future())
+                return calls[-1]
+            return call
+
+        self.client_mock.update.side_effect = pending(updates)
+        self.client_mock.commit_resource.side_effect = pending(commits)
+
+        actors = []
+        for i in range(3):
+            actor = rightscript.RightScript(options={
+                'name': 'script-%s' % i,
+                'commit': 'yeah',
+                'description': 'test description',
+                'packages': 'curl',
+                'source': 'examples/rightscale.rightscript/script1.sh',
+            })
+            actor._client = self.client_mock
+            actor._precache = helper.mock_tornado(None)
+            actor.script = mock.MagicMock(name='script-%s' % i)
+            actor.script.soul = {'description': 'old', 'packages': 'curl'}
+            actor.source = 'echo script1\n'
+            actors.append(actor)
+
+        executions = [a._execute() for a in actors]
+        while len(updates) < 3:
+            yield gen.moment
+        self.assertEquals(0, len(commits))
+
+        committed = mock.MagicMock(name='committed')
+        committed.soul = {'revision': 1}
+        for future, actor in zip(updates, actors):
+            future.set_result(actor.script)
+        while len(commits) < 3:
+            yield gen.moment
+        for future in commits:
+            future.set_result(committed)
+
+        yield executions
+        self.assertTrue(all(actor.changed for actor in actors))
 
     @testing.gen_test
     def test_execute_present(self):
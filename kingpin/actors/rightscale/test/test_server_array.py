@@ -6,10 +6,12 @@ from tornado import testing
 from tornado import gen
 import requests
 
+from kingpin import utils
 from kingpin.actors import exceptions
 from kingpin.actors.rightscale import api
 from kingpin.actors.rightscale import base
 from kingpin.actors.rightscale import server_array
+from kingpin.actors.rightscale import settings
 from kingpin.actors.test.helper import mock_tornado, tornado_value
 
 log = logging.getLogger(__name__)
@@ -489,6 +491,19 @@ class TestTerminateActor(testing.AsyncTestCase):
         self.assertEquals(get_func.call_count, 4)
         self.assertEquals(ret, None)
 
+    @testing.gen_test
+    def test_wait_until_empty_watch(self):
+        monitor = mock.MagicMock(name='monitor')
+        monitor.watch.return_value = tornado_value((True, []))
+        with mock.patch.object(api, 'get_task_monitor',
+                               return_value=monitor):
+            yield self.actor._wait_until_empty(mock.MagicMock())
+
+        kwargs = monitor.watch.call_args[1]
+        self.assertEquals(kwargs['expected'],
+                          settings.ARRAY_TERMINATE_EXPECTED)
+        self.assertEquals(kwargs['timeout'], self.actor._timeout)
+
     @testing.gen_test
     def test_wait_until_empty_dry(self):
         self.actor._dry = True
@@ -654,6 +669,46 @@ class TestLaunchActor(testing.AsyncTestCase):
         self.assertEquals(len(server_list), 0)
         self.assertEquals(ret, None)
 
+    @testing.gen_test
+    def test_wait_until_healthy_watch(self):
+        self.actor._options['count'] = 1
+        array_mock = mock.MagicMock(name='unittest')
+        array_mock.soul = {'name': 'unittest'}
+        monitor = mock.MagicMock(name='monitor')
+        monitor.watch.return_value = tornado_value((True, []))
+        with mock.patch.object(api, 'get_task_monitor',
+                               return_value=monitor):
+            yield self.actor._wait_until_healthy(array_mock)
+
+        # Launches that finish on time are checked without backing off
+        kwargs = monitor.watch.call_args[1]
+        self.assertEquals(kwargs['interval'], settings.ARRAY_POLL_INTERVAL)
+        self.assertEquals(kwargs['expected'], settings.ARRAY_LAUNCH_EXPECTED)
+        self.assertEquals(kwargs['timeout'], self.actor._timeout)
+
+    @testing.gen_test
+    def test_wait_until_healthy_time_to_operational(self):
+        self.actor._options['count'] = 2
+        array_mock = mock.MagicMock(name='unittest')
+        array_mock.soul = {'name': 'unittest'}
+
+        first = mock.MagicMock(name='first', href='/api/instances/1')
+        second = mock.MagicMock(name='second', href='/api/instances/2')
+        responses = ([], [first], [first, second])
+        get_func = self.client_mock.get_server_array_current_instances
+        get_func.side_effect = [tornado_value(r) for r in responses]
+
+        yield self.actor._wait_until_healthy(array_mock, sleep=0.01)
+        self.assertEquals(3, get_func.call_count)
+        get_func.assert_called_with(
+            array_mock, filters=['state==operational'])
+
+        times = self.actor.time_to_operational
+        self.assertEquals(
+            ['/api/instances/1', '/api/instances/2'], sorted(times))
+        self.assertTrue(
+            times['/api/instances/1'] <= times['/api/instances/2'])
+
     @testing.gen_test
     def test_wait_until_healthy_based_on_specific_count(self):
         # Set the 'count' option to 2 in the Actor
@@ -924,7 +979,8 @@ class TestExecuteActor(testing.AsyncTestCase):
                        'on instance: unit-test-instance'),
             sleep=5,
             loc_log=self.actor.log,
-            instance=mock_op_instance)
+            instance=mock_op_instance,
+            timeout=self.actor._timeout)
         self.assertEquals(ret, None)
 
         # Now mock out a failure of the script execution
@@ -941,6 +997,28 @@ class TestExecuteActor(testing.AsyncTestCase):
         with self.assertRaises(exceptions.RecoverableActorFailure):
             yield self.actor._execute_array(mock_array, 1)
 
+    @testing.gen_test
+    def test_execute_array_partial_failure(self):
+        mock_array = mock.MagicMock(name='array')
+        mock_op_instance = mock.MagicMock(name='mock_instance')
+        mock_op_instance.soul = {'state': 'operational',
+                                 'name': 'unit-test-instance'}
+        mock_task = mock.MagicMock(name='mock_task')
+
+        yi = tornado_value([mock_op_instance, mock_op_instance])
+        self.client_mock.get_server_array_current_instances.return_value = yi
+
+        error = api.PartialExecutionFailure(
+            '1 of 2 failures', tasks=[(mock_op_instance, mock_task)],
+            failures=[(mock_op_instance, api.RightScaleError())])
+        self.client_mock.run_executable_on_instances.side_effect = error
+        self.client_mock.wait_for_task = mock_tornado(True)
+
+        # The queued task is still waited on before the actor fails
+        with self.assertRaises(server_array.TaskExecutionFailed):
+            yield self.actor._execute_array(mock_array, 1)
+        self.assertEquals(self.client_mock.wait_for_task._call_count, 1)
+
     @testing.gen_test
     def test_execute_array_dry(self):
         self.actor._dry = True
@@ -951,6 +1029,198 @@ class TestExecuteActor(testing.AsyncTestCase):
         ret = yield self.actor._execute_array(mock_array, 1)
         self.assertEquals(ret, None)
 
+    def _batch_actor(self, **options):
+        opts = {'array': 'unittestarray', 'script': 'test_script'}
+        opts.update(options)
+        actor = server_array.Execute('Execute', opts)
+        actor._client = self.client_mock
+        return actor
+
+    def _instances(self, count, state='operational'):
+        instances = []
+        for i in range(count):
+            instance = mock.MagicMock(name='instance-%s' % i)
+            instance.soul = {'name': 'instance-%s' % i, 'state': state}
+            instance.links = {'self': '/instances/%s' % i}
+            instances.append(instance)
+        return instances
+
+    def test_batch_options(self):
+        with self.assertRaises(exceptions.InvalidOptions):
+            self._batch_actor(batch='10%', concurrency=2)
+        with self.assertRaises(exceptions.InvalidOptions):
+            self._batch_actor(batch='junk')
+        with self.assertRaises(exceptions.InvalidOptions):
+            self._batch_actor(batch='150%')
+        with self.assertRaises(exceptions.InvalidOptions):
+            self._batch_actor(batch=0)
+        with self.assertRaises(exceptions.InvalidOptions):
+            self._batch_actor(batch='2.5')
+        self._batch_actor(batch='2.5%')
+
+    def test_batch_size(self):
+        self.assertEquals(3, self._batch_actor(batch=3)._batch_size(10))
+        self.assertEquals(3, self._batch_actor(batch='25%')._batch_size(10))
+        self.assertEquals(1, self._batch_actor(batch='1%')._batch_size(10))
+
+    @testing.gen_test
+    def test_execute_in_batches(self):
+        actor = self._batch_actor(batch='40%')
+        mock_array = mock.MagicMock(name='array')
+        mock_array.soul = {'name': 'array'}
+        instances = self._instances(5)
+        actor._get_operational_instances = mock_tornado(instances)
+        actor._wait_until_batch_healthy = mock_tornado()
+
+        batches = []
+
+        @gen.coroutine
+        def exec_and_wait(name, inputs, instance, sleep):
+            batches.append(instance)
+            raise gen.Return(True)
+        actor._exec_and_wait = exec_and_wait
+
+        yield actor._execute_array_in_batches(mock_array, {})
+        self.assertEquals(instances, batches)
+        # 3 batches: 2, 2, 1
+        self.assertEquals(actor._wait_until_batch_healthy._call_count, 3)
+
+    @testing.gen_test
+    def test_execute_in_batches_pause(self):
+        actor = self._batch_actor(batch=2, batch_pause=30)
+        actor._get_operational_instances = mock_tornado(self._instances(5))
+        actor._wait_until_batch_healthy = mock_tornado()
+        actor._exec_and_wait = mock_tornado(True)
+
+        with mock.patch.object(utils, 'tornado_sleep') as sleep:
+            sleep.return_value = tornado_value(None)
+            yield actor._execute_array_in_batches(mock.MagicMock(), {})
+
+        # Paused between the 3 batches, but not before the first one
+        sleep.assert_has_calls([mock.call(30), mock.call(30)])
+        self.assertEquals(sleep.call_count, 2)
+
+    @testing.gen_test
+    def test_execute_in_batches_dry(self):
+        actor = self._batch_actor(batch=2)
+        actor._dry = True
+        actor._get_operational_instances = mock_tornado(self._instances(5))
+        actor._exec_and_wait = mock_tornado(True)
+
+        yield actor._execute_array_in_batches(mock.MagicMock(), {})
+        self.assertEquals(actor._exec_and_wait._call_count, 0)
+
+    @testing.gen_test
+    def test_execute_in_batches_failure_budget(self):
+        actor = self._batch_actor(batch=2, max_failures=1)
+        instances = self._instances(6)
+        actor._get_operational_instances = mock_tornado(instances)
+        actor._wait_until_batch_healthy = mock_tornado()
+
+        calls = []
+
+        @gen.coroutine
+        def exec_and_wait(name, inputs, instance, sleep):
+            calls.append(instance)
+            if instance in instances[1:4]:
+                raise api.ServerArrayException('broken')
+            raise gen.Return(True)
+        actor._exec_and_wait = exec_and_wait
+
+        # The second failure (in the second batch) exhausts the budget, so the
+        # third batch never starts.
+        with self.assertRaises(server_array.TaskExecutionFailed):
+            yield actor._execute_array_in_batches(mock.MagicMock(), {})
+        self.assertEquals(instances[:4], calls)
+
+    @testing.gen_test
+    def test_execute_batch_waits_for_started_executions(self):
+        actor = self._batch_actor(batch=3)
+        instances = self._instances(3)
+        finished = []
+
+        @gen.coroutine
+        def exec_and_wait(name, inputs, instance, sleep):
+            if instance is not instances[0]:
+                yield gen.moment
+            finished.append(instance)
+            raise gen.Return(instance is not instances[0])
+        actor._exec_and_wait = exec_and_wait
+
+        failures = yield actor._execute_batch(instances, {}, 0)
+        self.assertEquals(1, failures)
+        self.assertEquals(instances, finished)
+
+    @testing.gen_test
+    def test_execute_in_batches_within_budget(self):
+        actor = self._batch_actor(batch=2, max_failures=1)
+        instances = self._instances(4)
+        actor._get_operational_instances = mock_tornado(instances)
+        actor._wait_until_batch_healthy = mock_tornado()
+        actor._exec_and_wait = mock.MagicMock()
+        actor._exec_and_wait.side_effect = [
+            tornado_value(True), tornado_value(False),
+            tornado_value(True), tornado_value(True)]
+
+        yield actor._execute_array_in_batches(mock.MagicMock(), {})
+        self.assertEquals(actor._exec_and_wait.call_count, 4)
+
+    @testing.gen_test
+    def test_wait_until_batch_healthy(self):
+        actor = self._batch_actor(batch=2)
+        batch = self._instances(2)
+        booting = self._instances(2, state='booting')
+        operational = self._instances(3)
+
+        self.client_mock.get_server_array_current_instances.side_effect = [
+            tornado_value(booting[:1]),
+            tornado_value(operational)]
+
+        with mock.patch.object(utils, 'tornado_sleep') as sleep:
+            sleep.return_value = tornado_value(None)
+            yield actor._wait_until_batch_healthy([mock.MagicMock()], batch)
+        self.assertEquals(sleep.call_count, 1)
+
+    @testing.gen_test
+    def test_wait_until_batch_healthy_timeout(self):
+        actor = self._batch_actor(batch=2)
+        batch = self._instances(2)
+        booting = self._instances(2, state='booting')
+
+        self.client_mock.get_server_array_current_instances.side_effect = (
+            lambda *args, **kwargs: tornado_value(booting))
+
+        with mock.patch.object(utils, 'tornado_sleep') as sleep:
+            sleep.return_value = tornado_value(None)
+            with self.assertRaises(server_array.BatchNotHealthy):
+                yield actor._wait_until_batch_healthy(
+                    [mock.MagicMock()], batch, timeout=0)
+        self.assertEquals(sleep.call_count, 0)
+
+    @testing.gen_test
+    def test_wait_until_batch_healthy_timeout_setting(self):
+        actor = self._batch_actor(batch=2)
+        batch = self._instances(2)
+        booting = self._instances(2, state='booting')
+
+        self.client_mock.get_server_array_current_instances.side_effect = (
+            lambda *args, **kwargs: tornado_value(booting))
+
+        with mock.patch.object(settings, 'BATCH_HEALTHY_TIMEOUT', 0):
+            with self.assertRaises(server_array.BatchNotHealthy):
+                yield actor._wait_until_batch_healthy(
+                    [mock.MagicMock()], batch)
+
+    @testing.gen_test
+    def test_execute_batch_mode(self):
+        actor = self._batch_actor(batch=2)
+        mock_array = mock.MagicMock(name='array')
+        actor._find_server_arrays = mock_tornado(mock_array)
+        actor._execute_array_in_batches = mock_tornado()
+
+        yield actor._execute()
+        self.assertEquals(actor._execute_array_in_batches._call_count, 1)
+
     @testing.gen_test
     def test_execute_concurrent(self):
         mock_array = mock.MagicMock(name='array')
@@ -2,6 +2,7 @@ from tornado import testing
 import requests
 
 from kingpin.actors.rightscale import settings
+from kingpin.actors.support import summary
 
 
 class TestSettings(testing.AsyncTestCase):
@@ -17,3 +18,15 @@ class TestSettings(testing.AsyncTestCase):
         self.assertTrue(settings.is_retriable_exception(exc))
 
         self.assertFalse(settings.is_retriable_exception(Exception()))
+
+    def test_should_stop_retrying(self):
+        summary.reset()
+        self.addCleanup(summary.reset)
+
+        for attempt in range(1, settings.MAX_ATTEMPTS + 1):
+            stop = settings.should_stop_retrying(attempt, 0)
+            self.assertEquals(attempt == settings.MAX_ATTEMPTS, stop)
+
+        # The last failed attempt is not retried, so it isn't counted
+        retries = summary.get_summary()['services']['rightscale']['retries']
+        self.assertEquals(settings.MAX_ATTEMPTS - 1, retries)
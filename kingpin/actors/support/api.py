@@ -14,17 +14,20 @@
 """
 This package provides a quick way of creating custom API clients for JSON-based
 REST APIs. The majority of the work is in the creation of a _CONFIG dictionary
-for the class. This dictionary dynamically configures the object at
-instantiation time with the appropriate @gen.coroutine wrapped HTTP fetch
+for the class. The first time the class is used, this dictionary is compiled
+into a tree of classes with the appropriate @gen.coroutine wrapped HTTP fetch
 methods.
 
 See the documentation in docs/DEVELOPMENT.md for more details on how to use
 this package to create your own API client.
 """
 
+import collections
+import copy
 import logging
-import types
+import time
 import urllib
+import urlparse
 
 from tornado import gen
 from tornado import httpclient
@@ -33,12 +36,22 @@ import simplejson as json
 
 from kingpin import utils
 from kingpin.actors import exceptions
+from kingpin.actors.support import http_client
+from kingpin.actors.support import summary
+from kingpin.actors.support import tracing
 
 log = logging.getLogger(__name__)
 
 __author__ = 'Matt Wise <matt@nextdoor.com>'
 
 
+def _service_name(client, args):
+    """Returns the name a RestClient call is summarized under (its host)."""
+    if args and isinstance(args[0], basestring) and '://' in args[0]:
+        return urlparse.urlparse(args[0]).netloc
+    return client.__class__.__name__
+
+
 def _retry(*f_or_args, **options):
     """Coroutine-compatible Retry Decorator.
 
@@ -142,7 +155,7 @@ def _retry(*f_or_args, **options):
                         raise exception(error)
                     elif matched_exc and matched_exc[0] is None:
                         log.debug('Exception is retryable!')
-                        pass
+                        summary.record_retry(_service_name(self, args))
                     elif default_exc is not False:
                         raise default_exc(str(e))
                     elif default_exc is False:
@@ -174,7 +187,7 @@ def _retry(*f_or_args, **options):
 def create_http_method(name, http_method):
     """Creates the get/put/delete/post coroutined-method for a resource.
 
-    This method is called during the __init__ of a RestConsumer object. The
+    This method is called when a RestConsumer class is compiled. The
     method creates a custom method thats handles a GET, PUT, POST or DELETE
     through the Tornado HTTPClient class.
 
@@ -232,9 +245,11 @@ def create_method(name, config):
         # chain.
         merged_kwargs = dict(self._kwargs.items() + kwargs.items())
 
-        return self.__class__(
+        # Always instantiate through the class that owns the _CONFIG. The
+        # returned object is an instance of the compiled class for `config`.
+        return self._consumer_class(
             name=name,
-            config=self._attrs[name],
+            config=config,
             client=self._client,
             *args, **merged_kwargs)
 
@@ -242,37 +257,51 @@ def create_method(name, config):
     return method
 
 
+# (RestConsumer class, id(config)) -> (config, compiled class). The config is
+# kept in here so that its id() can never be re-used by another dict -- which
+# also means that every config that is compiled is referenced for the life of
+# the process. Normally those are the class _CONFIG and its sections, which
+# the class keeps alive anyway. Configs built on the fly and handed to a
+# RestConsumer(config=...) are kept too, so don't do that in a loop.
+_COMPILED_CONSUMERS = {}
+
+
 class RestConsumer(object):
 
     """An abstract object that self-defines its own API access methods.
 
-    At init time, this object reads its `_CONFIG` and pre-defines all of the
-    API access methods that have been described. It does not handle actual HTTP
-    calls directly, but is passed in a `client` object (anything that
-    subclasses the RestClient class) and leverages that for the actual web
-    calls.
+    The `_CONFIG` of the class is compiled (once per class) into a tree of
+    subclasses that carry all of the API access methods that have been
+    described. Creating a RestConsumer, or walking down to one of its
+    attributes, only binds a `client` and a path to one of these pre-built
+    classes. It does not handle actual HTTP calls directly, but is passed in a
+    `client` object (anything that subclasses the RestClient class) and
+    leverages that for the actual web calls.
     """
 
     _CONFIG = {}
     _ENDPOINT = None
 
-    def __init__(self, name=None, config=None, client=None, *args, **kwargs):
-        """Initialize the RestConsumer object.
+    # Set by _compile() on the generated classes: the class that owns the
+    # _CONFIG, and the settings of the endpoint that the class represents.
+    _consumer_class = None
+    _path_template = None
+    _path_has_tokens = False
+    _http_methods = None
+    _attrs = None
 
-        The generic RestConsumer object (with no parameters passed in) looks at
-        the self.__class__._CONFIG dictionary and dynamically generates access
-        methods for the various API methods.
+    def __new__(cls, name=None, config=None, client=None, *args, **kwargs):
+        consumer = cls._consumer_class or cls
+        compiled = consumer._compile(config or consumer._CONFIG)
+        return super(RestConsumer, cls).__new__(compiled)
 
-        The GET, PUT, POST and DELETE methods optionally listed in
-        CONFIG['http_methods'] represent the possible types of HTTP methods
-        that the CONFIG['path'] supports. For each one of these listed, a
-        @coroutine wrapped get/put/post/delete() method will be created in the
-        RestConsumer that knows how to make the HTTP request.
+    def __init__(self, name=None, config=None, client=None, *args, **kwargs):
+        """Initialize the RestConsumer object.
 
-        For each item listed in CONFIG['attrs'], an access method is created
-        that will dynamically create and return a new RestConsumer object thats
-        configured for this endpoint. These methods are not asynchronous, but
-        are non-blocking.
+        The generic RestConsumer object (with no parameters passed in) is built
+        from the self.__class__._CONFIG dictionary. Passing in a `config`
+        builds the object for that (sub) section of the configuration instead.
+        See _compile() for how the access methods are generated.
 
         Args:
             name: Name of the resource method (default: None)
@@ -281,14 +310,6 @@ class RestConsumer(object):
             client: <TBD>
             *args,**kwargs: <TBD>
         """
-        # If these aren't passed in, then get them from the class definition
-        name = name or self.__class__.__name__
-        config = config or self._CONFIG
-
-        # Get the basic options for this particular REST endpoint access object
-        self._path = config.get('path', None)
-        self._http_methods = config.get('http_methods', None)
-        self._attrs = config.get('attrs', None)
         self._kwargs = kwargs
 
         # If no client was supplied, then we
@@ -297,16 +318,9 @@ class RestConsumer(object):
         # Ensure that any tokens that need filling-in in the self._path setting
         # are pulled from the **kwargs passed into this init. This is used on
         # API paths like Hipchats '/v2/room/%(res)/...' URLs.
-        self._path = self._replace_path_tokens(self._path, kwargs)
-
-        # Create all of the methods based on the self._http_methods and
-        # self._attrs dict.
-        self._create_methods()
-        self._create_attrs()
-
-        # Log some things
-        log.debug('%s/%s initialized' %
-                  (self.__class__.__name__, self._client))
+        self._path = self._path_template
+        if self._path_has_tokens:
+            self._path = self._replace_path_tokens(self._path, kwargs)
 
     def __repr__(self):
         return '%s(%s)' % (self.__class__.__name__, self)
@@ -314,6 +328,60 @@ class RestConsumer(object):
     def __str__(self):
         return str(self._path)
 
+    @classmethod
+    def _compile(cls, config):
+        """Returns the class that implements a section of the _CONFIG.
+
+        The GET, PUT, POST and DELETE methods optionally listed in
+        config['http_methods'] represent the possible types of HTTP methods
+        that the config['path'] supports. For each one of these listed, a
+        @coroutine wrapped http_get/put/post/delete() method is created that
+        knows how to make the HTTP request.
+
+        For each item listed in config['attrs'], an access method is created
+        that will return a new RestConsumer object thats configured for this
+        endpoint. These methods are not asynchronous, but are non-blocking.
+
+        The generated class is a subclass of `cls` with the same name, and is
+        cached so that this work happens only once per class and config.
+
+        Args:
+            config: The dictionary object with the configuration for this API
+                    endpoint.
+
+        Returns:
+            A RestConsumer subclass.
+        """
+        key = (cls, id(config))
+        if key in _COMPILED_CONSUMERS:
+            return _COMPILED_CONSUMERS[key][1]
+
+        path = config.get('path', None)
+        http_methods = config.get('http_methods', None)
+        attrs = config.get('attrs', None)
+
+        members = {
+            '__module__': cls.__module__,
+            '_consumer_class': cls,
+            '_path_template': path,
+            '_path_has_tokens': bool(path and '%' in path),
+            '_http_methods': http_methods,
+            '_attrs': attrs,
+        }
+
+        for name in (http_methods or {}).keys():
+            full_method_name = 'http_%s' % name
+            members[full_method_name] = create_http_method(
+                full_method_name, name)
+
+        for name, attr_config in (attrs or {}).items():
+            members[name] = create_method(name, attr_config)
+
+        log.debug('Compiled %s(%s)' % (cls.__name__, path))
+        compiled = type(cls.__name__, (cls,), members)
+        _COMPILED_CONSUMERS[key] = (config, compiled)
+        return compiled
+
     def _replace_path_tokens(self, path, tokens):
         """Search and replace %xxx% with values from tokens.
 
@@ -327,9 +395,6 @@ class RestConsumer(object):
         Returns:
             path: A modified string
         """
-        if not path:
-            return
-
         try:
             path = utils.populate_with_tokens(path, tokens)
         except LookupError as e:
@@ -338,34 +403,121 @@ class RestConsumer(object):
 
         return path
 
-    def _create_methods(self):
-        """Create @gen.coroutine wrapped HTTP methods.
 
-        Iterates through the methods described in self._methods and creates
-        @gen.coroutine wrapped access methods that perform these actions.
+def _segments(url):
+    """Returns the '/' separated parts of a URL, without its arguments."""
+    return url.split('?')[0].rstrip('/').split('/')
+
+
+class ResponseCache(object):
+
+    """Size-bounded, short-lived cache of parsed GET responses.
+
+    Used (optionally) by the RestClient to avoid re-downloading the same
+    resource over and over within a single Kingpin run. Entries are keyed by
+    the full request URL (including its arguments) and the credentials the
+    request was made with, and expire after `ttl` seconds. Expired entries
+    that came with an `ETag` header are re-validated with an `If-None-Match`
+    request rather than re-downloaded. When more than `max_size` entries are
+    stored, the least recently used one is evicted.
+
+    A single ResponseCache can be shared by many RestClient objects.
+
+    Args:
+        ttl: (int/float) Seconds a response is served without asking the
+             remote API again.
+        max_size: (int) Maximum number of responses to keep.
+    """
+
+    def __init__(self, ttl=30, max_size=128):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'revalidated': 0,
+                       'evictions': 0, 'invalidations': 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, url, credentials=None):
+        """Returns the cache entry for `url`, expired or not.
+
+        Args:
+            url: The full request URL
+            credentials: Anything hashable that identifies who made the
+                         request (see RestClient._cache_credentials).
+
+        Returns:
+            A dict with `body`, `etag` and `expires` keys, or None.
         """
-        if not self._http_methods:
-            return
+        key = (url, credentials)
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
 
-        for name in self._http_methods.keys():
-            full_method_name = 'http_%s' % name
-            method = create_http_method(full_method_name, name)
-            setattr(self,
-                    full_method_name,
-                    types.MethodType(method, self, self.__class__))
+        # Re-insert the entry to mark it as the most recently used one
+        self._entries[key] = entry
+        return entry
 
-    def _create_attrs(self):
-        """Creates access methods to the attributes in self._attrs.
+    def fresh(self, entry):
+        """Returns True if the entry can be served without asking the API."""
+        return entry is not None and entry['expires'] > time.time()
 
-        Iterates through the attributes described in self._attrs and creates
-        access methods that return RestConsumer objects for those attributes.
+    def set(self, url, body, etag=None, credentials=None):
+        """Stores a parsed response body.
+
+        Args:
+            url: The full request URL
+            body: The parsed response body
+            etag: The ETag header returned with the response, if any.
+            credentials: Who made the request (see `get()`).
         """
-        if not self._attrs:
-            return
+        key = (url, credentials)
+        self._entries.pop(key, None)
+        self._entries[key] = {'body': body, 'etag': etag,
+                              'expires': time.time() + self.ttl}
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def refresh(self, entry):
+        """Extends the life of an entry that the API says is unchanged."""
+        entry['expires'] = time.time() + self.ttl
 
-        for name in self._attrs.keys():
-            method = create_method(name, self._attrs[name])
-            setattr(self, name, types.MethodType(method, self, self.__class__))
+    def invalidate(self, url):
+        """Drops every entry for the resource at `url` and its relatives.
+
+        A change to '/checks/123' drops '/checks' (the listing contains the
+        changed resource) as well as '/checks/123/results' -- but not
+        '/checks/1234'. Entries are dropped whoever's credentials they were
+        fetched with.
+
+        Args:
+            url: The URL of the resource that was modified.
+        """
+        changed = _segments(url)
+        for key in self._entries.keys():
+            cached = _segments(key[0])
+            shortest = min(len(changed), len(cached))
+            if changed[:shortest] == cached[:shortest]:
+                del self._entries[key]
+                self._stats['invalidations'] += 1
+
+    def record(self, stat):
+        """Increments one of the hit/miss/revalidated counters."""
+        self._stats[stat] += 1
+
+    def stats(self):
+        """Returns a copy of the cache statistics, including the hit rate."""
+        stats = dict(self._stats)
+        lookups = stats['hits'] + stats['revalidated'] + stats['misses']
+        stats['size'] = len(self._entries)
+        stats['hit_rate'] = 0.0
+        if lookups:
+            stats['hit_rate'] = (
+                stats['hits'] + stats['revalidated']) / float(lookups)
+        return stats
 
 
 class RestClient(object):
@@ -374,11 +526,17 @@ class RestClient(object):
     AsyncHTTPClient(), some convinience methods for URL escaping, and a single
     fetch() method that can handle GET/POST/PUT/DELETEs.
 
+    Unless a `client` is passed in, the shared connection-pooled client from
+    :py:mod:`kingpin.actors.support.http_client` is used.
+
     This code is nearly identical to the kingpin.actors.base.BaseHTTPActor
     class, but is not actor-specific.
 
     Args:
         headers: Headers to pass in on every HTTP request
+        cache: An optional ResponseCache object. When supplied, GET responses
+               are served from (and stored in) the cache, and any other
+               request invalidates the cached copies of that resource.
     """
 
     _EXCEPTIONS = {
@@ -397,10 +555,21 @@ class RestClient(object):
         }
     }
 
-    def __init__(self, client=None, headers=None):
-        self._client = client or httpclient.AsyncHTTPClient()
+    def __init__(self, client=None, headers=None, cache=None):
+        self._client = client or http_client.get_client()
         self._private_kwargs = ['auth_password']
         self.headers = headers
+        self._cache = cache
+
+    def _cache_credentials(self, auth_username, auth_password):
+        """Returns what sets one user's cached responses apart from another's.
+
+        The ResponseCache may be shared by RestClients that talk to the same
+        API with different accounts, so the headers (API keys, account
+        selectors...) and HTTP auth of a request are part of its cache key.
+        """
+        return (tuple(sorted((self.headers or {}).items())),
+                auth_username, auth_password)
 
     def _generate_escaped_url(self, url, args):
         """Takes in a dictionary of arguments and returns a URL line.
@@ -460,6 +629,22 @@ class RestClient(object):
         elif method in ('GET', 'DELETE') and params:
             url = self._generate_escaped_url(url, params)
 
+        # Serve GETs out of the cache if we can. If the cached copy is stale
+        # but came with an ETag, ask the server whether it has changed.
+        headers = self.headers
+        cached = None
+        credentials = self._cache_credentials(auth_username, auth_password)
+        if self._cache is not None and method == 'GET':
+            cached = self._cache.get(url, credentials)
+            if self._cache.fresh(cached):
+                log.debug('Serving %s from the response cache' % url)
+                self._cache.record('hits')
+                raise gen.Return(copy.deepcopy(cached['body']))
+
+            if cached and cached['etag']:
+                headers = dict(self.headers or {})
+                headers['If-None-Match'] = cached['etag']
+
         # Generate the full request URL and log out what we're doing...
         log.debug('Making %s request to %s. Data: %s' % (method, url, body))
 
@@ -468,7 +653,7 @@ class RestClient(object):
             url=url,
             method=method,
             body=body,
-            headers=self.headers,
+            headers=headers,
             auth_username=auth_username,
             auth_password=auth_password,
             follow_redirects=True,
@@ -479,16 +664,33 @@ class RestClient(object):
         # should be handled by the individual Actor that called this method.
         log.debug('HTTP Request: %s' % http_request)
         try:
-            http_response = yield self._client.fetch(http_request)
+            with tracing.span('fetch', cat='http', method=method,
+                              url=tracing.strip_url(url)):
+                http_response = yield self._client.fetch(http_request)
         except httpclient.HTTPError as e:
+            if e.code == 304 and cached:
+                log.debug('%s has not changed, using the cached copy' % url)
+                self._cache.record('revalidated')
+                self._cache.refresh(cached)
+                raise gen.Return(copy.deepcopy(cached['body']))
             log.critical('Request for %s failed: %s' % (url, e))
             raise
+        finally:
+            # Anything other than a GET may have changed the resource
+            if self._cache is not None and method != 'GET':
+                self._cache.invalidate(url)
         log.debug('HTTP Response: %s' % http_response.body)
 
         try:
             body = json.loads(http_response.body)
         except ValueError:
-            raise gen.Return(http_response.body)
+            body = http_response.body
+
+        if self._cache is not None and method == 'GET':
+            self._cache.record('misses')
+            self._cache.set(url, copy.deepcopy(body),
+                            etag=http_response.headers.get('Etag'),
+                            credentials=credentials)
 
         # Receive a successful return
         raise gen.Return(body)
@@ -0,0 +1,168 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Checkpoint journal for resuming failed Kingpin runs.
+
+When a journal is open (``deploy.py --journal FILE``), every actor that
+finishes its real (non-dry) run successfully appends a line to it, holding:
+
+* ``path``: the stable position of the actor in the actor tree -- the
+  index and description of the actor and of each of its parents, for example
+  ``0:Kingpin/0:main stage/1:stage 2``.
+* ``checksum``: a hash of the class and resolved options of the actor *and*
+  of its whole subtree.
+
+``deploy.py --resume FILE`` reads the journal back, and any actor whose path
+is in it with an unchanged checksum is skipped -- in the rehearsal as well as
+in the real run -- along with all of its children. Anything that failed, was
+edited in the script, or never ran is executed as usual, and the journal
+keeps growing so that the run can be resumed again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+# The open journal file, if any. See open_journal().
+_journal = [None]
+
+# Actor path -> checksum of every actor completed by a previous run
+_completed = {}
+
+# Orgchart actor id -> (path, subtree checksum). See register_orgchart().
+_actors = {}
+
+
+def checksum(actor_type, options):
+    """Returns a hash of an actor class name and its resolved options."""
+    data = json.dumps([actor_type, options], sort_keys=True, default=str)
+    return hashlib.sha256(data).hexdigest()
+
+
+def open_journal(path, resume=False):
+    """Starts journaling completed actors to a file.
+
+    Args:
+        path: Path of the journal file.
+        resume: Load the actors completed by the previous run(s) from the
+                journal and keep appending to it. Otherwise, the journal is
+                started afresh.
+    """
+    close_journal()
+
+    line = '\n'
+    if resume and os.path.exists(path):
+        with open(path) as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line is cut short if we were killed mid-write
+                    continue
+                _completed[entry['path']] = entry['checksum']
+        log.info('Resuming from %s: %s actors completed before.' %
+                 (path, len(_completed)))
+
+    _journal[0] = open(path, 'a' if resume else 'w')
+    if not line.endswith('\n'):
+        # Don't glue our first entry onto a cut short line
+        _journal[0].write('\n')
+
+
+def close_journal():
+    """Stops journaling, and forgets any previously completed actors."""
+    if _journal[0]:
+        _journal[0].close()
+    _journal[0] = None
+    _completed.clear()
+    _actors.clear()
+
+
+def get_paths(orgchart):
+    """Returns the stable path of every actor in an orgchart.
+
+    The path of an actor is built from the index (among its siblings) and
+    description of the actor and of each of its parents, for example
+    ``0:Kingpin/0:main stage/1:stage 2``. It is the same for the dry and the
+    real actor tree built from the same script.
+
+    Args:
+        orgchart: The list returned by BaseActor.get_orgchart()
+
+    Returns:
+        A dict of orgchart actor ids to their paths.
+    """
+    paths = {}
+    siblings = {}
+    # Parents always come before their children in an orgchart
+    for entry in orgchart:
+        parent = entry['parent_id'] if entry['parent_id'] in paths else None
+        index = siblings.get(parent, 0)
+        siblings[parent] = index + 1
+        prefix = paths[parent] + '/' if parent else ''
+        paths[entry['id']] = '%s%s:%s' % (prefix, index, entry['desc'])
+    return paths
+
+
+def register_orgchart(orgchart):
+    """Works out the path and subtree checksum of every actor in an orgchart.
+
+    Must be called after the actors are created, and before they execute.
+
+    Args:
+        orgchart: The list returned by BaseActor.get_orgchart()
+    """
+    if not _journal[0]:
+        return
+
+    paths = get_paths(orgchart)
+
+    # Children come after their parents, so walking the orgchart backwards
+    # hashes every subtree before its parent needs it.
+    sums = {}
+    for entry in reversed(orgchart):
+        children = sums.pop(entry['id'], [])
+        subtree = hashlib.sha256(
+            entry['checksum'] + ''.join(reversed(children))).hexdigest()
+        sums.setdefault(entry['parent_id'], []).append(subtree)
+        _actors[entry['id']] = (paths[entry['id']], subtree)
+
+
+def is_completed(actor):
+    """Whether a previous run completed the actor with the same checksum."""
+    if not _completed:
+        return False
+
+    path, subtree = _actors.get(str(id(actor)), (None, None))
+    return path is not None and _completed.get(path) == subtree
+
+
+def record(actor):
+    """Appends the actor to the journal as completed."""
+    if not _journal[0] or str(id(actor)) not in _actors:
+        return
+
+    path, subtree = _actors[str(id(actor))]
+    _journal[0].write(json.dumps(
+        {'path': path, 'checksum': subtree, 'time': time.time()}) + '\n')
+    # Make sure the entry survives the deploy being killed
+    _journal[0].flush()
+    os.fsync(_journal[0].fileno())
@@ -0,0 +1,191 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Shared, connection-pooled asynchronous HTTP client used by the
+:py:class:`~kingpin.actors.base.HTTPBaseActor` actors and the
+:py:class:`~kingpin.actors.support.api.RestClient`.
+
+Tornado hands out one ``AsyncHTTPClient`` per IOLoop. By default that is a
+``SimpleAsyncHTTPClient`` that allows 10 concurrent requests and opens a new
+(TLS) connection for every single one of them. This module configures the
+shared client once, preferring the libcurl based ``CurlAsyncHTTPClient`` (which
+keeps connections alive and re-uses them per host) when ``pycurl`` is
+installed, and raises the concurrency cap.
+
+**Environment Variables**
+
+:HTTP_MAX_CLIENTS:
+  Maximum number of concurrent HTTP requests (default: 50)
+
+:HTTP_USE_CURL:
+  Set to `false` to force the pure-python client even if `pycurl` is
+  installed (default: true)
+
+Every request made through :py:func:`get_client` is timed, and the statistics
+are aggregated per remote host. See :py:func:`get_host_stats`.
+"""
+
+import importlib
+import logging
+import os
+import time
+import urlparse
+
+from tornado import gen
+from tornado import httpclient
+
+from kingpin.actors.support import summary
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+MAX_CLIENTS = int(os.getenv('HTTP_MAX_CLIENTS', 50))
+USE_CURL = os.getenv('HTTP_USE_CURL', 'true').lower() not in (
+    'no', 'false', 'f', '0')
+
+CURL_CLIENT = 'tornado.curl_httpclient.CurlAsyncHTTPClient'
+
+# Whether or not AsyncHTTPClient.configure() has been called yet
+_configured = False
+
+# Host -> statistics dict for every request made through get_client()
+_host_stats = {}
+
+
+def configure(max_clients=None, use_curl=None):
+    """Configures the implementation used by tornado's AsyncHTTPClient.
+
+    Must be called before the first client is created on an IOLoop, because
+    tornado caches one client instance per IOLoop. This is called
+    automatically by get_client().
+
+    Args:
+        max_clients: Maximum number of concurrent requests (default:
+                     HTTP_MAX_CLIENTS)
+        use_curl: Use the CurlAsyncHTTPClient if pycurl is available
+                  (default: HTTP_USE_CURL)
+
+    Returns:
+        The name of the configured client implementation.
+    """
+    global _configured
+
+    if max_clients is None:
+        max_clients = MAX_CLIENTS
+    if use_curl is None:
+        use_curl = USE_CURL
+
+    impl = None
+    if use_curl:
+        try:
+            importlib.import_module('pycurl')
+            impl = CURL_CLIENT
+        except ImportError:
+            log.debug('pycurl is not installed, falling back to the '
+                      'SimpleAsyncHTTPClient')
+
+    httpclient.AsyncHTTPClient.configure(impl, max_clients=max_clients)
+    _configured = True
+
+    name = impl or 'tornado.simple_httpclient.SimpleAsyncHTTPClient'
+    log.debug('Configured %s with max_clients=%s' % (name, max_clients))
+    return name
+
+
+def get_client():
+    """Returns the shared asynchronous HTTP client for the current IOLoop.
+
+    Returns:
+        A TimedHTTPClient wrapping the shared AsyncHTTPClient.
+    """
+    if not _configured:
+        configure()
+
+    return TimedHTTPClient(httpclient.AsyncHTTPClient())
+
+
+def get_host_stats():
+    """Returns a copy of the per-host request statistics.
+
+    Returns:
+        A dict of host names to dicts with the keys `requests`, `errors`,
+        `total_time` and `max_time` (times in seconds).
+    """
+    return dict((host, dict(stats)) for host, stats in _host_stats.items())
+
+
+def reset_host_stats():
+    """Clears out all of the per-host request statistics."""
+    _host_stats.clear()
+
+
+def log_host_stats(logger=log):
+    """Logs a one-line summary of the per-host statistics for every host."""
+    for host, stats in sorted(get_host_stats().items()):
+        logger.debug(
+            'HTTP %s: %s requests, %s errors, %.3fs avg, %.3fs max' % (
+                host, stats['requests'], stats['errors'],
+                stats['total_time'] / stats['requests'], stats['max_time']))
+
+
+def _record(url, elapsed, error):
+    """Adds the results of a single request to the per-host statistics."""
+    host = urlparse.urlparse(url).netloc
+    stats = _host_stats.setdefault(
+        host, {'requests': 0, 'errors': 0, 'total_time': 0.0,
+               'max_time': 0.0})
+    stats['requests'] += 1
+    stats['total_time'] += elapsed
+    stats['max_time'] = max(stats['max_time'], elapsed)
+    if error:
+        stats['errors'] += 1
+
+    summary.record_call(host, elapsed, error=error)
+
+
+class TimedHTTPClient(object):
+
+    """Thin wrapper around an AsyncHTTPClient that times every request.
+
+    The recorded time includes any time the request spent queued behind the
+    `max_clients` limit, since that is the latency the caller actually sees.
+
+    Args:
+        client: The AsyncHTTPClient to send the requests through.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __repr__(self):
+        return 'TimedHTTPClient(%s)' % self._client.__class__.__name__
+
+    @gen.coroutine
+    def fetch(self, request, **kwargs):
+        """Executes a request and records how long it took.
+
+        Takes the same arguments as AsyncHTTPClient.fetch().
+        """
+        url = getattr(request, 'url', request)
+        start = time.time()
+        try:
+            response = yield self._client.fetch(request, **kwargs)
+        except Exception:
+            _record(url, time.time() - start, error=True)
+            raise
+
+        _record(url, time.time() - start, error=False)
+        raise gen.Return(response)
@@ -0,0 +1,166 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Read-through snapshot of resource state, shared by the rehearsal and the run.
+
+During the rehearsal, every
+:py:class:`~kingpin.actors.base.EnsurableBaseActor` reads the current state
+of its resource through its getters -- and the real run repeats every one of
+those reads moments later. When enabled (``deploy.py --snapshot-age
+SECONDS``), the values returned by the getters in the dry run are stored,
+keyed by the path of the actor in the actor tree (see
+:py:func:`~kingpin.actors.support.checkpoint.get_paths`) and the getter name.
+In the real run, a getter returns the stored value instead of reading it
+again, as long as:
+
+* the value is younger than ``SECONDS``, and
+* no setter has changed the resource yet during the real run. Resources are
+  identified by the actor module and its ``name`` option (or, for actors
+  without one, by the actor path), so an actor that changes a resource makes
+  the other actors managing it read it afresh.
+
+Every actor gets its own copy of a stored value, so that an actor changing
+what its getter returned can't change what the other actors see. Values that
+can't be copied are never stored.
+
+Changes made by actors that are not ensurable (or by anything outside of
+Kingpin) go unnoticed, which is why this is opt-in, and bounded in age.
+"""
+
+import copy
+import logging
+import time
+import types
+
+from tornado import gen
+
+from kingpin.actors.support import checkpoint
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+# Max age (in seconds) of a reusable read. Zero disables the snapshot.
+_max_age = [0]
+
+# Orgchart actor id -> path. See register_orgchart().
+_paths = {}
+
+# (actor path, getter name) -> (time of the read, value)
+_reads = {}
+
+# Resources changed by a setter in the real run. See resource_key().
+_mutated = set()
+
+_stats = {'reused': 0, 'read': 0}
+
+
+def enable(max_age):
+    """Starts recording and reusing reads younger than `max_age` seconds."""
+    reset()
+    _max_age[0] = max_age
+
+
+def disable():
+    _max_age[0] = 0
+
+
+def is_enabled():
+    return _max_age[0] > 0
+
+
+def reset():
+    """Throws away the snapshot and the orgchart information."""
+    _paths.clear()
+    _reads.clear()
+    _mutated.clear()
+    _stats.update(reused=0, read=0)
+
+
+def get_stats():
+    """Returns how many real run reads were `reused`, and how many `read`."""
+    return dict(_stats)
+
+
+def register_orgchart(orgchart):
+    """Records the path of every actor in an orgchart.
+
+    Must be called after the actors are created, and before they execute.
+
+    Args:
+        orgchart: The list returned by BaseActor.get_orgchart()
+    """
+    if is_enabled():
+        _paths.update(checkpoint.get_paths(orgchart))
+
+
+def resource_key(actor):
+    """Returns an identifier for the resource managed by an actor."""
+    if 'name' in actor.all_options:
+        return (actor.__module__, str(actor.option('name')))
+    return (actor.__module__, _paths.get(str(id(actor))))
+
+
+def mutated(actor):
+    """Marks the resource of an actor as changed by the real run."""
+    if is_enabled() and not actor._dry:
+        _mutated.add(resource_key(actor))
+
+
+def read_through(actor, name, getter):
+    """Wraps a getter of an actor so that it goes through the snapshot.
+
+    Args:
+        actor: The EnsurableBaseActor the getter belongs to.
+        name: Name of the getter method.
+        getter: The (bound) getter method.
+
+    Returns:
+        A method bound to `actor`, or the getter itself if it is wrapped
+        already.
+    """
+    if getattr(getter, '_snapshot_of', None):
+        return getter
+
+    @gen.coroutine
+    def read(self):
+        path = _paths.get(str(id(self)))
+        if path is None:
+            ret = yield getter()
+            raise gen.Return(ret)
+
+        key = (path, name)
+        if self._dry:
+            ret = yield getter()
+            try:
+                _reads[key] = (time.time(), copy.deepcopy(ret))
+            except Exception as e:
+                log.debug('Not storing %s() result: %s' % (name, e))
+            raise gen.Return(ret)
+
+        stored = _reads.get(key)
+        if (stored and time.time() - stored[0] <= _max_age[0] and
+                resource_key(self) not in _mutated):
+            _stats['reused'] += 1
+            self.log.debug('Reusing %s() result from the rehearsal' % name)
+            raise gen.Return(copy.deepcopy(stored[1]))
+
+        _stats['read'] += 1
+        ret = yield getter()
+        raise gen.Return(ret)
+
+    read.__name__ = name
+    read._snapshot_of = getter
+    return types.MethodType(read, actor)
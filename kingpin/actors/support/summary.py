@@ -0,0 +1,367 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+End-of-run statistics for Kingpin deployments.
+
+Two sets of numbers are collected throughout a run:
+
+* **Actors** -- the wall time of every
+  :py:meth:`~kingpin.actors.base.BaseActor.execute` call (and how many of
+  them failed), per actor class, and the external API calls, retries and
+  thread queueing time its actors caused. Dry runs are kept apart from the
+  real ones.
+* **Services** -- the external APIs we talk to (`aws`, `rightscale`, and
+  every host reached through the shared HTTP client). For each of them: the
+  number of calls, errors and retries, how long the calls took and -- for the
+  thread-pool backed APIs -- how long they sat queued waiting for a thread.
+
+:py:func:`get_summary` reduces these to counts, totals and p50/p95/max
+latencies. deploy.py logs them at the end of a run -- at DEBUG level, unless
+``--summary`` is given, in which case they are logged at INFO and also
+written out as JSON.
+"""
+
+import collections
+import contextlib
+import functools
+import json
+import logging
+import math
+import threading
+import time
+
+from tornado import stack_context
+from tornado.concurrent import futures
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+_lock = threading.Lock()
+
+# Actor class name -> list of execute() times
+_actors = collections.defaultdict(list)
+
+# Actor class name -> number of execute() calls that raised
+_actor_errors = collections.defaultdict(int)
+
+# Actor class name -> API calls, retries and queueing times caused by its
+# actors. See attributed().
+_actor_calls = {}
+
+# Service name -> statistics dict. See _service().
+_services = {}
+
+# The actor class name that API calls made by this thread are attributed to
+_current = threading.local()
+
+
+def reset():
+    """Clears out all of the collected statistics."""
+    with _lock:
+        _actors.clear()
+        _actor_errors.clear()
+        _actor_calls.clear()
+        _services.clear()
+
+
+def _service(name):
+    if name not in _services:
+        _services[name] = {'calls': 0, 'errors': 0, 'retries': 0,
+                           'times': [], 'queued': []}
+    return _services[name]
+
+
+def _actor_name(actor):
+    name = actor.__class__.__name__
+    if actor._dry:
+        name = '%s (dry)' % name
+    return name
+
+
+def _actor_stats(name):
+    if name not in _actor_calls:
+        _actor_calls[name] = {'calls': 0, 'retries': 0, 'queued': []}
+    return _actor_calls[name]
+
+
+def current_actor():
+    """Returns the actor class name that API calls are attributed to."""
+    return getattr(_current, 'name', None)
+
+
+@contextlib.contextmanager
+def attributing(name):
+    """Attributes the API calls made by this thread to an actor class.
+
+    Args:
+        name: Actor class name (as returned by current_actor()), or None.
+    """
+    previous = current_actor()
+    _current.name = name
+    try:
+        yield
+    finally:
+        _current.name = previous
+
+
+def attributed(actor):
+    """Attributes the API calls made on behalf of an actor to its class.
+
+    Returns a StackContext: everything started inside of it -- coroutines,
+    callbacks, and work submitted to a TimedExecutor or timed_thread() --
+    is attributed to the actor, even after the `with` block is left. As with
+    any StackContext, don't `yield` inside of it.
+
+    Example:
+        >>> with summary.attributed(self):
+        ...     future = self._execute()
+        >>> yield future
+    """
+    return stack_context.StackContext(
+        functools.partial(attributing, _actor_name(actor)))
+
+
+def record_actor(actor, elapsed, error=False):
+    """Records the time a single actor's execute() took.
+
+    Args:
+        actor: The BaseActor object.
+        elapsed: Seconds the execute() call took.
+        error: Whether the execute() call raised.
+    """
+    name = _actor_name(actor)
+    with _lock:
+        _actors[name].append(elapsed)
+        if error:
+            _actor_errors[name] += 1
+
+
+def record_call(service, elapsed, error=False, actor=None):
+    """Records a single call made to an external service.
+
+    Args:
+        service: Name of the service.
+        elapsed: Seconds the call took.
+        error: Whether the call failed.
+        actor: Actor class name to attribute the call to (default: the
+            current_actor()).
+    """
+    actor = actor or current_actor()
+    with _lock:
+        stats = _service(service)
+        stats['calls'] += 1
+        stats['times'].append(elapsed)
+        if error:
+            stats['errors'] += 1
+        if actor:
+            _actor_stats(actor)['calls'] += 1
+
+
+def record_queued(service, elapsed):
+    """Records how long a call waited for a free thread."""
+    actor = current_actor()
+    with _lock:
+        _service(service)['queued'].append(elapsed)
+        if actor:
+            _actor_stats(actor)['queued'].append(elapsed)
+
+
+def record_retry(service):
+    """Records that a call to an external service is being retried.
+
+    Only call this when another attempt is really going to be made.
+    """
+    actor = current_actor()
+    with _lock:
+        _service(service)['retries'] += 1
+        if actor:
+            _actor_stats(actor)['retries'] += 1
+
+
+def percentile(values, pct):
+    """Returns the nearest-rank percentile of a list of numbers.
+
+    Args:
+        values: List of numbers
+        pct: The percentile to return (0-100)
+
+    Returns:
+        The percentile, or None if `values` is empty.
+    """
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(ordered))) - 1
+    return ordered[max(0, min(rank, len(ordered) - 1))]
+
+
+def _latencies(values, prefix=''):
+    return {
+        prefix + 'total': sum(values),
+        prefix + 'p50': percentile(values, 50),
+        prefix + 'p95': percentile(values, 95),
+        prefix + 'max': max(values) if values else None,
+    }
+
+
+def get_summary():
+    """Reduces the collected statistics into a JSON-friendly dict.
+
+    Returns:
+        A dict with an `actors` dict (actor class name -> count, error count
+        and latency statistics, plus the API calls, retries and queueing
+        statistics of its actors) and a `services` dict (service name ->
+        call, error and retry counts plus latency and queueing statistics).
+        Times are in seconds.
+    """
+    with _lock:
+        actors = dict((name, list(times)) for name, times in _actors.items())
+        errors = dict(_actor_errors)
+        calls = dict((name, dict(stats, queued=list(stats['queued'])))
+                     for name, stats in _actor_calls.items())
+        services = dict((name, dict(stats, times=list(stats['times']),
+                                    queued=list(stats['queued'])))
+                        for name, stats in _services.items())
+
+    summary = {'actors': {}, 'services': {}}
+    for name in set(actors) | set(calls):
+        times = actors.get(name, [])
+        stats = calls.get(name, {'calls': 0, 'retries': 0, 'queued': []})
+        entry = dict(_latencies(times), count=len(times),
+                     errors=errors.get(name, 0),
+                     calls=stats['calls'], retries=stats['retries'])
+        entry.update(_latencies(stats['queued'], prefix='queued_'))
+        summary['actors'][name] = entry
+
+    for name, stats in services.items():
+        entry = {'calls': stats['calls'], 'errors': stats['errors'],
+                 'retries': stats['retries']}
+        entry.update(_latencies(stats['times']))
+        entry.update(_latencies(stats['queued'], prefix='queued_'))
+        summary['services'][name] = entry
+
+    return summary
+
+
+def _fmt(seconds):
+    return '-' if seconds is None else '%.2fs' % seconds
+
+
+def log_summary(logger=log, level=logging.INFO):
+    """Logs a table of the per-actor and per-service statistics.
+
+    Args:
+        logger: Logger to write the table to.
+        level: Logging level to write it at.
+    """
+    summary = get_summary()
+
+    if summary['actors']:
+        logger.log(level, 'Actor statistics (count, errors, total, '
+                          'p50/p95/max, API calls, retries, queued total):')
+    for name, s in sorted(summary['actors'].items(),
+                          key=lambda i: -i[1]['total']):
+        logger.log(level, '  %-30s %5s %5s %9s %8s/%s/%s %5s %5s %8s' % (
+            name, s['count'], s['errors'], _fmt(s['total']), _fmt(s['p50']),
+            _fmt(s['p95']), _fmt(s['max']), s['calls'], s['retries'],
+            _fmt(s['queued_total'])))
+
+    if summary['services']:
+        logger.log(level, 'Service statistics (calls, errors, retries, '
+                          'p50/p95/max, queued p95):')
+    for name, s in sorted(summary['services'].items()):
+        logger.log(level, '  %-30s %5s %5s %5s %8s/%s/%s %8s' % (
+            name, s['calls'], s['errors'], s['retries'], _fmt(s['p50']),
+            _fmt(s['p95']), _fmt(s['max']), _fmt(s['queued_p95'])))
+
+
+def write(path):
+    """Writes the summary out to a file as JSON."""
+    with open(path, 'w') as fh:
+        json.dump(get_summary(), fh, indent=2, sort_keys=True)
+
+
+def timed_thread(service):
+    """Decorator for `thread(self, function, ...)` style executor methods.
+
+    Records the time each call spent queued for a thread, how long it took,
+    whether it failed and how many times `function` was retried (by any retry
+    decorator sitting between this one and the function).
+
+    Example:
+        >>> @summary.timed_thread('aws')
+        ... @concurrent.run_on_executor
+        ... @retry(...)
+        ... def thread(self, function, *args, **kwargs):
+        ...     return function(*args, **kwargs)
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(self, function, *args, **kwargs):
+            submitted = time.time()
+            actor = current_actor()
+            attempts = []
+
+            def run(*run_args, **run_kwargs):
+                with attributing(actor):
+                    if not attempts:
+                        record_queued(service, time.time() - submitted)
+                    else:
+                        record_retry(service)
+                attempts.append(time.time())
+                return function(*run_args, **run_kwargs)
+            run.__name__ = getattr(function, '__name__', 'function')
+
+            future = f(self, run, *args, **kwargs)
+
+            def done(future):
+                started = attempts[0] if attempts else submitted
+                record_call(service, time.time() - started,
+                            error=future.exception() is not None,
+                            actor=actor)
+            future.add_done_callback(done)
+            return future
+        return wrapper
+    return decorator
+
+
+class TimedExecutor(futures.ThreadPoolExecutor):
+
+    """ThreadPoolExecutor that records how long work waits for a thread.
+
+    The work runs attributed to the actor that submitted it (see
+    attributed()).
+
+    Args:
+        max_workers: Number of threads in the pool.
+        service: Name of the service to record the queueing time under.
+    """
+
+    def __init__(self, max_workers, service):
+        super(TimedExecutor, self).__init__(max_workers)
+        self.service = service
+
+    def submit(self, fn, *args, **kwargs):
+        submitted = time.time()
+        actor = current_actor()
+
+        def run():
+            with attributing(actor):
+                record_queued(self.service, time.time() - submitted)
+                return fn(*args, **kwargs)
+
+        return super(TimedExecutor, self).submit(run)
@@ -119,6 +119,31 @@ class TestRetry(testing.AsyncTestCase):
 
         self.assertEquals(fail._call_count, 7)
 
+    @testing.gen_test
+    def test_decorator_records_retries_by_host(self):
+
+        class TestException(Exception):
+            pass
+
+        class FailingClass():
+            _EXCEPTIONS = {TestException: {'cruel': None}}
+
+            @gen.coroutine
+            @api._retry(delay=0, retries=2)
+            def func(self, url=None):
+                raise TestException('Goodbye cruel world...')
+
+        fail = FailingClass()
+        with mock.patch.object(api.summary, 'record_retry') as record:
+            with self.assertRaises(TestException):
+                yield fail.func('http://unittest.com/path?token=abc')
+            with self.assertRaises(TestException):
+                yield fail.func()
+
+        self.assertEquals(
+            [mock.call('unittest.com'), mock.call('FailingClass')],
+            record.call_args_list)
+
 
 class TestRestConsumer(testing.AsyncTestCase):
 
@@ -130,6 +155,53 @@ class TestRestConsumer(testing.AsyncTestCase):
         self.assertEquals(test_consumer.testA().__repr__(),
                           'RestConsumerTest(/testA)')
 
+    def test_compiled_once_per_class(self):
+        consumer1 = RestConsumerTest(client=RestClientTest())
+        consumer2 = RestConsumerTest(client=RestClientTest())
+
+        # Both objects (and their children) share the same generated classes
+        self.assertIs(type(consumer1), type(consumer2))
+        self.assertIs(type(consumer1.testA()), type(consumer2.testA()))
+        self.assertIsInstance(consumer1.testA(), RestConsumerTest)
+        self.assertEquals(type(consumer1.testA()).__name__, 'RestConsumerTest')
+
+        # The access methods live on the class, not on every instance
+        self.assertNotIn('testA', consumer1.__dict__)
+        self.assertNotIn('http_get', consumer1.testA().__dict__)
+
+        # A different class with the same config gets its own classes
+        authed = RestConsumerTestBasicAuthed(client=RestClientTest())
+        self.assertIsNot(type(authed.testA()), type(consumer1.testA()))
+        self.assertIsInstance(authed.testA(), RestConsumerTestBasicAuthed)
+
+    def test_compile_cache(self):
+        with mock.patch.object(api, '_COMPILED_CONSUMERS', {}) as cache:
+            RestConsumerTest(client=RestClientTest()).testA()
+            RestConsumerTest(client=RestClientTest()).testA()
+            self.assertEquals(len(cache), 2)
+
+    def test_tokens_passed_down_the_chain(self):
+        class Consumer(api.RestConsumer):
+            _CONFIG = {
+                'path': '/v1',
+                'attrs': {
+                    'room': {
+                        'path': '/v1/room/%res%',
+                        'attrs': {
+                            'history': {
+                                'path': '/v1/room/%res%/history',
+                                'http_methods': {'get': {}}
+                            }
+                        }
+                    }
+                }
+            }
+
+        consumer = Consumer(client=RestClientTest())
+        self.assertEquals(str(consumer), '/v1')
+        self.assertEquals(str(consumer.room(res='a').history()),
+                          '/v1/room/a/history')
+
     @testing.gen_test
     def test_replace_path_tokens(self):
         test_consumer = RestConsumerTest(client=RestClientTest())
@@ -317,6 +389,189 @@ class TestRestClient(testing.AsyncTestCase):
             yield self.client.fetch(url='http://foo.com', method='GET')
 
 
+class TestResponseCache(testing.AsyncTestCase):
+
+    def test_get_set(self):
+        cache = api.ResponseCache(ttl=30)
+        self.assertEquals(cache.get('http://foo.com/a'), None)
+        self.assertFalse(cache.fresh(None))
+
+        cache.set('http://foo.com/a', {'foo': 'bar'}, etag='"abc"')
+        entry = cache.get('http://foo.com/a')
+        self.assertEquals(entry['body'], {'foo': 'bar'})
+        self.assertEquals(entry['etag'], '"abc"')
+        self.assertTrue(cache.fresh(entry))
+        self.assertEquals(len(cache), 1)
+
+    def test_expiration_and_refresh(self):
+        cache = api.ResponseCache(ttl=-1)
+        cache.set('http://foo.com/a', 'body')
+        entry = cache.get('http://foo.com/a')
+        self.assertFalse(cache.fresh(entry))
+
+        cache.ttl = 30
+        cache.refresh(entry)
+        self.assertTrue(cache.fresh(entry))
+
+    def test_lru_eviction(self):
+        cache = api.ResponseCache(max_size=2)
+        cache.set('http://foo.com/a', 'a')
+        cache.set('http://foo.com/b', 'b')
+
+        # Touch 'a' so that 'b' is the least recently used
+        cache.get('http://foo.com/a')
+        cache.set('http://foo.com/c', 'c')
+
+        self.assertEquals(len(cache), 2)
+        self.assertEquals(cache.get('http://foo.com/b'), None)
+        self.assertEquals(cache.get('http://foo.com/a')['body'], 'a')
+        self.assertEquals(cache.stats()['evictions'], 1)
+
+    def test_invalidate(self):
+        cache = api.ResponseCache()
+        cache.set('http://foo.com/checks?limit=5', 'listing')
+        cache.set('http://foo.com/checks/1', 'check 1')
+        cache.set('http://foo.com/checks/1/results', 'check 1 results')
+        cache.set('http://foo.com/users', 'users')
+
+        cache.set('http://foo.com/checks/10', 'check 10')
+        cache.set('http://foo.com/checks/123', 'check 123')
+
+        cache.invalidate('http://foo.com/checks/1?paused=true')
+
+        self.assertEquals(len(cache), 3)
+        self.assertEquals(cache.get('http://foo.com/users')['body'], 'users')
+        self.assertEquals(cache.get('http://foo.com/checks/10')['body'],
+                          'check 10')
+        self.assertEquals(cache.get('http://foo.com/checks/123')['body'],
+                          'check 123')
+        self.assertEquals(cache.stats()['invalidations'], 3)
+
+    def test_invalidate_every_credential(self):
+        cache = api.ResponseCache()
+        cache.set('http://foo.com/checks', 'mine', credentials='me')
+        cache.set('http://foo.com/checks', 'yours', credentials='you')
+
+        cache.invalidate('http://foo.com/checks/1')
+
+        self.assertEquals(len(cache), 0)
+
+    def test_stats(self):
+        cache = api.ResponseCache()
+        self.assertEquals(cache.stats()['hit_rate'], 0.0)
+
+        cache.record('hits')
+        cache.record('hits')
+        cache.record('revalidated')
+        cache.record('misses')
+        stats = cache.stats()
+        self.assertEquals(stats['hits'], 2)
+        self.assertEquals(stats['revalidated'], 1)
+        self.assertEquals(stats['misses'], 1)
+        self.assertEquals(stats['size'], 0)
+        self.assertEquals(stats['hit_rate'], 0.75)
+
+
+class TestRestClientWithCache(testing.AsyncTestCase):
+
+    def setUp(self, *args, **kwargs):
+        super(TestRestClientWithCache, self).setUp()
+        self.cache = api.ResponseCache(ttl=30)
+        self.client = api.RestClient(headers={'App-Key': 'abc'},
+                                     cache=self.cache)
+        self.http_response_mock = mock.MagicMock(name='response')
+        self.http_response_mock.body = '{"foo": ["bar"]}'
+        self.http_response_mock.headers = {'Etag': '"v1"'}
+        self.http_client_mock = mock.MagicMock(name='http_client')
+        self.http_client_mock.fetch.side_effect = (
+            lambda *a, **kw: tornado_value(self.http_response_mock))
+        self.client._client = self.http_client_mock
+        self.credentials = self.client._cache_credentials(None, None)
+
+    @testing.gen_test
+    def test_get_is_cached(self):
+        ret1 = yield self.client.fetch(url='http://foo.com', method='GET')
+        ret1['foo'].append('mutated by the caller')
+        ret2 = yield self.client.fetch(url='http://foo.com', method='GET')
+
+        self.assertEquals({'foo': ['bar']}, ret2)
+        self.assertEquals(self.http_client_mock.fetch.call_count, 1)
+        self.assertEquals(self.cache.stats()['hits'], 1)
+        self.assertEquals(self.cache.stats()['misses'], 1)
+
+    @testing.gen_test
+    def test_params_are_part_of_the_key(self):
+        yield self.client.fetch(url='http://foo.com', method='GET',
+                                params={'a': 'b'})
+        yield self.client.fetch(url='http://foo.com', method='GET',
+                                params={'a': 'c'})
+        self.assertEquals(self.http_client_mock.fetch.call_count, 2)
+
+    @testing.gen_test
+    def test_credentials_are_part_of_the_key(self):
+        other = api.RestClient(headers={'App-Key': 'xyz'}, cache=self.cache)
+        other._client = self.http_client_mock
+
+        yield self.client.fetch(url='http://foo.com', method='GET')
+        yield other.fetch(url='http://foo.com', method='GET')
+        yield other.fetch(url='http://foo.com', method='GET',
+                          auth_username='user', auth_password='pass')
+        yield other.fetch(url='http://foo.com', method='GET')
+
+        self.assertEquals(self.http_client_mock.fetch.call_count, 3)
+        self.assertEquals(self.cache.stats()['hits'], 1)
+
+    @testing.gen_test
+    def test_stale_entry_revalidated_with_etag(self):
+        yield self.client.fetch(url='http://foo.com', method='GET')
+        self.cache.get('http://foo.com', self.credentials)['expires'] = 0
+
+        self.http_client_mock.fetch.side_effect = httpclient.HTTPError(
+            304, 'Not Modified')
+        ret = yield self.client.fetch(url='http://foo.com', method='GET')
+
+        self.assertEquals({'foo': ['bar']}, ret)
+        request = self.http_client_mock.fetch.call_args[0][0]
+        self.assertEquals(request.headers['If-None-Match'], '"v1"')
+        self.assertEquals(request.headers['App-Key'], 'abc')
+        self.assertEquals(self.client.headers, {'App-Key': 'abc'})
+        self.assertTrue(self.cache.fresh(
+            self.cache.get('http://foo.com', self.credentials)))
+        self.assertEquals(self.cache.stats()['revalidated'], 1)
+
+    @testing.gen_test
+    def test_stale_entry_without_etag_is_refetched(self):
+        self.http_response_mock.headers = {}
+        yield self.client.fetch(url='http://foo.com', method='GET')
+        self.cache.get('http://foo.com', self.credentials)['expires'] = 0
+
+        self.http_response_mock.body = 'new'
+        ret = yield self.client.fetch(url='http://foo.com', method='GET')
+
+        self.assertEquals('new', ret)
+        request = self.http_client_mock.fetch.call_args[0][0]
+        self.assertNotIn('If-None-Match', request.headers)
+
+    @testing.gen_test
+    def test_non_get_invalidates(self):
+        yield self.client.fetch(url='http://foo.com/checks', method='GET')
+        yield self.client.fetch(url='http://foo.com/checks/1', method='PUT',
+                                params={'paused': 'true'})
+        yield self.client.fetch(url='http://foo.com/checks', method='GET')
+
+        self.assertEquals(self.http_client_mock.fetch.call_count, 3)
+
+    @testing.gen_test
+    def test_failed_non_get_invalidates(self):
+        yield self.client.fetch(url='http://foo.com/checks', method='GET')
+        self.http_client_mock.fetch.side_effect = httpclient.HTTPError(
+            401, 'Unauthorized')
+        with self.assertRaises(exceptions.InvalidCredentials):
+            yield self.client.fetch(url='http://foo.com/checks',
+                                    method='DELETE')
+        self.assertEquals(len(self.cache), 0)
+
+
 class TestSimpleTokenRestClient(testing.AsyncTestCase):
 
     def setUp(self, *args, **kwargs):
@@ -0,0 +1,114 @@
+"""Tests for the actors.support.checkpoint package."""
+
+import json
+import os
+import tempfile
+
+import mock
+
+from tornado import gen
+from tornado import testing
+
+from kingpin.actors import group
+from kingpin.actors import misc
+from kingpin.actors.support import checkpoint
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+def _script(second='two'):
+    return {'acts': [
+        {'actor': 'misc.Note', 'desc': 'Note 1',
+         'options': {'message': 'one'}},
+        {'actor': 'misc.Note', 'desc': 'Note 2',
+         'options': {'message': second}}]}
+
+
+class TestCheckpoint(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(TestCheckpoint, self).setUp()
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        super(TestCheckpoint, self).tearDown()
+        checkpoint.close_journal()
+        os.remove(self.path)
+
+    def _build(self, dry=False, **kwargs):
+        actor = group.Sync('Group', _script(**kwargs), dry=dry)
+        checkpoint.register_orgchart(actor.get_orgchart())
+        return actor
+
+    def _journal(self):
+        return [json.loads(line) for line in open(self.path)]
+
+    def test_checksum(self):
+        self.assertEquals(checkpoint.checksum('a', {'x': 1, 'y': 2}),
+                          checkpoint.checksum('a', {'y': 2, 'x': 1}))
+        self.assertNotEquals(checkpoint.checksum('a', {'x': 1}),
+                             checkpoint.checksum('b', {'x': 1}))
+
+    def test_register_orgchart_paths(self):
+        checkpoint.open_journal(self.path)
+        actor = self._build()
+
+        paths = sorted(path for path, _ in checkpoint._actors.values())
+        self.assertEquals(
+            ['0:Group', '0:Group/0:Note 1', '0:Group/1:Note 2'], paths)
+        self.assertEquals('0:Group', checkpoint._actors[str(id(actor))][0])
+
+    def test_register_orgchart_disabled(self):
+        self._build()
+        self.assertEquals({}, checkpoint._actors)
+
+    @testing.gen_test
+    def test_record(self):
+        checkpoint.open_journal(self.path)
+        yield self._build(dry=True).execute()
+        self.assertEquals([], self._journal())
+
+        yield self._build().execute()
+        paths = [entry['path'] for entry in self._journal()]
+        self.assertEquals(
+            ['0:Group/0:Note 1', '0:Group/1:Note 2', '0:Group'], paths)
+
+    @testing.gen_test
+    def test_resume(self):
+        checkpoint.open_journal(self.path)
+        yield self._build().execute()
+
+        # Pretend the run died before the group itself was recorded
+        journal = self._journal()[:-1]
+        with open(self.path, 'w') as fh:
+            for entry in journal:
+                fh.write(json.dumps(entry) + '\n')
+            fh.write('{"path": "cut sh')
+
+        checkpoint.open_journal(self.path, resume=True)
+        actor = self._build(second='changed')
+        executed = []
+
+        @gen.coroutine
+        def _execute(note):
+            executed.append(note._desc)
+
+        with mock.patch.object(misc.Note, '_execute', _execute):
+            yield actor.execute()
+
+        # Note 1 is skipped, Note 2 changed and ran again
+        self.assertEquals(['Note 2'], executed)
+        last = open(self.path).readlines()[-1]
+        self.assertEquals('0:Group', json.loads(last)['path'])
+
+    @testing.gen_test
+    def test_resume_unchanged_subtree(self):
+        checkpoint.open_journal(self.path)
+        yield self._build().execute()
+
+        checkpoint.open_journal(self.path, resume=True)
+        actor = self._build()
+        with mock.patch.object(group.Sync, '_execute') as execute:
+            yield actor.execute()
+        self.assertFalse(execute.called)
@@ -0,0 +1,114 @@
+"""Tests for the actors.support.http_client package."""
+
+import mock
+
+from tornado import httpclient
+from tornado import simple_httpclient
+from tornado import testing
+
+from kingpin.actors.support import http_client
+from kingpin.actors.test.helper import tornado_value
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+class TestConfigure(testing.AsyncTestCase):
+
+    def tearDown(self):
+        super(TestConfigure, self).tearDown()
+        httpclient.AsyncHTTPClient.configure(None)
+        http_client._configured = False
+
+    def test_configure_without_pycurl(self):
+        with mock.patch.dict('sys.modules', {'pycurl': None}):
+            name = http_client.configure(max_clients=25, use_curl=True)
+
+        self.assertEquals(
+            name, 'tornado.simple_httpclient.SimpleAsyncHTTPClient')
+        self.assertTrue(http_client._configured)
+        client = httpclient.AsyncHTTPClient(force_instance=True)
+        self.assertEquals(client.max_clients, 25)
+        client.close()
+
+    def test_configure_with_pycurl(self):
+        with mock.patch.object(httpclient.AsyncHTTPClient,
+                               'configure') as configure:
+            with mock.patch.dict('sys.modules', {'pycurl': mock.Mock()}):
+                name = http_client.configure(max_clients=5)
+
+        self.assertEquals(name, http_client.CURL_CLIENT)
+        configure.assert_called_once_with(http_client.CURL_CLIENT,
+                                          max_clients=5)
+
+    def test_configure_curl_disabled(self):
+        with mock.patch.object(httpclient.AsyncHTTPClient,
+                               'configure') as configure:
+            with mock.patch.dict('sys.modules', {'pycurl': mock.Mock()}):
+                http_client.configure(use_curl=False)
+
+        configure.assert_called_once_with(
+            None, max_clients=http_client.MAX_CLIENTS)
+
+    def test_get_client(self):
+        with mock.patch.object(http_client, 'configure') as configure:
+            client = http_client.get_client()
+        configure.assert_called_once_with()
+        self.assertEquals(type(client), http_client.TimedHTTPClient)
+        self.assertEquals(repr(client),
+                          'TimedHTTPClient(SimpleAsyncHTTPClient)')
+
+        # The underlying AsyncHTTPClient is shared on the IOLoop
+        self.assertIs(client._client, http_client.get_client()._client)
+        self.assertEquals(type(client._client),
+                          simple_httpclient.SimpleAsyncHTTPClient)
+
+
+class TestTimedHTTPClient(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(TestTimedHTTPClient, self).setUp()
+        http_client.reset_host_stats()
+        self.async_client = mock.MagicMock(name='async_client')
+        self.client = http_client.TimedHTTPClient(self.async_client)
+
+    def tearDown(self):
+        super(TestTimedHTTPClient, self).tearDown()
+        http_client.reset_host_stats()
+
+    @testing.gen_test
+    def test_fetch(self):
+        self.async_client.fetch.return_value = tornado_value('response')
+        request = httpclient.HTTPRequest('https://api.example.com/v1/foo')
+
+        ret = yield self.client.fetch(request)
+        yield self.client.fetch('https://api.example.com/v1/bar')
+
+        self.assertEquals(ret, 'response')
+        self.async_client.fetch.assert_has_calls([mock.call(request)])
+        stats = http_client.get_host_stats()
+        self.assertEquals(stats.keys(), ['api.example.com'])
+        self.assertEquals(stats['api.example.com']['requests'], 2)
+        self.assertEquals(stats['api.example.com']['errors'], 0)
+
+    @testing.gen_test
+    def test_fetch_error(self):
+        error = httpclient.HTTPError(500, 'Failure')
+        self.async_client.fetch.side_effect = error
+
+        with self.assertRaises(httpclient.HTTPError):
+            yield self.client.fetch('http://other.example.com/')
+
+        stats = http_client.get_host_stats()['other.example.com']
+        self.assertEquals(stats['requests'], 1)
+        self.assertEquals(stats['errors'], 1)
+
+    @testing.gen_test
+    def test_log_host_stats(self):
+        self.async_client.fetch.return_value = tornado_value('response')
+        yield self.client.fetch('http://other.example.com/')
+
+        logger = mock.Mock()
+        http_client.log_host_stats(logger)
+        self.assertEquals(logger.debug.call_count, 1)
+        self.assertIn('other.example.com: 1 requests, 0 errors',
+                      logger.debug.call_args[0][0])
@@ -0,0 +1,194 @@
+"""Tests for the actors.support.snapshot package."""
+
+import threading
+
+import mock
+
+from tornado import gen
+from tornado import testing
+
+from kingpin.actors import base
+from kingpin.actors.support import snapshot
+from kingpin.constants import REQUIRED
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+class FakeThing(base.EnsurableBaseActor):
+
+    """Manages a description in the WORLD dict."""
+
+    all_options = {
+        'name': (str, REQUIRED, 'Name of thing'),
+        'description': (str, None, 'Some description'),
+    }
+
+    unmanaged_options = ['name']
+
+    WORLD = {}
+    READS = []
+
+    @gen.coroutine
+    def _get_state(self):
+        FakeThing.READS.append(('state', self._dry))
+        present = self.option('name') in FakeThing.WORLD
+        raise gen.Return('present' if present else 'absent')
+
+    @gen.coroutine
+    def _set_state(self):
+        FakeThing.WORLD[self.option('name')] = None
+
+    @gen.coroutine
+    def _get_description(self):
+        FakeThing.READS.append(('description', self._dry))
+        raise gen.Return(FakeThing.WORLD.get(self.option('name')))
+
+    @gen.coroutine
+    def _set_description(self):
+        FakeThing.WORLD[self.option('name')] = self.option('description')
+
+
+class FakeNameless(base.EnsurableBaseActor):
+
+    """Manages the tags of the one and only nameless thing."""
+
+    all_options = {
+        'tags': (list, None, 'Some tags'),
+    }
+
+    TAGS = []
+
+    @gen.coroutine
+    def _get_tags(self):
+        raise gen.Return(FakeNameless.TAGS)
+
+    @gen.coroutine
+    def _set_tags(self):
+        FakeNameless.TAGS = self.option('tags')
+
+
+class TestSnapshot(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(TestSnapshot, self).setUp()
+        snapshot.enable(60)
+        FakeThing.WORLD = {'thing': 'old'}
+        FakeThing.READS = []
+
+    def tearDown(self):
+        super(TestSnapshot, self).tearDown()
+        snapshot.disable()
+        snapshot.reset()
+
+    def _build(self, dry, acts):
+        actors = [FakeThing('Thing %s' % i,
+                            {'name': 'thing', 'description': description},
+                            dry=dry)
+                  for i, description in enumerate(acts)]
+        snapshot.register_orgchart(
+            sum([actor.get_orgchart() for actor in actors], []))
+        return actors
+
+    @gen.coroutine
+    def _execute(self, actors):
+        for actor in actors:
+            yield actor.execute()
+
+    @gen.coroutine
+    def _rehearse_and_run(self, *acts):
+        yield self._execute(self._build(True, acts))
+        FakeThing.READS = []
+        yield self._execute(self._build(False, acts))
+
+    def test_disabled(self):
+        snapshot.disable()
+        actor = FakeThing('Thing', {'name': 'thing'})
+        self.assertIs(FakeThing._get_state.__func__,
+                      actor._get_state._memo_of.__func__)
+
+    def test_read_through_wraps_once(self):
+        actor = FakeThing('Thing', {'name': 'thing'})
+        actor._gather_methods()
+        wrapped = actor._get_state._memo_of
+        self.assertTrue(wrapped._snapshot_of)
+        self.assertIs(wrapped, snapshot.read_through(
+            actor, '_get_state', wrapped))
+
+    @testing.gen_test
+    def test_reuse(self):
+        yield self._rehearse_and_run('old')
+
+        self.assertEquals([], FakeThing.READS)
+        self.assertEquals({'reused': 2, 'read': 0}, snapshot.get_stats())
+
+    @testing.gen_test
+    def test_mutated_resources_are_read_again(self):
+        yield self._rehearse_and_run('new', 'newer')
+
+        # The first actor changes the thing, so the second reads it again
+        self.assertEquals([('state', False), ('description', False)],
+                          FakeThing.READS)
+        self.assertEquals('newer', FakeThing.WORLD['thing'])
+
+    @testing.gen_test
+    def test_stale_reads_are_read_again(self):
+        yield self._execute(self._build(True, ['old']))
+        FakeThing.READS = []
+
+        with mock.patch.object(snapshot.time, 'time', return_value=1e10):
+            yield self._execute(self._build(False, ['old']))
+
+        self.assertEquals([('state', False), ('description', False)],
+                          FakeThing.READS)
+
+    def test_resource_key_without_name(self):
+        actor = FakeNameless('Nameless', {'tags': ['a']})
+        snapshot.register_orgchart(actor.get_orgchart())
+
+        key = snapshot.resource_key(actor)
+        self.assertEquals(
+            (FakeNameless.__module__, snapshot._paths[str(id(actor))]), key)
+        self.assertNotEquals(
+            key, snapshot.resource_key(FakeNameless('Other', {'tags': []})))
+
+    @testing.gen_test
+    def test_reads_are_copied(self):
+        FakeNameless.TAGS = ['a']
+        dry = FakeNameless('Nameless', {'tags': ['a']}, dry=True)
+        snapshot.register_orgchart(dry.get_orgchart())
+        tags = yield dry._get_tags()
+
+        # Changing what the rehearsal read doesn't change the snapshot...
+        tags.append('dry')
+        real = FakeNameless('Nameless', {'tags': ['a']})
+        snapshot.register_orgchart(real.get_orgchart())
+        first = yield real._get_tags()
+        self.assertEquals(['a'], first)
+
+        # ... and neither does changing what the real run got from it
+        first.append('real')
+        second = yield real._get_tags()
+        self.assertEquals(['a'], second)
+        self.assertEquals({'reused': 2, 'read': 0}, snapshot.get_stats())
+
+    @testing.gen_test
+    def test_uncopyable_reads_are_not_stored(self):
+        FakeNameless.TAGS = threading.Lock()
+        dry = FakeNameless('Nameless', {'tags': ['a']}, dry=True)
+        snapshot.register_orgchart(dry.get_orgchart())
+        yield dry._get_tags()
+
+        real = FakeNameless('Nameless', {'tags': ['a']})
+        snapshot.register_orgchart(real.get_orgchart())
+        ret = yield real._get_tags()
+        self.assertIs(FakeNameless.TAGS, ret)
+        self.assertEquals({'reused': 0, 'read': 1}, snapshot.get_stats())
+
+    @testing.gen_test
+    def test_unregistered_actors_read(self):
+        actor = FakeThing('Thing', {'name': 'thing'})
+        state = yield actor._get_state()
+
+        self.assertEquals('present', state)
+        self.assertEquals([('state', False)], FakeThing.READS)
+        self.assertEquals({'reused': 0, 'read': 0}, snapshot.get_stats())
@@ -0,0 +1,201 @@
+"""Tests for the actors.support.summary package."""
+
+import json
+import logging
+import os
+import tempfile
+
+import mock
+
+from tornado import concurrent
+from tornado import gen
+from tornado import testing
+
+from kingpin.actors import exceptions
+from kingpin.actors import misc
+from kingpin.actors.support import summary
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+class TestSummary(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(TestSummary, self).setUp()
+        summary.reset()
+
+    def tearDown(self):
+        super(TestSummary, self).tearDown()
+        summary.reset()
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEquals(None, summary.percentile([], 50))
+        self.assertEquals(50, summary.percentile(values, 50))
+        self.assertEquals(95, summary.percentile(values, 95))
+        self.assertEquals(100, summary.percentile(values, 100))
+        self.assertEquals(7, summary.percentile([7], 95))
+
+    @testing.gen_test
+    def test_record_actor(self):
+        yield misc.Note('Note', {'message': 'hi'}).execute()
+        yield misc.Note('Note', {'message': 'hi'}, dry=True).execute()
+
+        actors = summary.get_summary()['actors']
+        self.assertEquals(['Note', 'Note (dry)'], sorted(actors))
+        self.assertEquals(1, actors['Note']['count'])
+        self.assertEquals(0, actors['Note']['errors'])
+
+    @testing.gen_test
+    def test_record_actor_failed(self):
+        note = misc.Note('Note', {'message': 'hi'})
+
+        @gen.coroutine
+        def _execute():
+            raise exceptions.RecoverableActorFailure('oops')
+
+        with mock.patch.object(note, '_execute', _execute):
+            with self.assertRaises(exceptions.RecoverableActorFailure):
+                yield note.execute()
+
+        actors = summary.get_summary()['actors']
+        self.assertEquals(1, actors['Note']['count'])
+        self.assertEquals(1, actors['Note']['errors'])
+
+    @testing.gen_test
+    def test_attributed(self):
+        parent = misc.Note('Parent', {'message': 'hi'})
+        child = misc.Note('Child', {'message': 'hi'}, dry=True)
+        executor = summary.TimedExecutor(1, 'test')
+        self.addCleanup(executor.shutdown)
+
+        @gen.coroutine
+        def child_work():
+            yield gen.moment
+            summary.record_call('api.example.com', 1.0)
+
+        @gen.coroutine
+        def parent_work():
+            yield gen.moment
+            with summary.attributed(child):
+                future = child_work()
+            yield future
+            summary.record_retry('api.example.com')
+            yield executor.submit(summary.record_call, 'test', 2.0)
+
+        with summary.attributed(parent):
+            future = parent_work()
+
+        # Outside of the context, nothing is attributed
+        summary.record_call('api.example.com', 1.0)
+        yield future
+        self.assertEquals(None, summary.current_actor())
+
+        actors = summary.get_summary()['actors']
+        self.assertEquals(1, actors['Note']['calls'])
+        self.assertEquals(1, actors['Note']['retries'])
+        self.assertTrue(actors['Note']['queued_max'] >= 0)
+        self.assertEquals(0, actors['Note']['count'])
+        self.assertEquals(1, actors['Note (dry)']['calls'])
+        self.assertEquals(0, actors['Note (dry)']['retries'])
+
+    @testing.gen_test
+    def test_record_actor_calls(self):
+        note = misc.Note('Note', {'message': 'hi'})
+
+        @gen.coroutine
+        def _execute():
+            yield gen.moment
+            summary.record_call('api.example.com', 1.0)
+
+        with mock.patch.object(note, '_execute', _execute):
+            yield note.execute()
+
+        actors = summary.get_summary()['actors']
+        self.assertEquals(1, actors['Note']['count'])
+        self.assertEquals(1, actors['Note']['calls'])
+
+    def test_get_summary_services(self):
+        summary.record_call('api.example.com', 1.0)
+        summary.record_call('api.example.com', 3.0, error=True)
+        summary.record_retry('api.example.com')
+        summary.record_queued('api.example.com', 0.5)
+
+        service = summary.get_summary()['services']['api.example.com']
+        self.assertEquals(2, service['calls'])
+        self.assertEquals(1, service['errors'])
+        self.assertEquals(1, service['retries'])
+        self.assertEquals(4.0, service['total'])
+        self.assertEquals(1.0, service['p50'])
+        self.assertEquals(3.0, service['max'])
+        self.assertEquals(0.5, service['queued_max'])
+
+    def test_log_summary(self):
+        summary.record_call('api.example.com', 1.0)
+        logger = mock.MagicMock()
+        summary.log_summary(logger)
+        self.assertEquals(2, logger.log.call_count)
+        self.assertEquals(logging.INFO, logger.log.call_args[0][0])
+
+    @testing.gen_test
+    def test_log_summary_rows(self):
+        yield misc.Note('Note', {'message': 'hi'}).execute()
+        summary.record_call('api.example.com', 1.0, error=True)
+        logger = mock.MagicMock()
+        summary.log_summary(logger, level=logging.DEBUG)
+
+        lines = [c[0][1] for c in logger.log.call_args_list]
+        self.assertEquals(4, len(lines))
+        self.assertEquals(['Note', '1', '0'], lines[1].split()[:3])
+        self.assertEquals(
+            ['api.example.com', '1', '1', '0', '1.00s/1.00s/1.00s', '-'],
+            lines[3].split())
+        levels = set(c[0][0] for c in logger.log.call_args_list)
+        self.assertEquals(set([logging.DEBUG]), levels)
+
+    def test_write(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        summary.record_call('api.example.com', 1.0)
+        summary.write(path)
+        self.assertEquals(
+            1, json.load(open(path))['services']['api.example.com']['calls'])
+
+    @testing.gen_test
+    def test_timed_thread(self):
+        class Fake(object):
+            @summary.timed_thread('test')
+            def thread(self, function):
+                # Pretend that the first attempt failed and was retried
+                try:
+                    function(fail=True)
+                except ValueError:
+                    pass
+                future = concurrent.Future()
+                future.set_result(function(fail=False))
+                return future
+
+        def work(fail):
+            if fail:
+                raise ValueError()
+            return 'done'
+
+        ret = yield Fake().thread(work)
+        self.assertEquals('done', ret)
+
+        service = summary.get_summary()['services']['test']
+        self.assertEquals(1, service['calls'])
+        self.assertEquals(1, service['retries'])
+        self.assertEquals(0, service['errors'])
+        self.assertTrue(service['queued_max'] >= 0)
+
+    def test_timed_executor(self):
+        executor = summary.TimedExecutor(1, 'test')
+        self.addCleanup(executor.shutdown)
+
+        self.assertEquals(4, executor.submit(lambda x: x * 2, 2).result())
+        service = summary.get_summary()['services']['test']
+        self.assertTrue(service['queued_max'] >= 0)
+        self.assertEquals(0, service['calls'])
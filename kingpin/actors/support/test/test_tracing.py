@@ -0,0 +1,254 @@
+"""Tests for the actors.support.tracing package."""
+
+import json
+import os
+import tempfile
+import threading
+
+from tornado import concurrent
+from tornado import gen
+from tornado import testing
+
+from kingpin.actors import exceptions
+from kingpin.actors import group
+from kingpin.actors import misc
+from kingpin.actors.support import tracing
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+class TestTracing(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(TestTracing, self).setUp()
+        tracing.enable()
+
+    def tearDown(self):
+        super(TestTracing, self).tearDown()
+        tracing.disable()
+        tracing.reset()
+
+    def test_span_disabled(self):
+        tracing.disable()
+        with tracing.span('nothing'):
+            pass
+        self.assertIs(tracing._NULL_SPAN, tracing.span('nothing'))
+        self.assertEquals([], tracing.get_spans())
+        self.assertFalse(tracing.is_enabled())
+
+    def test_span(self):
+        with tracing.span('outer', cat='test', key='value'):
+            pass
+        with self.assertRaises(ValueError):
+            with tracing.span('broken', cat='test'):
+                raise ValueError('oops')
+
+        ok, broken = tracing.get_spans()
+        self.assertEquals('outer', ok['name'])
+        self.assertEquals({'key': 'value'}, ok['args'])
+        self.assertFalse(ok['error'])
+        self.assertTrue(ok['start'] <= ok['end'])
+        self.assertTrue(broken['error'])
+        self.assertEquals('ValueError: oops', broken['args']['error'])
+
+    @testing.gen_test
+    def test_actor_spans_follow_orgchart(self):
+        actor = group.Sync('Group', {'acts': [
+            {'actor': 'misc.Note', 'desc': 'Note 1',
+             'options': {'message': 'one'}},
+            {'actor': 'misc.Note', 'desc': 'Note 2',
+             'options': {'message': 'two'}}]})
+        tracing.register_orgchart(actor.get_orgchart())
+
+        yield actor.execute()
+
+        spans = dict((s['args']['actor'], s) for s in tracing.get_spans())
+        self.assertEquals(None, spans['Group']['parent'])
+        self.assertEquals(spans['Group']['id'], spans['Note 1']['parent'])
+        self.assertEquals(spans['Group']['id'], spans['Note 2']['parent'])
+        self.assertEquals('Note', spans['Note 1']['args']['class'])
+
+    @testing.gen_test
+    def test_failed_actor(self):
+        class Broken(misc.Note):
+            @gen.coroutine
+            def _execute(self):
+                raise exceptions.RecoverableActorFailure('oops')
+
+        actor = Broken('Broken', {'message': 'hi'})
+        with self.assertRaises(exceptions.RecoverableActorFailure):
+            yield actor.execute()
+
+        span, = tracing.get_spans()
+        self.assertTrue(span['error'])
+        self.assertEquals('RecoverableActorFailure: oops',
+                          span['args']['error'])
+        self.assertEquals({}, tracing._running)
+        self.assertEquals({}, tracing._open)
+
+    def test_unfinished_spans(self):
+        actor = misc.Note('Note', {'message': 'hi'})
+        outer = tracing.span('execute', cat='actor', actor=actor)
+        outer.__enter__()
+        with tracing.span('thing'):
+            pass
+
+        thing, unfinished = tracing.get_spans()
+        self.assertEquals('thing', thing['name'])
+        self.assertNotIn('unfinished', thing['args'])
+        self.assertEquals('execute', unfinished['name'])
+        self.assertTrue(unfinished['args']['unfinished'])
+        self.assertFalse(unfinished['error'])
+        self.assertTrue(unfinished['start'] <= unfinished['end'])
+
+        # Once it ends, it is an ordinary span
+        outer.__exit__(None, None, None)
+        thing, finished = tracing.get_spans()
+        self.assertNotIn('unfinished', finished['args'])
+        self.assertEquals({}, tracing._running)
+
+    @testing.gen_test
+    def test_traced(self):
+        class Fake(misc.Note):
+            @tracing.traced('call', cat='test')
+            def call(self, function):
+                future = concurrent.Future()
+                self.io_loop.add_callback(future.set_result, function())
+                return future
+
+        actor = Fake('Fake', {'message': 'hi'})
+        actor.io_loop = self.io_loop
+        ret = yield actor.call(lambda: 'result')
+        self.assertEquals('result', ret)
+
+        span, = tracing.get_spans()
+        self.assertEquals('call', span['name'])
+        self.assertEquals('<lambda>', span['args']['function'])
+        self.assertEquals('Fake', span['args']['actor'])
+
+    def test_traced_raises(self):
+        class Fake(misc.Note):
+            @tracing.traced('call', cat='test')
+            def call(self):
+                raise ValueError('oops')
+
+        actor = Fake('Fake', {'message': 'hi'})
+        with self.assertRaises(ValueError):
+            actor.call()
+
+        span, = tracing.get_spans()
+        self.assertTrue(span['error'])
+        self.assertNotIn('function', span['args'])
+        self.assertEquals({}, tracing._running)
+
+        # Not recorded at all while disabled
+        tracing.disable()
+        with self.assertRaises(ValueError):
+            actor.call()
+        self.assertEquals(1, len(tracing.get_spans()))
+
+    def test_strip_url(self):
+        self.assertEquals(
+            'https://api.example.com/v1/things',
+            tracing.strip_url('https://api.example.com/v1/things?token=abc'))
+
+    @testing.gen_test
+    def test_to_chrome(self):
+        actor = misc.Note('Note', {'message': 'hi'})
+        yield actor.execute()
+        with tracing.span('fetch', cat='http'):
+            yield gen.moment
+
+        events = tracing.to_chrome(tracing.get_spans())['traceEvents']
+        phases = [e['ph'] for e in events]
+        self.assertEquals(['M', 'X', 'M', 'b', 'e'], phases)
+        self.assertEquals('Note', events[0]['args']['name'])
+        self.assertEquals(events[3]['id'], events[4]['id'])
+
+    @testing.gen_test
+    def test_to_chrome_dry_and_threads(self):
+        actor = misc.Note('Note', {'message': 'hi'}, dry=True)
+        yield actor.execute()
+
+        def work():
+            with tracing.span('work', cat='aws', actor=actor):
+                pass
+        thread = threading.Thread(target=work, name='worker-1')
+        thread.start()
+        thread.join()
+
+        events = tracing.to_chrome(tracing.get_spans())['traceEvents']
+        rows = dict((e['args']['name'], e['tid'])
+                    for e in events if e['ph'] == 'M')
+        self.assertEquals(['DRY: Note', 'worker-1'], sorted(rows))
+        work_event, = [e for e in events if e['name'] == 'work']
+        self.assertEquals('X', work_event['ph'])
+        self.assertEquals(rows['worker-1'], work_event['tid'])
+
+    @testing.gen_test
+    def test_to_otlp(self):
+        actor = misc.Note('Note', {'message': 'hi'})
+        yield actor.execute()
+
+        trace = tracing.to_otlp(tracing.get_spans())
+        span, = trace['resourceSpans'][0]['scopeSpans'][0]['spans']
+        self.assertEquals('execute', span['name'])
+        self.assertEquals(32, len(span['traceId']))
+        self.assertEquals(16, len(span['spanId']))
+        self.assertNotIn('parentSpanId', span)
+        attributes = dict((a['key'], a['value']) for a in span['attributes'])
+        self.assertEquals({'stringValue': 'Note'},
+                          attributes['kingpin.actor'])
+        self.assertEquals({'boolValue': False}, attributes['kingpin.dry'])
+        self.assertEquals({'code': 1}, span['status'])
+
+    @testing.gen_test
+    def test_to_otlp_parents_errors_and_values(self):
+        actor = group.Sync('Group', {'acts': [
+            {'actor': 'misc.Note', 'desc': 'Note',
+             'options': {'message': 'one'}}]})
+        tracing.register_orgchart(actor.get_orgchart())
+        yield actor.execute()
+        with self.assertRaises(ValueError):
+            with tracing.span('values', count=3, big=2 ** 70, ratio=0.5):
+                raise ValueError('oops')
+
+        trace = tracing.to_otlp(tracing.get_spans())
+        note, group_, values = (
+            trace['resourceSpans'][0]['scopeSpans'][0]['spans'])
+        self.assertEquals(group_['spanId'], note['parentSpanId'])
+        self.assertNotIn('parentSpanId', group_)
+
+        self.assertEquals({'code': 2}, values['status'])
+        attributes = dict((a['key'], a['value'])
+                          for a in values['attributes'])
+        self.assertEquals({'intValue': '3'}, attributes['kingpin.count'])
+        self.assertEquals({'intValue': str(2 ** 70)},
+                          attributes['kingpin.big'])
+        self.assertEquals({'doubleValue': 0.5}, attributes['kingpin.ratio'])
+        self.assertEquals({'stringValue': 'ValueError: oops'},
+                          attributes['kingpin.error'])
+
+    def test_write(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        with tracing.span('thing'):
+            pass
+
+        # A run that failed part way still writes out what was running
+        running = tracing.span('running')
+        running.__enter__()
+        self.addCleanup(running.__exit__, None, None, None)
+
+        tracing.write(path, 'otlp')
+        spans = json.load(open(path))['resourceSpans'][0]['scopeSpans'][0]
+        self.assertEquals(['thing', 'running'],
+                          [s['name'] for s in spans['spans']])
+
+        tracing.write(path, 'chrome')
+        self.assertIn('traceEvents', json.load(open(path)))
+
+        with self.assertRaises(ValueError):
+            tracing.write(path, 'bogus')
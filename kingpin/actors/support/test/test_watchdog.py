@@ -0,0 +1,118 @@
+"""Tests for the actors.support.watchdog package."""
+
+import json
+import os
+import tempfile
+import threading
+
+import mock
+
+from tornado import gen
+from tornado import testing
+from tornado.concurrent import futures
+
+from kingpin.actors import misc
+from kingpin.actors.support import watchdog
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+class TestWatchdog(testing.AsyncTestCase):
+
+    def test_pool_stats(self):
+        executor = futures.ThreadPoolExecutor(2)
+        self.addCleanup(executor.shutdown)
+        release = threading.Event()
+        started = threading.Semaphore(0)
+
+        def block():
+            started.release()
+            release.wait()
+
+        running = [executor.submit(block) for _ in range(3)]
+        started.acquire()
+        started.acquire()
+
+        self.assertEquals({'queued': 1, 'busy': 2, 'threads': 2, 'max': 2},
+                          watchdog.pool_stats(executor))
+
+        release.set()
+        for future in running:
+            future.result()
+        self.assertEquals(0, watchdog.pool_stats(executor)['busy'])
+
+    def test_find_executors(self):
+        executor = futures.ThreadPoolExecutor(1)
+        module = mock.MagicMock(EXECUTOR=executor)
+        modules = {'kingpin.fake': module, 'kingpin.fake_alias': module,
+                   'other.fake': mock.MagicMock(EXECUTOR=executor),
+                   'kingpin.missing': None}
+        with mock.patch.dict('sys.modules', modules):
+            pools = watchdog.find_executors()
+        self.assertIs(executor, pools['kingpin.fake'])
+        self.assertNotIn('kingpin.fake_alias', pools)
+        self.assertNotIn('other.fake', pools)
+
+    @testing.gen_test
+    def test_running(self):
+        counts = []
+
+        class Counted(misc.Note):
+            @gen.coroutine
+            def _execute(self):
+                counts.append(watchdog.running_actors())
+                yield misc.Note._execute(self)
+
+        before = watchdog.running_actors()
+        yield Counted('Note', {'message': 'hi'}).execute()
+        self.assertEquals([before + 1], counts)
+        self.assertEquals(before, watchdog.running_actors())
+
+    def test_sample_warnings(self):
+        dog = watchdog.Watchdog(io_loop=self.io_loop)
+        full = {'queued': 3, 'busy': 2, 'threads': 2, 'max': 2}
+        idle = {'queued': 0, 'busy': 0, 'threads': 2, 'max': 2}
+
+        with mock.patch.object(watchdog, 'pool_stats') as stats:
+            with mock.patch.object(watchdog, 'find_executors') as find:
+                with mock.patch.object(watchdog, 'log') as log:
+                    find.return_value = {'kingpin.fake': None}
+
+                    stats.return_value = full
+                    sample = dog.sample(lag=1)
+                    dog.sample(lag=1)
+                    self.assertEquals(2, log.warning.call_count)
+
+                    stats.return_value = idle
+                    dog.sample(lag=0)
+                    self.assertEquals(2, log.warning.call_count)
+                    self.assertEquals(2, log.info.call_count)
+
+        self.assertEquals(full, sample['pools']['kingpin.fake'])
+        self.assertEquals(3, len(dog.samples))
+
+    @testing.gen_test
+    def test_start_stop(self):
+        dog = watchdog.Watchdog(interval=0.01, io_loop=self.io_loop)
+        dog.start()
+        yield gen.sleep(0.05)
+        dog.stop()
+        taken = len(dog.samples)
+        yield gen.sleep(0.02)
+
+        self.assertTrue(taken > 0)
+        self.assertEquals(taken, len(dog.samples))
+        self.assertTrue(dog.samples[0]['lag'] >= 0)
+
+    def test_write(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        dog = watchdog.Watchdog(io_loop=self.io_loop)
+        dog.sample()
+        dog.write(path)
+
+        data = json.load(open(path))
+        self.assertEquals(1, len(data['samples']))
+        self.assertEquals(watchdog.LAG_WARNING, data['thresholds']['lag'])
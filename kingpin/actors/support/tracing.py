@@ -0,0 +1,391 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Lightweight span tracing for Kingpin runs.
+
+When enabled (``deploy.py --trace FILE``), the interesting pieces of a run
+record a *span* -- a name, a start time and an end time:
+
+* :py:meth:`~kingpin.actors.base.BaseActor.execute` of every actor
+* the ``_precache()``, compare/getter and setter calls of every
+  :py:class:`~kingpin.actors.base.EnsurableBaseActor`
+* :py:meth:`~kingpin.actors.aws.base.AWSBaseActor.thread` calls, both from
+  submission to completion (which includes time spent queued for the thread
+  pool) and the time actually spent running on a worker thread
+* :py:meth:`~kingpin.actors.support.api.RestClient.fetch` requests
+
+Spans recorded on behalf of an actor are parented to the ``execute()`` span
+of that actor, and ``execute()`` spans are parented to the ``execute()`` span
+of the parent actor in the orgchart (see :py:func:`register_orgchart`).
+
+The spans can be written out as a Chrome trace (load it in
+``chrome://tracing`` or https://ui.perfetto.dev) or as OpenTelemetry OTLP/JSON.
+
+When tracing is disabled (the default), :py:func:`span` returns a shared
+no-op context manager, so the instrumentation costs next to nothing.
+"""
+
+import functools
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urlparse
+
+from tornado import gen
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+FORMATS = ('chrome', 'otlp')
+
+_enabled = False
+
+# Every finished span, as a dict. See Span._record().
+_spans = []
+
+# Span id -> Span object of every span that hasn't finished yet
+_open = {}
+
+# Orgchart actor id -> parent actor id. See register_orgchart().
+_parents = {}
+
+# Actor id -> span id of the actor's currently running execute() span
+_running = {}
+
+_span_ids = itertools.count(1)
+
+
+def enable():
+    """Starts recording spans (and throws away any recorded before)."""
+    global _enabled
+    reset()
+    _enabled = True
+
+
+def disable():
+    """Stops recording spans."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Throws away all of the recorded spans and orgchart information."""
+    del _spans[:]
+    _open.clear()
+    _parents.clear()
+    _running.clear()
+
+
+def get_spans():
+    """Returns a copy of the list of spans.
+
+    Spans that are still running (say, the siblings of an actor that failed
+    a run) are included too. They end now, and are flagged as `unfinished`.
+    """
+    now = time.time()
+    unfinished = [s._record(now, error=False, unfinished=True)
+                  for s in sorted(_open.values(), key=lambda s: s.span_id)]
+    return list(_spans) + unfinished
+
+
+def register_orgchart(orgchart):
+    """Records the parent of every actor in an orgchart.
+
+    Must be called after the actors are created, and before they execute.
+
+    Args:
+        orgchart: The list returned by BaseActor.get_orgchart()
+    """
+    for entry in orgchart:
+        _parents[entry['id']] = entry['parent_id'] or None
+
+
+class _NullSpan(object):
+
+    """No-op span handed out while tracing is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span(object):
+
+    """Context manager that records a single span.
+
+    Args:
+        name: Name of the span (eg. `execute` or `_set_state`)
+        cat: Category of the span (eg. `actor`, `aws` or `http`)
+        actor: Optional BaseActor object the span is recorded on behalf of.
+        **args: Any extra (JSON serializable) attributes to record.
+    """
+
+    def __init__(self, name, cat, actor=None, **args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.actor_id = None
+        self.span_id = next(_span_ids)
+        self.parent_span_id = None
+
+        if actor is not None:
+            self.actor_id = str(id(actor))
+            self.args.update({
+                'actor': actor._desc,
+                'class': actor.__class__.__name__,
+                'dry': actor._dry,
+            })
+
+    def __enter__(self):
+        if self.actor_id is not None:
+            if self.cat == 'actor' and self.name == 'execute':
+                # Our parent is whatever is running our parent actor
+                parent = _parents.get(self.actor_id)
+                self.parent_span_id = _running.get(parent)
+                _running[self.actor_id] = self.span_id
+            else:
+                self.parent_span_id = _running.get(self.actor_id)
+
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        _open[self.span_id] = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.time()
+
+        try:
+            # gen.Return is how a coroutine returns -- not an error.
+            error = exc_type is not None and not issubclass(
+                exc_type, (gen.Return, StopIteration))
+            if error:
+                self.args['error'] = '%s: %s' % (exc_type.__name__, exc_value)
+            _spans.append(self._record(end, error))
+        finally:
+            # However this span ended, the actor isn't running it anymore.
+            _open.pop(self.span_id, None)
+            if _running.get(self.actor_id) == self.span_id:
+                del _running[self.actor_id]
+
+        return False
+
+    def _record(self, end, error, unfinished=False):
+        """Returns the span as a dict."""
+        args = self.args
+        if unfinished:
+            args = dict(args, unfinished=True)
+
+        return {
+            'id': self.span_id,
+            'parent': self.parent_span_id,
+            'name': self.name,
+            'cat': self.cat,
+            'actor_id': self.actor_id,
+            'thread': self.thread,
+            'start': self.start,
+            'end': end,
+            'error': error,
+            'args': args,
+        }
+
+
+def span(name, cat='kingpin', actor=None, **args):
+    """Returns a context manager that records a span around its body.
+
+    Example:
+        >>> with tracing.span('_precache', cat='actor', actor=self):
+        ...     yield self._precache()
+
+    See Span for the arguments.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, cat, actor, **args)
+
+
+def traced(name, cat):
+    """Decorator for actor methods that return a Future.
+
+    Records a span from when the method is called until its Future resolves
+    -- which, for methods run on an executor, includes the time spent waiting
+    for a free thread. If the first argument is a function (as it is for
+    AWSBaseActor.thread()), its name is recorded too.
+
+    Example:
+        >>> @tracing.traced('thread', cat='aws')
+        ... @concurrent.run_on_executor
+        ... def thread(self, function, *args, **kwargs):
+        ...     return function(*args, **kwargs)
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(self, *args, **kwargs):
+            if not _enabled:
+                return f(self, *args, **kwargs)
+
+            extra = {}
+            if args and callable(args[0]):
+                extra['function'] = getattr(args[0], '__name__', repr(args[0]))
+
+            s = Span(name, cat, actor=self, **extra)
+            s.__enter__()
+            try:
+                future = f(self, *args, **kwargs)
+            except Exception:
+                s.__exit__(*sys.exc_info())
+                raise
+
+            def done(future):
+                exc_info = future.exc_info() or (None, None, None)
+                s.__exit__(*exc_info)
+            future.add_done_callback(done)
+            return future
+        return wrapper
+    return decorator
+
+
+def strip_url(url):
+    """Drops the query string (which may hold credentials) from a URL."""
+    parts = urlparse.urlsplit(url)
+    return urlparse.urlunsplit((parts.scheme, parts.netloc, parts.path,
+                                '', ''))
+
+
+def to_chrome(spans):
+    """Converts spans into the Chrome Trace Event format.
+
+    Spans of each actor get their own row, named after the actor. Spans that
+    ran on a worker thread go on a row per thread, and requests (which
+    overlap freely) are drawn as async events.
+    """
+    events = []
+    rows = {}
+
+    def row(key, name):
+        if key not in rows:
+            rows[key] = len(rows) + 1
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1,
+                           'tid': rows[key], 'args': {'name': name}})
+        return rows[key]
+
+    for s in sorted(spans, key=lambda s: s['start']):
+        event = {
+            'name': s['name'],
+            'cat': s['cat'],
+            'pid': 1,
+            'ts': int(s['start'] * 1e6),
+            'args': s['args'],
+        }
+
+        if s['thread'] != 'MainThread':
+            event.update({'ph': 'X', 'dur': int((s['end'] - s['start']) * 1e6),
+                          'tid': row(s['thread'], s['thread'])})
+            events.append(event)
+        elif s['actor_id'] is not None:
+            name = s['args']['actor']
+            if s['args']['dry']:
+                name = 'DRY: %s' % name
+            event.update({'ph': 'X', 'dur': int((s['end'] - s['start']) * 1e6),
+                          'tid': row(s['actor_id'], name)})
+            events.append(event)
+        else:
+            event.update({'ph': 'b', 'id': s['id'],
+                          'tid': row(s['cat'], s['cat'])})
+            events.append(event)
+            events.append({'name': s['name'], 'cat': s['cat'], 'ph': 'e',
+                           'id': s['id'], 'pid': 1, 'tid': event['tid'],
+                           'ts': int(s['end'] * 1e6)})
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, (int, long)):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': unicode(value)}
+
+
+def to_otlp(spans):
+    """Converts spans into the OpenTelemetry OTLP/JSON trace format."""
+    trace_id = os.urandom(16).encode('hex')
+
+    def span_id(n):
+        return '%016x' % n
+
+    out = []
+    for s in spans:
+        attributes = [{'key': 'kingpin.category',
+                       'value': _otlp_value(s['cat'])},
+                      {'key': 'thread.name',
+                       'value': _otlp_value(s['thread'])}]
+        for key, value in sorted(s['args'].items()):
+            attributes.append({'key': 'kingpin.%s' % key,
+                               'value': _otlp_value(value)})
+
+        otlp_span = {
+            'traceId': trace_id,
+            'spanId': span_id(s['id']),
+            'name': s['name'],
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(int(s['start'] * 1e9)),
+            'endTimeUnixNano': str(int(s['end'] * 1e9)),
+            'attributes': attributes,
+            'status': {'code': 2 if s['error'] else 1},
+        }
+        if s['parent']:
+            otlp_span['parentSpanId'] = span_id(s['parent'])
+        out.append(otlp_span)
+
+    return {'resourceSpans': [{
+        'resource': {'attributes': [
+            {'key': 'service.name', 'value': {'stringValue': 'kingpin'}}]},
+        'scopeSpans': [{'scope': {'name': 'kingpin'}, 'spans': out}],
+    }]}
+
+
+def write(path, fmt='chrome'):
+    """Writes all of the recorded spans out to a file.
+
+    Args:
+        path: File to write the trace to
+        fmt: One of FORMATS
+    """
+    if fmt not in FORMATS:
+        raise ValueError('Unknown trace format: %s' % fmt)
+
+    converter = to_chrome if fmt == 'chrome' else to_otlp
+    spans = get_spans()
+    with open(path, 'w') as fh:
+        json.dump(converter(spans), fh)
+
+    log.info('Wrote %s spans to %s' % (len(spans), path))
@@ -0,0 +1,205 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+Watchdog for stalled Kingpin runs.
+
+Most of the API calls Kingpin makes run on ``run_on_executor`` thread pools,
+behind retry decorators that sleep in those threads. When a pool fills up,
+or something blocks the IOLoop, a deploy simply stops making progress without
+saying why. When enabled (``deploy.py --watchdog FILE``), the
+:py:class:`Watchdog` samples, every :py:data:`INTERVAL` seconds:
+
+* how late the IOLoop ran its own callback (the IOLoop *lag*)
+* for every module-level ``EXECUTOR`` pool in ``kingpin.*``: the number of
+  calls queued for a thread, the number of busy threads and the pool size
+* the number of actors whose ``execute()`` is in progress
+
+It logs a warning whenever the lag crosses :py:data:`LAG_WARNING`, or a pool
+has all of its threads busy with at least :py:data:`QUEUE_WARNING` calls
+waiting -- and writes the samples out as JSON at the end of the run.
+"""
+
+import contextlib
+import json
+import logging
+import sys
+import time
+
+from tornado import ioloop
+from tornado.concurrent import futures
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+# Seconds between two samples
+INTERVAL = 1.0
+
+# Seconds of IOLoop lag that are worth a warning
+LAG_WARNING = 0.5
+
+# Number of calls queued on a fully busy pool that are worth a warning
+QUEUE_WARNING = 1
+
+# Number of actors with an execute() in progress. See running().
+_actors = [0]
+
+
+@contextlib.contextmanager
+def running():
+    """Counts an actor execute() as in progress while the block runs."""
+    _actors[0] += 1
+    try:
+        yield
+    finally:
+        _actors[0] -= 1
+
+
+def running_actors():
+    """Returns the number of actors with an execute() in progress."""
+    return _actors[0]
+
+
+def find_executors():
+    """Returns the thread pools used by the loaded Kingpin modules.
+
+    Returns:
+        A dict of module names to the ThreadPoolExecutor they keep in their
+        ``EXECUTOR`` attribute. Pools shared by several modules are only
+        listed under the first one (by name).
+    """
+    pools = {}
+    seen = set()
+    for name in sorted(sys.modules):
+        module = sys.modules[name]
+        if not name.startswith('kingpin.') or module is None:
+            continue
+        executor = getattr(module, 'EXECUTOR', None)
+        if not isinstance(executor, futures.ThreadPoolExecutor):
+            continue
+        if id(executor) in seen:
+            continue
+        seen.add(id(executor))
+        pools[name] = executor
+    return pools
+
+
+def pool_stats(executor):
+    """Returns the queue depth and thread usage of a ThreadPoolExecutor.
+
+    The executor does not publish these numbers, so they are read off its
+    work queue, its thread set and the semaphore it counts idle threads with.
+
+    Returns:
+        A dict with the `queued` calls, the `busy` and started `threads` and
+        the `max` number of threads of the pool.
+    """
+    threads = len(executor._threads)
+    idle = getattr(executor, '_idle_semaphore', None)
+    idle = getattr(idle, '_Semaphore__value', getattr(idle, '_value', 0))
+    return {
+        'queued': executor._work_queue.qsize(),
+        'busy': max(0, threads - idle),
+        'threads': threads,
+        'max': executor._max_workers,
+    }
+
+
+class Watchdog(object):
+
+    """Samples the IOLoop lag, thread pool usage and running actors.
+
+    Args:
+        interval: Seconds between two samples.
+        io_loop: IOLoop to watch (default: the current one).
+    """
+
+    def __init__(self, interval=None, io_loop=None):
+        self.interval = interval or INTERVAL
+        self.io_loop = io_loop or ioloop.IOLoop.current()
+        self.samples = []
+        self._timeout = None
+        self._warned = set()
+
+    def start(self):
+        """Starts taking samples."""
+        self._schedule()
+
+    def stop(self):
+        """Stops taking samples."""
+        if self._timeout:
+            self.io_loop.remove_timeout(self._timeout)
+            self._timeout = None
+
+    def _schedule(self):
+        expected = self.io_loop.time() + self.interval
+        self._timeout = self.io_loop.call_at(expected, self._tick, expected)
+
+    def _tick(self, expected):
+        self.sample(lag=max(0, self.io_loop.time() - expected))
+        self._schedule()
+
+    def sample(self, lag=0):
+        """Takes a sample, warns about anything over its threshold.
+
+        Args:
+            lag: Seconds the IOLoop ran this sample late.
+
+        Returns:
+            The sample dict.
+        """
+        sample = {
+            'time': time.time(),
+            'lag': lag,
+            'actors': running_actors(),
+            'pools': dict((name, pool_stats(executor))
+                          for name, executor in find_executors().items()),
+        }
+        self.samples.append(sample)
+        self._check(sample)
+        return sample
+
+    def _check(self, sample):
+        self._warn_if(
+            'lag', sample['lag'] >= LAG_WARNING,
+            'IOLoop is lagging by %.2fs, with %s actors running. Something '
+            'is blocking it.' % (sample['lag'], sample['actors']))
+
+        for name, pool in sorted(sample['pools'].items()):
+            self._warn_if(
+                name,
+                (pool['busy'] >= pool['max'] and
+                 pool['queued'] >= QUEUE_WARNING),
+                'Thread pool of %s is saturated: %s/%s threads busy, %s '
+                'calls queued.' % (name, pool['busy'], pool['max'],
+                                   pool['queued']))
+
+    def _warn_if(self, key, crossed, message):
+        # Warn once when a threshold is crossed, not on every sample after
+        if crossed and key not in self._warned:
+            log.warning(message)
+            self._warned.add(key)
+        elif not crossed and key in self._warned:
+            log.info('%s is back to normal.' % (
+                'IOLoop lag' if key == 'lag' else 'Thread pool of %s' % key))
+            self._warned.discard(key)
+
+    def write(self, path):
+        """Writes the samples out to a file as JSON."""
+        with open(path, 'w') as fh:
+            json.dump({'interval': self.interval,
+                       'thresholds': {'lag': LAG_WARNING,
+                                      'queued': QUEUE_WARNING},
+                       'samples': self.samples}, fh, indent=2, sort_keys=True)
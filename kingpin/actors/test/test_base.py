@@ -25,6 +25,7 @@ os.environ['URLLIB_DEBUG'] = '1'
 from kingpin import utils
 from kingpin.actors import base
 from kingpin.actors import exceptions
+from kingpin.actors.support import http_client
 from kingpin.actors.test.helper import mock_tornado
 from kingpin.constants import REQUIRED, STATE
 
@@ -445,6 +446,98 @@ class TestEnsurableBaseActor(testing.AsyncTestCase):
         self.assertFalse(self.actor.set_state_called)
         self.assertFalse(self.actor.set_name_called)
 
+    @testing.gen_test
+    def test_execute_compares_concurrently(self):
+        events = []
+
+        def comparer(option, equals):
+            @gen.coroutine
+            def compare():
+                events.append('compare %s' % option)
+                yield gen.moment
+                events.append('compared %s' % option)
+                raise gen.Return(equals)
+            return compare
+
+        @gen.coroutine
+        def setter():
+            events.append('set name')
+
+        self.actor.comparers['name'] = comparer('name', False)
+        self.actor.comparers['description'] = comparer('description', True)
+        self.actor.setters['name'] = setter
+        yield self.actor._execute()
+
+        # Both compares are in flight before the first one finishes, and the
+        # setter only runs once they are done.
+        self.assertEquals(['compare', 'compare', 'compared', 'compared'],
+                          [e.split()[0] for e in events[:4]])
+        self.assertEquals('set name', events[-1])
+
+    def test_ensure_groups(self):
+        self.assertEquals([sorted(['name', 'description'])],
+                          [sorted(g) for g in self.actor._ensure_groups()])
+
+        self.actor.ensure_order = [['description', 'bogus'], ['unmanaged']]
+        self.assertEquals([['description'], ['name']],
+                          self.actor._ensure_groups())
+
+    @testing.gen_test
+    def test_memoized_getters(self):
+        calls = []
+
+        @gen.coroutine
+        def get_description():
+            calls.append('description')
+            raise gen.Return('Some description')
+
+        self.actor._get_description = self.actor._memoized(
+            '_get_description', get_description)
+
+        # Outside of an execution, getters are always called
+        yield self.actor._get_description()
+        self.assertEquals(1, len(calls))
+
+        self.actor._getter_memo = {}
+        first = yield self.actor._get_description()
+        second = yield self.actor._get_description()
+        self.assertEquals('Some description', second)
+        self.assertEquals(first, second)
+        self.assertEquals(2, len(calls))
+        self.assertEquals(1, self.actor._getter_memo_hits)
+
+        # Setters clear the memo
+        yield self.actor._set('name')
+        yield self.actor._get_description()
+        self.assertEquals(3, len(calls))
+
+    @testing.gen_test
+    def test_memoized_getters_forget_failures(self):
+        calls = []
+
+        @gen.coroutine
+        def get_description():
+            calls.append('description')
+            if len(calls) == 1:
+                raise exceptions.RecoverableActorFailure('try again')
+            raise gen.Return('Some description')
+
+        memoized = self.actor._memoized('_get_description', get_description)
+        self.assertIs(memoized, self.actor._memoized('x', memoized))
+
+        self.actor._getter_memo = {}
+        with self.assertRaises(exceptions.RecoverableActorFailure):
+            yield memoized()
+        ret = yield memoized()
+        self.assertEquals('Some description', ret)
+        self.assertEquals(2, len(calls))
+
+    @testing.gen_test
+    def test_execute_resets_memo(self):
+        yield self.actor._execute()
+        self.assertEquals(None, self.actor._getter_memo)
+        self.assertTrue(self.actor._get_state._memo_of)
+
     @testing.gen_test
     def test_gather_methods_throws_exception(self):
         # Mock out the set_name method by replacing it with an attribute
@@ -462,7 +555,9 @@ class TestHTTPBaseActor(testing.AsyncTestCase):
     @testing.gen_test
     def test_get_http_client(self):
         ret = self.actor._get_http_client()
-        self.assertEquals(simple_httpclient.SimpleAsyncHTTPClient, type(ret))
+        self.assertEquals(http_client.TimedHTTPClient, type(ret))
+        self.assertEquals(simple_httpclient.SimpleAsyncHTTPClient,
+                          type(ret._client))
 
     def test_get_method(self):
         self.assertEquals('POST', self.actor._get_method('foobar'))
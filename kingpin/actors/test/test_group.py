@@ -297,6 +297,47 @@ class TestSyncGroupActor(TestGroupActorBaseClass):
         with self.assertRaises(exceptions.RecoverableActorFailure):
             yield actor._run_actions()
 
+    @testing.gen_test
+    def test_run_actions_dry_concurrently(self):
+        check_order = []
+        act = {'actor': 'kingpin.actors.test.test_group.TestActorPopulate',
+               'desc': 'test',
+               'options': {'value': 1}}
+        actor = group.Sync('Unit Test Action', {
+            'acts': [act, dict(act, options={'value': 2}),
+                     dict(act, options={'value': 3})]}, dry=True)
+        for act in actor._actions:
+            act._options['object'] = check_order
+
+        with mock.patch.object(group, 'DRY_CONCURRENCY', 2):
+            yield actor._run_actions()
+
+        # The first two acts hop between each other, the third has to wait
+        self.assertEquals([1, 2, 1, 2, 3, 3], check_order)
+
+    @testing.gen_test
+    def test_run_actions_dry_concurrently_collects_errors(self):
+        self.actor_returns['options']['value'] = '123'
+        actor = group.Sync(
+            'Unit Test Action',
+            {'acts': [
+                dict(self.actor_raises_recoverable_exception),
+                dict(self.actor_raises_unrecoverable_exception),
+                dict(self.actor_returns),
+            ]},
+            dry=True)
+
+        with mock.patch.object(group, 'DRY_CONCURRENCY', 2):
+            with mock.patch.object(actor.log, 'error') as error:
+                with self.assertRaises(exceptions.UnrecoverableActorFailure):
+                    yield actor._run_actions()
+
+        # Every act ran, and the failures were reported in order
+        self.assertEquals(TestActor.last_value, '123')
+        self.assertEquals(
+            ['raises Recoverable exception', 'raises Unrecoverable exception'],
+            [c[0][0].split(' failed')[0] for c in error.call_args_list])
+
 
 class TestAsyncGroupActor(TestGroupActorBaseClass):
 
@@ -20,6 +20,14 @@ class TestPingdomBase(testing.AsyncTestCase):
         pingdom.USER = 'Unittest'
         pingdom.PASS = 'Unittest'
 
+    def test_shared_response_cache(self):
+        actor1 = pingdom.PingdomBase('Unit Test Action', {'name': 'lollipop'})
+        actor2 = pingdom.PingdomBase('Unit Test Action', {'name': 'lollipop'})
+        self.assertIs(actor1._pingdom_client._client._cache,
+                      pingdom.RESPONSE_CACHE)
+        self.assertIs(actor2._pingdom_client._client._cache,
+                      pingdom.RESPONSE_CACHE)
+
     @testing.gen_test
     def test_check_name(self):
         actor = pingdom.PingdomBase('Unit Test Action', {'name': 'lollipop'})
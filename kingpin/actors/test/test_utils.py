@@ -55,6 +55,17 @@ class TestUtils(testing.AsyncTestCase):
         ret = utils.get_actor_class(actor_string)
         self.assertEquals(type(FakeActor), type(ret))
 
+    def test_get_actor_class_cached(self):
+        actor_string = 'kingpin.actors.test.test_utils.FakeActor'
+        utils.get_actor_class(actor_string)
+        with mock.patch.object(utils.utils, 'str_to_class',
+                               return_value=FakeActor) as str_to_class:
+            ret = utils.get_actor_class(actor_string)
+        self.assertEquals(FakeActor, ret)
+
+        # The failed 'kingpin.actors.' prefix is not tried again
+        str_to_class.assert_called_once_with(actor_string)
+
     def test_get_actor_class_bogus_actor(self):
         actor_string = 'bogus.actor'
         with self.assertRaises(exceptions.InvalidActor):
@@ -26,6 +26,9 @@ from tornado import gen
 
 from kingpin import utils
 from kingpin.actors import exceptions
+from kingpin.actors.support import summary
+from kingpin.actors.support import tracing
+from kingpin.actors.support import watchdog
 
 log = logging.getLogger(__name__)
 
@@ -33,6 +36,10 @@ log = logging.getLogger(__name__)
 __author__ = 'Matt Wise <matt@nextdoor.com>'
 
 
+# Actor name -> full class path, as resolved by get_actor_class()
+_actor_paths = {}
+
+
 def dry(dry_message):
     """Coroutine-compatible decorator to dry-run a method.
 
@@ -81,7 +88,11 @@ def timer(f):
 
     Records statistics about how long a given function took, and logs them
     out in debug statements. Used primarily for tracking Actor execute()
-    methods, but can be used elsewhere as well.
+    methods, but can be used elsewhere as well. The time is added to the
+    end-of-run :py:mod:`~kingpin.actors.support.summary`, and when tracing is
+    enabled the call is also recorded as a span (see
+    :py:mod:`~kingpin.actors.support.tracing`), and it is counted as running
+    by the :py:mod:`~kingpin.actors.support.watchdog` until it finishes.
 
     Note: this must act on a :py:mod:`~kingpin.actors.base.BaseActor` object.
 
@@ -97,10 +108,22 @@ def timer(f):
         start_time = time.time()
 
         # Begin the execution
-        ret = yield gen.coroutine(f)(self, *args, **kwargs)
+        try:
+            with tracing.span(f.__name__, cat='actor', actor=self), \
+                    watchdog.running():
+                # Attribute the API calls this makes to our class. (No
+                # yielding inside of a StackContext.)
+                with summary.attributed(self):
+                    future = gen.coroutine(f)(self, *args, **kwargs)
+                ret = yield future
+        except Exception:
+            summary.record_actor(self, time.time() - start_time, error=True)
+            raise
 
         # Log the finished execution time
-        exec_time = "%.2f" % (time.time() - start_time)
+        elapsed = time.time() - start_time
+        summary.record_actor(self, elapsed)
+        exec_time = "%.2f" % elapsed
         self.log.debug('%s.%s() execution time: %ss' %
                        (self._type, f.__name__, exec_time))
 
@@ -158,6 +181,12 @@ def get_actor_class(actor):
     Returns:
         <Class Ref to Actor>
     """
+    # Big scripts name the same few actors over and over again, and every
+    # failed prefix below is a failed import -- so remember which one worked.
+    # (The path, rather than the class, so that reloaded modules are seen.)
+    if actor in _actor_paths:
+        return utils.str_to_class(_actor_paths[actor])
+
     expected_exceptions = (AttributeError, ImportError, TypeError)
 
     # Try to load our local actors up first. Assume that the
@@ -165,7 +194,9 @@ def get_actor_class(actor):
     for prefix in ['kingpin.actors.', '', 'actors.']:
         full_actor = prefix + actor
         try:
-            return utils.str_to_class(full_actor)
+            ActorClass = utils.str_to_class(full_actor)
+            _actor_paths[actor] = full_actor
+            return ActorClass
         except expected_exceptions as e:
             log.debug('Tried importing "%s" but failed: %s' % (full_actor, e))
 
@@ -0,0 +1,24 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+:mod:`kingpin.benchmarks`
+^^^^^^^^^^^^^^^^^^^^^^^^^
+
+Benchmarks for Kingpin's own overhead. Each module can be executed directly,
+for example::
+
+    $ python -m kingpin.benchmarks.rest_consumer
+    $ python -m kingpin.benchmarks.deploy --latency 0.01
+    $ python -m kingpin.benchmarks.startup
+"""
@@ -0,0 +1,344 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+:mod:`kingpin.benchmarks.deploy`
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+End-to-end benchmark of whole deployment scripts, run offline against the
+fake APIs in :py:mod:`kingpin.benchmarks.fakes`:
+
+* ``release``: ``examples/complex.json``, the HipChat and RightScale release
+* ``aws``: IAM Groups, Users and Roles and S3 Buckets, using the example
+  policy documents
+* ``synthetic-1k`` / ``synthetic-10k``: wide trees of RightScale updates and
+  no-op actors, to show how the overhead grows with the size of a script
+
+For each scenario, this measures:
+
+* ``parse``: reading the script and swapping in its tokens
+* ``build``: instantiating the actor tree (dry and real)
+* ``dry`` / ``run``: executing the rehearsal and the real run, like
+  ``deploy.py`` does
+* ``lag_p95`` / ``lag_max``: how late IOLoop callbacks ran during execution
+* ``peak_rss_mb``: the peak memory use of the process
+
+Each scenario runs in its own process, so that the memory peak and any
+caches are its own. Results can be appended to a file and compared with the
+last run stored there, to track Kingpin's overhead across commits::
+
+    $ python -m kingpin.benchmarks.deploy --latency 0.01 \\
+        --compare results.jsonl --save results.jsonl
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from tornado import ioloop
+
+from kingpin import utils
+from kingpin.actors import utils as actor_utils
+from kingpin.actors.support import summary
+from kingpin.benchmarks import fakes
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+SOURCE_ARRAY = 'kingpin-integration-testing'
+
+EXAMPLES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))), 'examples')
+
+
+def example(*path):
+    """Returns the absolute path of a script in the examples directory."""
+    return os.path.join(EXAMPLES, *path)
+
+
+def aws_script(count=10):
+    """IAM Groups, Users and Roles and S3 Buckets, `count` of each.
+
+    There is no AWS deployment script in the examples, so this one is built
+    from the example policy documents that ship next to them.
+    """
+    def act(desc, actor, **options):
+        return {'desc': desc, 'actor': actor, 'options': options}
+
+    def group(desc, acts):
+        return act(desc, 'group.Async', acts=acts)
+
+    return act('AWS %s' % count, 'group.Sync', acts=[
+        group('Groups', [
+            act('Group %s' % i, 'aws.iam.Group', name='group-%s' % i,
+                inline_policies=[example('aws.iam.user', 's3_example.json')])
+            for i in range(count)]),
+        group('Users and Roles', [
+            act('User %s' % i, 'aws.iam.User', name='user-%s' % i,
+                groups=['group-%s' % i],
+                inline_policies=[example('aws.iam.user', 's3_example.json')])
+            for i in range(count)] + [
+            act('Role %s' % i, 'aws.iam.Role', name='role-%s' % i,
+                assume_role_policy_document=example(
+                    'aws.iam.role', 'lambda.json'))
+            for i in range(count)]),
+        group('Buckets', [
+            act('Bucket %s' % i, 'aws.s3.Bucket', name='bucket-%s' % i,
+                region='us-west-2', versioning=True,
+                policy=example('aws.s3', 'amazon_put.json'),
+                logging={'target': 'logs', 'prefix': 'bucket-%s/' % i},
+                lifecycle=[{'id': 'expire-tmp', 'prefix': '/tmp',
+                            'status': 'Enabled', 'expiration': {'days': 7}}],
+                tags=[{'key': 'release', 'value': '%RELEASE%'}])
+            for i in range(count)]),
+    ])
+
+
+def synthetic_script(count, width=100):
+    """A group.Sync of group.Asyncs, `count` actors in total.
+
+    Every other actor updates a RightScale ServerArray, the rest are no-op
+    sleeps -- so the script exercises both Kingpin's own machinery and the
+    API client plumbing.
+    """
+    stages = []
+    for start in range(0, count, width):
+        acts = []
+        for i in range(start, min(start + width, count)):
+            if i % 2:
+                acts.append({
+                    'desc': 'Update %s' % i,
+                    'actor': 'rightscale.server_array.Update',
+                    'options': {'array': SOURCE_ARRAY,
+                                'params': {'description': str(i)}}})
+            else:
+                acts.append({'desc': 'Sleep %s' % i, 'actor': 'misc.Sleep',
+                             'options': {'sleep': 0}})
+        stages.append({'desc': 'Stage %s' % start, 'actor': 'group.Async',
+                       'options': {'acts': acts}})
+    return {'desc': 'Synthetic %s' % count, 'actor': 'group.Sync',
+            'options': {'acts': stages}}
+
+
+def _old_arrays():
+    return dict(('prod-%s-old' % s, 2) for s in ('tools', 'photos', 'task'))
+
+
+# Scenario name -> (script path or dict, tokens, initial RightScale arrays).
+# Dicts are written out to a temporary file first, so that parsing them is
+# measured too.
+SCENARIOS = {
+    'release': (example('complex.json'),
+                {'RELEASE': 'new', 'OLD_RELEASE': 'old'},
+                dict(_old_arrays(), **{SOURCE_ARRAY: 2})),
+    'aws': (aws_script(), {'RELEASE': 'new'}, {}),
+    'synthetic-1k': (synthetic_script(1000), {}, {SOURCE_ARRAY: 2}),
+    'synthetic-10k': (synthetic_script(10000), {}, {SOURCE_ARRAY: 2}),
+}
+
+
+def skip_sleeps(config):
+    """Zeroes out every misc.Sleep in a parsed script.
+
+    The examples wait for traffic to settle and the like. Those are waits the
+    script asks for, not Kingpin overhead, so they are left out.
+    """
+    if config.get('actor') == 'misc.Sleep':
+        config['options']['sleep'] = 0
+    for act in config.get('options', {}).get('acts', []):
+        skip_sleeps(act)
+
+
+def parse(script, tokens):
+    """Reads a scenario's script, like deploy.py does."""
+    if not isinstance(script, dict):
+        return utils.convert_script_to_dict(script, tokens)
+
+    fd, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(script, fh)
+
+    try:
+        return utils.convert_script_to_dict(path, tokens)
+    finally:
+        os.remove(path)
+
+
+class LagMonitor(object):
+
+    """Measures how late the IOLoop runs a callback scheduled every tick."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.lags = []
+        self._timeout = None
+
+    def start(self):
+        self._schedule()
+
+    def stop(self):
+        if self._timeout:
+            ioloop.IOLoop.current().remove_timeout(self._timeout)
+            self._timeout = None
+
+    def _schedule(self):
+        expected = time.time() + self.interval
+        self._timeout = ioloop.IOLoop.current().call_later(
+            self.interval, self._tick, expected)
+
+    def _tick(self, expected):
+        self.lags.append(max(0, time.time() - expected))
+        self._schedule()
+
+
+def _timed(func, *args, **kwargs):
+    start = time.time()
+    ret = func(*args, **kwargs)
+    return ret, time.time() - start
+
+
+def run_scenario(name, latency=0):
+    """Runs one scenario in this process and returns its measurements."""
+    script, tokens, arrays = SCENARIOS[name]
+
+    config, parse_time = _timed(parse, script, tokens)
+    skip_sleeps(config)
+
+    results = {'parse': parse_time}
+    loop = ioloop.IOLoop.current()
+    lag = LagMonitor()
+
+    with fakes.installed(latency=latency, arrays=arrays) as (http, rs, aws):
+        dry_actor, dry_build = _timed(actor_utils.get_actor, config, True)
+        actor, build = _timed(actor_utils.get_actor, config, False)
+        results['build'] = dry_build + build
+
+        lag.start()
+        _, results['dry'] = _timed(loop.run_sync, dry_actor.execute)
+        _, results['run'] = _timed(loop.run_sync, actor.execute)
+        lag.stop()
+        results['http_requests'] = http.requests
+        results['rightscale_requests'] = rs.requests
+        results['aws_requests'] = aws.requests
+
+    results['lag_p95'] = summary.percentile(lag.lags, 95) or 0
+    results['lag_max'] = max(lag.lags or [0])
+    results['peak_rss_mb'] = (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+    return results
+
+
+def run_all(names, latency=0):
+    """Runs each scenario in a separate process.
+
+    Returns:
+        A dict of scenario names to their measurements.
+    """
+    results = {}
+    for name in names:
+        out = subprocess.check_output([
+            sys.executable, '-m', 'kingpin.benchmarks.deploy',
+            '--scenario', name, '--latency', str(latency), '--raw'])
+        results[name] = json.loads(out.splitlines()[-1])
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_last(path, latency):
+    """Returns the last stored results for the same latency, or None."""
+    last = None
+    if not os.path.exists(path):
+        return last
+    with open(path) as fh:
+        for line in fh:
+            entry = json.loads(line)
+            if entry['latency'] == latency:
+                last = entry
+    return last
+
+
+METRICS = ('parse', 'build', 'dry', 'run', 'lag_p95', 'lag_max',
+           'peak_rss_mb')
+
+
+def report(results, previous=None):
+    print('%-15s %s' % ('scenario', ' '.join('%16s' % m for m in METRICS)))
+    for name, measured in sorted(results.items()):
+        cells = []
+        for metric in METRICS:
+            cell = '%.3f' % measured[metric]
+            try:
+                before = previous['results'][name][metric]
+                cell += ' (%+.0f%%)' % ((measured[metric] - before) /
+                                        before * 100)
+            except (KeyError, TypeError, ZeroDivisionError):
+                pass
+            cells.append('%16s' % cell)
+        print('%-15s %s' % (name, ' '.join(cells)))
+    if previous:
+        print('(changes are relative to %s from %s)' %
+              (previous['commit'], previous['date']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--scenario', action='append', dest='scenarios',
+                        choices=sorted(SCENARIOS),
+                        help='Scenario to run (default: all of them)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Seconds each fake API call takes (default: 0)')
+    parser.add_argument('--save', help='Append the results to this file')
+    parser.add_argument('--compare',
+                        help='Compare with the last results in this file')
+    parser.add_argument('--raw', action='store_true',
+                        help=('Run a single scenario in this process and '
+                              'print its results as JSON'))
+    args = parser.parse_args()
+
+    # Kingpin's own log output would otherwise swamp the results
+    logging.disable(logging.WARNING)
+
+    if args.raw:
+        print(json.dumps(run_scenario(args.scenarios[0], args.latency)))
+        return
+
+    results = run_all(args.scenarios or sorted(SCENARIOS), args.latency)
+    previous = args.compare and load_last(args.compare, args.latency)
+    report(results, previous)
+
+    if args.save:
+        with open(args.save, 'a') as fh:
+            fh.write(json.dumps({
+                'commit': _commit(),
+                'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'latency': args.latency,
+                'results': results}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
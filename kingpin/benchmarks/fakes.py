@@ -0,0 +1,659 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+:mod:`kingpin.benchmarks.fakes`
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+In-process stand-ins for the remote APIs that Kingpin drives, so that whole
+deployment scripts can be run offline by :py:mod:`kingpin.benchmarks.deploy`.
+
+* :py:class:`FakeRightScaleAccount` replaces the `requests` session inside
+  python-rightscale's HTTP client, and keeps a small in-memory model of a
+  RightScale account (ServerArrays, their instances, RightScripts, tasks
+  and tags). Everything above the HTTP transport is the real code: the
+  python-rightscale resources and collections, and all of
+  :py:mod:`kingpin.actors.rightscale.api` -- the shared sessions, lookup
+  cache, retries, executor threads, task monitor and tag batching.
+* :py:class:`FakeAWSAccount` stands in for the boto and boto3 connections
+  that every :py:class:`~kingpin.actors.aws.base.AWSBaseActor` opens: the
+  boto IAM connection (users, groups, roles and their inline policies) and
+  the boto3 S3 client (buckets and their settings). The region-specific
+  connections that no benchmarked actor uses raise if they are called.
+* :py:class:`FakeHTTPClient` replaces the shared client handed out by
+  :py:func:`~kingpin.actors.support.http_client.get_client`, which serves
+  every :py:class:`~kingpin.actors.base.HTTPBaseActor` (HipChat, Slack, ...)
+  and :py:class:`~kingpin.actors.support.api.RestConsumer` endpoint.
+
+Every fake call takes `latency` seconds. RightScale and AWS calls block the
+executor thread they are made from, just like real ones do, and the Tornado
+HTTP calls wait on the IOLoop -- so the benchmarks measure Kingpin's own
+overhead on top of a predictable API.
+"""
+
+import contextlib
+import copy
+import itertools
+import json
+import re
+import StringIO
+import threading
+import time
+import urllib
+
+from botocore import exceptions as botocore_exceptions
+from tornado import gen
+from tornado import httpclient
+import boto.ec2
+import boto.ec2.elb
+import boto.exception
+import boto.iam.connection
+import boto.sqs
+import boto3
+import requests
+import simplejson
+
+from kingpin.actors import hipchat
+from kingpin.actors.rightscale import api as rs_api
+from kingpin.actors.rightscale import base as rs_base
+from kingpin.actors.support import http_client
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+CONTENT_TYPE = 'application/vnd.rightscale.%s+json'
+
+# Matches RightScale index filters, like 'state<>terminated'
+FILTER = re.compile(r'^(\w+)(==|<>)(.*)$')
+
+
+class FakeResponse(object):
+
+    """Just enough of a requests.Response for python-rightscale."""
+
+    def __init__(self, status_code=200, body=None, kind=None,
+                 collection=False, location=None):
+        self.status_code = status_code
+        self.text = '' if body is None else json.dumps(body)
+        self.content = self.text
+        self.headers = {}
+        if kind:
+            self.headers['content-type'] = CONTENT_TYPE % kind
+            if collection:
+                self.headers['content-type'] += ';type=collection'
+        if location:
+            self.headers['location'] = location
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return simplejson.loads(self.text)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.exceptions.HTTPError(
+                '%s Error' % self.status_code, response=self)
+
+
+def _pairs(params):
+    """Returns request params (a dict or a list of tuples) as a list."""
+    if not params:
+        return []
+    if isinstance(params, dict):
+        params = params.items()
+
+    pairs = []
+    for key, value in params:
+        if isinstance(value, list):
+            pairs.extend((key, v) for v in value)
+        else:
+            pairs.append((key, value))
+    return pairs
+
+
+def _matches(soul, filters):
+    for expression in filters:
+        key, op, value = FILTER.match(expression).groups()
+        if (str(soul.get(key)) == value) != (op == '=='):
+            return False
+    return True
+
+
+class FakeRightScaleAccount(object):
+
+    """In-memory RightScale account, served through a fake requests session.
+
+    The python-rightscale HTTP clients handed out by
+    :py:func:`~kingpin.actors.rightscale.api.get_session` use this object as
+    their `requests` session, so all of their API calls end up in
+    `request()`.
+
+    Args:
+        latency: Seconds every API call takes.
+        arrays: Dict of ServerArray names to their number of operational
+                instances.
+    """
+
+    def __init__(self, latency=0, arrays=None):
+        self.latency = latency
+        self.requests = 0
+        self.headers = {}
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._resources = {}
+        self._instances = {}
+        self._scripts = {}
+        self._tags = {}
+
+        self._routes = [
+            ('post', r'/api/oauth2$', self._login),
+            ('get', r'/api/sessions$', self._session),
+            ('get', r'/api/server_arrays$', self._find_arrays),
+            ('post', r'(/api/server_arrays/\d+)/clone$', self._clone),
+            ('post', r'(/api/server_arrays/\d+)/launch$', self._launch),
+            ('post', r'(/api/server_arrays/\d+)/multi_terminate$',
+             self._terminate),
+            ('get', r'(/api/server_arrays/\d+)/current_instances$',
+             self._current_instances),
+            ('get', r'/api/right_scripts$', self._find_right_scripts),
+            ('get', r'/inputs$', self._inputs),
+            ('put', r'/inputs/multi_update$', self._no_content),
+            ('post', r'(/api/clouds/\d+/instances/\d+)/run_executable$',
+             self._run_executable),
+            ('post', r'/api/tags/by_resource$', self._tags_by_resource),
+            ('post', r'/api/tags/multi_(add|delete)$', self._change_tags),
+            ('get', r'^(.*)$', self._show),
+            ('put', r'^(.*)$', self._update),
+            ('delete', r'^(.*)$', self._destroy),
+        ]
+
+        for name, count in sorted((arrays or {}).items()):
+            self._add_instances(self._new_array(name), count)
+
+    # requests.Session interface
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        """Answers one RightScale API call."""
+        if self.latency:
+            time.sleep(self.latency)
+
+        path = url.replace(rs_api.DEFAULT_ENDPOINT, '', 1).rstrip('/')
+        with self._lock:
+            self.requests += 1
+            for verb, pattern, handler in self._routes:
+                match = re.search(pattern, path)
+                if verb == method.lower() and match:
+                    return handler(match, _pairs(params) + _pairs(data))
+        return FakeResponse(404)
+
+    # The account model
+
+    def _add(self, href, kind, soul, links=()):
+        soul['links'] = [{'rel': 'self', 'href': href}]
+        soul['links'].extend({'rel': rel, 'href': '%s/%s' % (href, rel)}
+                             for rel in links)
+        self._resources[href] = (kind, soul)
+        return href
+
+    def _new_href(self, collection):
+        return '%s/%s' % (collection, next(self._ids))
+
+    def _new_instance(self, name, state):
+        href = self._new_href('/api/clouds/1/instances')
+        return self._add(href, 'instance', {'name': name, 'state': state},
+                         links=('inputs',))
+
+    def _new_array(self, name, soul=None):
+        href = self._new_href('/api/server_arrays')
+        soul = soul or {
+            'state': 'disabled',
+            'elasticity_params': {'bounds': {'min_count': '1',
+                                             'max_count': '2'}}}
+        soul['name'] = name
+        self._add(href, 'server_array', soul, links=('current_instances',))
+        next_instance = self._new_instance('%s next' % name, 'inactive')
+        soul['links'].append({'rel': 'next_instance', 'href': next_instance})
+        self._instances[href] = []
+        return href
+
+    def _add_instances(self, array, count):
+        name = '%s instance' % self._resources[array][1]['name']
+        self._instances[array].extend(
+            self._new_instance(name, 'operational') for _ in range(count))
+
+    def _new_task(self, owner):
+        href = self._new_href('%s/live/tasks' % owner)
+        return self._add(href, 'task', {'summary': 'completed: benchmark'})
+
+    def _listing(self, kind, hrefs):
+        return FakeResponse(body=[self._resources[h][1] for h in hrefs],
+                            kind=kind, collection=True)
+
+    def _created(self, href, status_code=201):
+        return FakeResponse(status_code, location=href)
+
+    def _no_content(self, match, params):
+        return FakeResponse(204)
+
+    # Routes
+
+    def _login(self, match, params):
+        return FakeResponse(body={'access_token': 'benchmark',
+                                  'expires_in': 7200})
+
+    def _session(self, match, params):
+        return FakeResponse(body={'links': []}, kind='session')
+
+    def _find_arrays(self, match, params):
+        names = [v[len('name=='):] for k, v in params if k == 'filter[]']
+        found = [href for href, (kind, soul) in sorted(self._resources.items())
+                 if kind == 'server_array' and
+                 all(n in soul['name'] for n in names)]
+        return self._listing('server_array', found)
+
+    def _clone(self, match, params):
+        soul = copy.deepcopy(self._resources[match.group(1)][1])
+        soul.pop('links')
+        return self._created(self._new_array('%s v1' % soul['name'], soul))
+
+    def _launch(self, match, params):
+        self._add_instances(match.group(1), int(dict(params).get('count', 1)))
+        return FakeResponse(202)
+
+    def _terminate(self, match, params):
+        array = match.group(1)
+        for href in self._instances[array]:
+            self._resources[href][1]['state'] = 'terminated'
+        return self._created(self._new_task(array), 202)
+
+    def _current_instances(self, match, params):
+        filters = [v for k, v in params if k == 'filter[]']
+        found = [href for href in self._instances[match.group(1)]
+                 if _matches(self._resources[href][1], filters)]
+        return self._listing('instance', found)
+
+    def _find_right_scripts(self, match, params):
+        names = [v[len('name=='):] for k, v in params if k == 'filter[]']
+        for name in names:
+            if name not in self._scripts:
+                self._scripts[name] = self._add(
+                    self._new_href('/api/right_scripts'), 'right_script',
+                    {'name': name})
+        return self._listing('right_script',
+                             [self._scripts[n] for n in names])
+
+    def _inputs(self, match, params):
+        return FakeResponse(body=[], kind='input', collection=True)
+
+    def _run_executable(self, match, params):
+        return self._created(self._new_task(match.group(1)), 202)
+
+    def _tags_by_resource(self, match, params):
+        body = [{'tags': [{'name': t} for t in sorted(self._tags.get(v, []))],
+                 'links': [{'rel': 'resource', 'href': v}]}
+                for k, v in params if k == 'resource_hrefs[]']
+        return FakeResponse(body=body, kind='resource_tag', collection=True)
+
+    def _change_tags(self, match, params):
+        tags = [v for k, v in params if k == 'tags[]']
+        for key, href in params:
+            if key != 'resource_hrefs[]':
+                continue
+            existing = self._tags.setdefault(href, set())
+            if match.group(1) == 'add':
+                existing.update(tags)
+            else:
+                existing.difference_update(tags)
+        return FakeResponse(204)
+
+    def _show(self, match, params):
+        if match.group(1) not in self._resources:
+            return FakeResponse(404)
+        kind, soul = self._resources[match.group(1)]
+        return FakeResponse(body=soul, kind=kind)
+
+    def _update(self, match, params):
+        if match.group(1) not in self._resources:
+            return FakeResponse(404)
+        soul = self._resources[match.group(1)][1]
+        # 'server_array[elasticity_params][bounds][min_count]' and the like
+        for key, value in params:
+            keys = re.findall(r'\[(\w+)\]', key)
+            target = soul
+            for name in keys[:-1]:
+                target = target.setdefault(name, {})
+            target[keys[-1]] = value
+        return FakeResponse(204)
+
+    def _destroy(self, match, params):
+        if self._resources.pop(match.group(1), None) is None:
+            return FakeResponse(404)
+        return FakeResponse(204)
+
+
+class FakeAWSConnection(object):
+
+    """A boto or boto3 connection whose calls are all unsupported."""
+
+    def __init__(self, service):
+        self.service = service
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def unsupported(*args, **kwargs):
+            raise NotImplementedError(
+                'The fake %s connection does not support %s()' %
+                (self.service, name))
+        return unsupported
+
+
+def _client_error(code, operation):
+    return botocore_exceptions.ClientError(
+        {'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class FakeAWSAccount(object):
+
+    """In-memory AWS account, served through fake boto/boto3 connections.
+
+    `iam` answers like a `boto.iam.connection.IAMConnection`, and `s3` like
+    a boto3 S3 client. Only the calls that the IAM User/Group/Role and S3
+    Bucket actors make to create and configure their resources are
+    implemented, the others raise NotImplementedError.
+
+    Args:
+        latency: Seconds every API call takes.
+    """
+
+    ENTITIES = ('user', 'group', 'role')
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.requests = 0
+
+        self._lock = threading.Lock()
+        # Entity kind -> name -> {'policies': {}, 'groups': set(), ...}
+        self._entities = dict((kind, {}) for kind in self.ENTITIES)
+        # Bucket name -> settings dict
+        self._buckets = {}
+
+        self.iam = _FakeIAM(self)
+        self.s3 = _FakeS3(self)
+
+    def call(self, handler, *args, **kwargs):
+        """Answers one AWS API call."""
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.requests += 1
+            return handler(*args, **kwargs)
+
+    def client(self, service, **kwargs):
+        """Stands in for boto3.client()."""
+        if service == 's3':
+            return self.s3
+        return FakeAWSConnection(service)
+
+    def entity(self, kind, name):
+        if name not in self._entities[kind]:
+            raise boto.exception.BotoServerError(404, 'Not Found')
+        return self._entities[kind][name]
+
+
+def _api(method):
+    """Runs a fake connection method through FakeAWSAccount.call()."""
+    def wrapper(self, *args, **kwargs):
+        return self._account.call(method, self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+class _FakeIAM(FakeAWSConnection):
+
+    """The boto IAM connection of a FakeAWSAccount."""
+
+    # boto method name -> (handler, entity kind)
+    METHODS = {
+        'get_all_users': ('_list', 'user'),
+        'get_all_groups': ('_list', 'group'),
+        'list_roles': ('_list', 'role'),
+        'create_user': ('_create', 'user'),
+        'create_group': ('_create', 'group'),
+        'create_role': ('_create', 'role'),
+        'get_all_user_policies': ('_list_policies', 'user'),
+        'get_all_group_policies': ('_list_policies', 'group'),
+        'list_role_policies': ('_list_policies', 'role'),
+        'get_user_policy': ('_get_policy', 'user'),
+        'get_group_policy': ('_get_policy', 'group'),
+        'get_role_policy': ('_get_policy', 'role'),
+        'put_user_policy': ('_put_policy', 'user'),
+        'put_group_policy': ('_put_policy', 'group'),
+        'put_role_policy': ('_put_policy', 'role'),
+    }
+
+    def __init__(self, account):
+        super(_FakeIAM, self).__init__('iam')
+        self._account = account
+
+    def __getattr__(self, name):
+        if name not in self.METHODS:
+            return super(_FakeIAM, self).__getattr__(name)
+        handler, kind = self.METHODS[name]
+        handler = getattr(self, handler)
+        return lambda *args, **kwargs: self._account.call(
+            handler, kind, *args, **kwargs)
+
+    def _list(self, kind, max_items=None, marker=None):
+        entities = [dict(e['info']) for _, e in
+                    sorted(self._account._entities[kind].items())]
+        return {'list_%ss_response' % kind: {'list_%ss_result' % kind: {
+            'is_truncated': 'false', '%ss' % kind: entities}}}
+
+    def _create(self, kind, name, *args, **kwargs):
+        info = {'%s_name' % kind: name,
+                'arn': 'arn:aws:iam::123456789012:%s/%s' % (kind, name),
+                'assume_role_policy_document': urllib.quote('{}')}
+        self._account._entities[kind][name] = {
+            'info': info, 'policies': {}, 'groups': set()}
+        return {'create_%s_response' % kind: {'create_%s_result' % kind: {
+            kind: info}}}
+
+    def _list_policies(self, kind, name):
+        names = sorted(self._account.entity(kind, name)['policies'])
+        return {'list_%s_policies_response' % kind: {
+            'list_%s_policies_result' % kind: {'policy_names': names}}}
+
+    def _get_policy(self, kind, name, policy_name):
+        doc = self._account.entity(kind, name)['policies'][policy_name]
+        return {'get_%s_policy_response' % kind: {
+            'get_%s_policy_result' % kind: {
+                'policy_document': urllib.quote(doc)}}}
+
+    def _put_policy(self, kind, name, policy_name, doc):
+        self._account.entity(kind, name)['policies'][policy_name] = doc
+
+    @_api
+    def get_groups_for_user(self, name):
+        groups = sorted(self._account.entity('user', name)['groups'])
+        return {'list_groups_for_user_response': {
+            'list_groups_for_user_result': {
+                'groups': [{'group_name': g} for g in groups]}}}
+
+    @_api
+    def add_user_to_group(self, group, name):
+        self._account.entity('group', group)
+        self._account.entity('user', name)['groups'].add(group)
+
+    @_api
+    def update_assume_role_policy(self, name, doc):
+        info = self._account.entity('role', name)['info']
+        info['assume_role_policy_document'] = urllib.quote(doc)
+
+
+class _FakeS3(FakeAWSConnection):
+
+    """The boto3 S3 client of a FakeAWSAccount."""
+
+    def __init__(self, account):
+        super(_FakeS3, self).__init__('s3')
+        self._account = account
+
+    def _bucket(self, name):
+        if name not in self._account._buckets:
+            raise _client_error('NoSuchBucket', 'GetBucket')
+        return self._account._buckets[name]
+
+    def _get(self, name, key, missing, operation):
+        value = self._bucket(name).get(key)
+        if value is None:
+            raise _client_error(missing, operation)
+        return copy.deepcopy(value)
+
+    @_api
+    def list_buckets(self):
+        return {'Buckets': [{'Name': name}
+                            for name in sorted(self._account._buckets)]}
+
+    @_api
+    def create_bucket(self, Bucket, **kwargs):
+        self._account._buckets[Bucket] = {'logging': {}, 'versioning': {}}
+
+    @_api
+    def get_bucket_policy(self, Bucket):
+        return {'Policy': self._get(Bucket, 'policy', 'NoSuchBucketPolicy',
+                                    'GetBucketPolicy')}
+
+    @_api
+    def put_bucket_policy(self, Bucket, Policy):
+        self._bucket(Bucket)['policy'] = Policy
+
+    @_api
+    def get_bucket_logging(self, Bucket):
+        return copy.deepcopy(self._bucket(Bucket)['logging'])
+
+    @_api
+    def put_bucket_logging(self, Bucket, BucketLoggingStatus):
+        self._bucket(Bucket)['logging'] = BucketLoggingStatus
+
+    @_api
+    def get_bucket_versioning(self, Bucket):
+        return copy.deepcopy(self._bucket(Bucket)['versioning'])
+
+    @_api
+    def put_bucket_versioning(self, Bucket, VersioningConfiguration):
+        self._bucket(Bucket)['versioning'] = VersioningConfiguration
+
+    @_api
+    def get_bucket_lifecycle(self, Bucket):
+        return {'Rules': self._get(Bucket, 'lifecycle',
+                                   'NoSuchLifecycleConfiguration',
+                                   'GetBucketLifecycle')}
+
+    @_api
+    def put_bucket_lifecycle(self, Bucket, LifecycleConfiguration):
+        self._bucket(Bucket)['lifecycle'] = LifecycleConfiguration['Rules']
+
+    @_api
+    def get_bucket_tagging(self, Bucket):
+        return {'TagSet': self._get(Bucket, 'tags', 'NoSuchTagSet',
+                                    'GetBucketTagging')}
+
+    @_api
+    def put_bucket_tagging(self, Bucket, Tagging):
+        self._bucket(Bucket)['tags'] = Tagging['TagSet']
+
+
+class FakeHTTPClient(object):
+
+    """Replacement for the shared HTTP client that answers every request.
+
+    The body is a minimal JSON object that the HTTP based actors accept as a
+    successful reply.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.requests = 0
+
+    @gen.coroutine
+    def fetch(self, request, **kwargs):
+        if not isinstance(request, httpclient.HTTPRequest):
+            request = httpclient.HTTPRequest(request, **kwargs)
+
+        self.requests += 1
+        yield gen.sleep(self.latency) if self.latency else gen.moment
+        raise gen.Return(httpclient.HTTPResponse(
+            request, 200, buffer=StringIO.StringIO('{"status": "ok"}')))
+
+
+@contextlib.contextmanager
+def installed(latency=0, arrays=None):
+    """Swaps the fakes in for the real API transports.
+
+    Args:
+        latency: Seconds every fake API call takes.
+        arrays: Dict of RightScale ServerArray names to create, and how many
+                operational instances each one has.
+
+    Yields:
+        The (FakeHTTPClient, FakeRightScaleAccount, FakeAWSAccount) in use,
+        so that their request counts can be read.
+    """
+    account = FakeRightScaleAccount(latency=latency, arrays=arrays)
+    aws = FakeAWSAccount(latency=latency)
+    fake_http = FakeHTTPClient(latency=latency)
+
+    rs_actor = rs_base.RightScaleBaseActor
+    saved = (rs_api.get_session, rs_base.TOKEN, rs_actor.account_name,
+             hipchat.TOKEN, http_client.get_client)
+    saved_aws = (boto.iam.connection.IAMConnection, boto.ec2.connect_to_region,
+                 boto.ec2.elb.connect_to_region, boto.sqs.connect_to_region,
+                 boto3.client)
+
+    def get_session(*args, **kwargs):
+        session = saved[0](*args, **kwargs)
+        session.client._new_session = lambda: account
+        return session
+
+    def connect_to(service):
+        return lambda region, **kwargs: FakeAWSConnection(service)
+
+    rs_api.reset_sessions()
+    rs_api.get_session = get_session
+    rs_base.TOKEN = 'benchmark'
+    rs_actor.account_name = 'benchmark'
+    hipchat.TOKEN = 'benchmark'
+    http_client.get_client = lambda: fake_http
+    boto.iam.connection.IAMConnection = lambda **kwargs: aws.iam
+    boto.ec2.connect_to_region = connect_to('ec2')
+    boto.ec2.elb.connect_to_region = connect_to('elb')
+    boto.sqs.connect_to_region = connect_to('sqs')
+    boto3.client = aws.client
+    try:
+        yield fake_http, account, aws
+    finally:
+        (rs_api.get_session, rs_base.TOKEN, rs_actor.account_name,
+         hipchat.TOKEN, http_client.get_client) = saved
+        (boto.iam.connection.IAMConnection, boto.ec2.connect_to_region,
+         boto.ec2.elb.connect_to_region, boto.sqs.connect_to_region,
+         boto3.client) = saved_aws
+        rs_api.reset_sessions()
@@ -0,0 +1,142 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+:mod:`kingpin.benchmarks.rest_consumer`
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+Measures the cost of building and walking a
+:py:class:`~kingpin.actors.support.api.RestConsumer` tree, compared to the
+original implementation that re-generated every access method on every
+instance.
+
+    $ python -m kingpin.benchmarks.rest_consumer
+"""
+
+import timeit
+import types
+
+from kingpin.actors.support import api
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+ITERATIONS = 20000
+
+CONFIG = {
+    'attrs': {
+        'aws': {
+            'attrs': {
+                'ec2': {
+                    'path': '/aws/ec2',
+                    'attrs': {
+                        'list_groups': {
+                            'path': '/aws/ec2/group',
+                            'http_methods': {'get': {}, 'post': {}},
+                        },
+                        'group': {
+                            'path': '/aws/ec2/group/%id%',
+                            'http_methods': {'get': {}, 'put': {},
+                                             'delete': {}},
+                        },
+                    }
+                }
+            }
+        }
+    }
+}
+
+
+class LegacyRestConsumer(object):
+
+    """The per-instance method generation that RestConsumer used to do."""
+
+    _CONFIG = CONFIG
+    _ENDPOINT = 'http://benchmark'
+
+    def __init__(self, name=None, config=None, client=None, *args, **kwargs):
+        config = config or self._CONFIG
+        self._path = config.get('path', None)
+        self._http_methods = config.get('http_methods', None)
+        self._attrs = config.get('attrs', None)
+        self._kwargs = kwargs
+        self._client = client
+        if self._path:
+            self._path = api.utils.populate_with_tokens(self._path, kwargs)
+
+        for name in (self._http_methods or {}).keys():
+            full_method_name = 'http_%s' % name
+            method = api.create_http_method(full_method_name, name)
+            setattr(self, full_method_name,
+                    types.MethodType(method, self, self.__class__))
+
+        for name in (self._attrs or {}).keys():
+            method = self._create_legacy_method(name)
+            setattr(self, name, types.MethodType(method, self, self.__class__))
+
+    @staticmethod
+    def _create_legacy_method(name):
+        def method(self, *args, **kwargs):
+            merged_kwargs = dict(self._kwargs.items() + kwargs.items())
+            return self.__class__(name=name, config=self._attrs[name],
+                                  client=self._client, *args, **merged_kwargs)
+        return method
+
+
+class BenchmarkRestConsumer(api.RestConsumer):
+
+    _CONFIG = CONFIG
+    _ENDPOINT = 'http://benchmark'
+
+
+def _time(func, iterations):
+    """Returns the average time of func() in microseconds."""
+    return timeit.timeit(func, number=iterations) / iterations * 1e6
+
+
+def run(iterations=ITERATIONS):
+    """Runs all of the scenarios against both implementations.
+
+    Returns:
+        A list of (scenario, legacy usec/op, current usec/op) tuples.
+    """
+    client = object()
+    legacy = LegacyRestConsumer(client=client)
+    current = BenchmarkRestConsumer(client=client)
+
+    scenarios = [
+        ('construct root',
+         lambda c: lambda: c.__class__(client=client)),
+        ('walk 3 levels',
+         lambda c: lambda: c.aws().ec2().list_groups()),
+        ('walk 3 levels with a path token',
+         lambda c: lambda: c.aws().ec2().group(id='sig-1234')),
+    ]
+
+    results = []
+    for name, scenario in scenarios:
+        results.append((name,
+                        _time(scenario(legacy), iterations),
+                        _time(scenario(current), iterations)))
+    return results
+
+
+def main():
+    print('%-35s %12s %12s %8s' % ('scenario', 'legacy', 'current', 'speedup'))
+    for name, legacy, current in run():
+        print('%-35s %10.2fus %10.2fus %7.1fx' % (
+            name, legacy, current, legacy / current))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2014 Nextdoor.com, Inc
+"""
+:mod:`kingpin.benchmarks.startup`
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+Startup time of the ``kingpin`` command (:py:mod:`kingpin.bin.deploy`). Each
+scenario starts a fresh interpreter a number of times, and the fastest and
+median wall clock times are reported:
+
+* ``python``: the bare interpreter, for reference
+* ``import``: importing :py:mod:`kingpin.bin.deploy`
+* ``explain``: ``kingpin --explain --actor misc.Sleep``
+* ``sleep``: ``kingpin --script`` with a single ``misc.Sleep`` actor
+
+Slow third party modules that got loaded by the import alone are listed, too
+-- they should only be loaded by the actors (or features) that need them::
+
+    $ python -m kingpin.benchmarks.startup --runs 20
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+RUNS = 10
+
+# Third party modules that take a noticeable time to import
+HEAVY_MODULES = ('boto', 'boto3', 'demjson', 'jsonschema',
+                 'rainbow_logging_handler', 'requests', 'rightscale', 'yaml')
+
+SLEEP_SCRIPT = {'actor': 'misc.Sleep', 'desc': 'Sleep',
+                'options': {'sleep': 0}}
+
+
+def scenarios(script):
+    """Returns the interpreter arguments of each scenario."""
+    deploy = ['-m', 'kingpin.bin.deploy', '--level', 'error']
+    return {
+        'python': ['-c', 'pass'],
+        'import': ['-c', 'import kingpin.bin.deploy'],
+        'explain': deploy + ['--explain', '--actor', 'misc.Sleep'],
+        'sleep': deploy + ['--script', script],
+    }
+
+
+def _time(args, runs):
+    """Returns the wall clock times of `runs` fresh interpreters."""
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.check_call([sys.executable] + args,
+                                  stdout=devnull, stderr=devnull)
+            times.append(time.time() - start)
+    return sorted(times)
+
+
+def heavy_imports():
+    """Returns the HEAVY_MODULES loaded by importing kingpin.bin.deploy."""
+    out = subprocess.check_output([
+        sys.executable, '-c',
+        'import json, sys, kingpin.bin.deploy; '
+        'print(json.dumps(sorted(sys.modules)))'])
+    loaded = json.loads(out.splitlines()[-1])
+    return [m for m in HEAVY_MODULES if m in loaded]
+
+
+def run(runs=RUNS):
+    """Runs every scenario.
+
+    Returns:
+        A dict of scenario names to (fastest, median) seconds.
+    """
+    fd, script = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(SLEEP_SCRIPT, fh)
+
+    results = {}
+    try:
+        for name, args in scenarios(script).items():
+            times = _time(args, runs)
+            results[name] = (times[0], times[len(times) / 2])
+    finally:
+        os.remove(script)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--runs', type=int, default=RUNS,
+                        help='Processes started per scenario (default: %s)' %
+                        RUNS)
+    args = parser.parse_args()
+
+    results = run(args.runs)
+    print('%-10s %10s %10s' % ('scenario', 'fastest', 'median'))
+    for name in ('python', 'import', 'explain', 'sleep'):
+        print('%-10s %9.3fs %9.3fs' % ((name,) + results[name]))
+    print('Heavy modules loaded by the import: %s' %
+          (', '.join(heavy_imports()) or 'none'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Tests for the benchmarks.deploy module."""
+
+import json
+import logging
+import os
+import subprocess
+import tempfile
+
+import mock
+
+from tornado import gen
+from tornado import testing
+
+from kingpin.actors.aws import iam
+from kingpin.actors.aws import s3
+from kingpin.actors.aws.iam import base as iam_base
+from kingpin.actors.aws.iam import entities
+from kingpin.benchmarks import deploy
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+METRICS = ('parse', 'build', 'dry', 'run', 'lag_p95', 'lag_max',
+           'peak_rss_mb', 'http_requests', 'rightscale_requests',
+           'aws_requests')
+
+
+class TestScenarios(testing.AsyncTestCase):
+
+    # Small enough to run in a unit test, large enough to take two stages
+    SCENARIOS = dict(deploy.SCENARIOS, **{
+        'synthetic-1k': (deploy.synthetic_script(150), {},
+                         {deploy.SOURCE_ARRAY: 2}),
+        'synthetic-10k': (deploy.synthetic_script(10), {},
+                          {deploy.SOURCE_ARRAY: 2}),
+    })
+
+    def setUp(self):
+        super(TestScenarios, self).setUp()
+        # Other tests reload the AWS base actor, so the actors built by the
+        # scenarios have to be reloaded on top of it.
+        reload(iam_base)
+        reload(entities)
+        reload(iam)
+        reload(s3)
+
+    def run_scenario(self, name):
+        with mock.patch.dict(deploy.SCENARIOS, self.SCENARIOS):
+            results = deploy.run_scenario(name)
+        self.assertEquals(sorted(results), sorted(METRICS))
+        return results
+
+    def test_release(self):
+        results = self.run_scenario('release')
+        self.assertEquals(results['http_requests'], 2)
+        self.assertGreater(results['rightscale_requests'], 0)
+
+    def test_aws(self):
+        results = self.run_scenario('aws')
+        self.assertGreater(results['aws_requests'], 0)
+
+    def test_synthetic(self):
+        for name in ('synthetic-1k', 'synthetic-10k'):
+            results = self.run_scenario(name)
+            self.assertGreater(results['rightscale_requests'], 0)
+
+    def test_examples_exist(self):
+        for script, _, _ in deploy.SCENARIOS.values():
+            if not isinstance(script, dict):
+                self.assertTrue(os.path.exists(script))
+
+    def test_skip_sleeps(self):
+        config = {'actor': 'group.Sync', 'options': {'acts': [
+            {'actor': 'misc.Sleep', 'options': {'sleep': 60}},
+            {'actor': 'misc.Note', 'options': {'message': 'hi'}}]}}
+        deploy.skip_sleeps(config)
+        self.assertEquals(config['options']['acts'][0]['options']['sleep'], 0)
+
+
+class TestLagMonitor(testing.AsyncTestCase):
+
+    @testing.gen_test
+    def test_lags(self):
+        lag = deploy.LagMonitor(interval=0.001)
+        lag.start()
+        yield gen.sleep(0.05)
+        lag.stop()
+        lag.stop()
+        self.assertTrue(lag.lags)
+
+
+class TestResults(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(TestResults, self).setUp()
+        fd, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        os.remove(self.path)
+
+    def tearDown(self):
+        super(TestResults, self).tearDown()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        logging.disable(logging.NOTSET)
+
+    def measured(self, value):
+        return dict((metric, value) for metric in deploy.METRICS)
+
+    @mock.patch.object(subprocess, 'check_output')
+    def test_run_all(self, check_output):
+        check_output.return_value = 'some output\n{"run": 1.0}\n'
+        self.assertEquals(deploy.run_all(['release', 'aws'], 0.1),
+                          {'release': {'run': 1.0}, 'aws': {'run': 1.0}})
+        self.assertEquals(check_output.call_args[0][0][-5:],
+                          ['--scenario', 'aws', '--latency', '0.1', '--raw'])
+
+    @mock.patch.object(subprocess, 'check_output')
+    def test_commit(self, check_output):
+        check_output.return_value = 'abc1234\n'
+        self.assertEquals(deploy._commit(), 'abc1234')
+        check_output.side_effect = OSError()
+        self.assertEquals(deploy._commit(), None)
+
+    def test_load_last(self):
+        self.assertEquals(deploy.load_last(self.path, 0), None)
+        with open(self.path, 'w') as fh:
+            for commit, latency in (('a', 0), ('b', 0.1), ('c', 0)):
+                fh.write(json.dumps(
+                    {'commit': commit, 'latency': latency}) + '\n')
+        self.assertEquals(deploy.load_last(self.path, 0)['commit'], 'c')
+        self.assertEquals(deploy.load_last(self.path, 1), None)
+
+    @mock.patch('sys.stdout')
+    def test_report(self, stdout):
+        previous = {'commit': 'abc', 'date': 'today', 'results': {
+            'release': self.measured(1.0), 'aws': self.measured(0)}}
+        deploy.report({'release': self.measured(1.5),
+                       'aws': self.measured(1.0),
+                       'synthetic-1k': self.measured(1.0)}, previous)
+        out = ''.join(c[0][0] for c in stdout.write.call_args_list)
+        self.assertIn('1.500 (+50%)', out)
+        self.assertIn('relative to abc from today', out)
+
+    @mock.patch('sys.stdout')
+    def test_main_raw(self, stdout):
+        with mock.patch.object(deploy, 'run_scenario') as run_scenario:
+            run_scenario.return_value = {'run': 1.0}
+            with mock.patch('sys.argv', ['deploy', '--scenario', 'aws',
+                                         '--raw', '--latency', '0.5']):
+                deploy.main()
+        run_scenario.assert_called_once_with('aws', 0.5)
+        self.assertIn('{"run": 1.0}', stdout.write.call_args_list[0][0][0])
+
+    @mock.patch('sys.stdout')
+    def test_main(self, stdout):
+        argv = ['deploy', '--save', self.path, '--compare', self.path]
+        with mock.patch.object(deploy, 'run_all') as run_all:
+            run_all.return_value = {'release': self.measured(1.0)}
+            with mock.patch('sys.argv', argv):
+                deploy.main()
+                deploy.main()
+        run_all.assert_called_with(sorted(deploy.SCENARIOS), 0)
+
+        with open(self.path) as fh:
+            saved = [json.loads(line) for line in fh]
+        self.assertEquals(len(saved), 2)
+        self.assertEquals(saved[1]['results'],
+                          {'release': self.measured(1.0)})
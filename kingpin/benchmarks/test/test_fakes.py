@@ -0,0 +1,220 @@
+"""Tests for the benchmarks.fakes module."""
+
+import boto.ec2
+import boto.exception
+import boto.iam.connection
+import boto3
+import mock
+import requests
+
+from botocore import exceptions as botocore_exceptions
+from tornado import httpclient
+from tornado import testing
+
+from kingpin.actors import hipchat
+from kingpin.actors.aws import s3
+from kingpin.actors.aws.iam import base as iam_base
+from kingpin.actors.aws.iam import entities
+from kingpin.actors.rightscale import api as rs_api
+from kingpin.actors.rightscale import server_array
+from kingpin.actors.support import http_client
+from kingpin.benchmarks import deploy
+from kingpin.benchmarks import fakes
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+class TestFakeRightScaleAccount(testing.AsyncTestCase):
+
+    def test_transport(self):
+        account = fakes.FakeRightScaleAccount(latency=0.5)
+        account.mount('https://', None)
+        url = rs_api.DEFAULT_ENDPOINT + '/api/nothing/1'
+        with mock.patch.object(fakes.time, 'sleep') as sleep:
+            for method in ('GET', 'PUT', 'DELETE', 'PATCH'):
+                response = account.request(method, url)
+                self.assertEquals(response.status_code, 404)
+                with self.assertRaises(requests.exceptions.HTTPError):
+                    response.raise_for_status()
+        self.assertEquals(sleep.call_count, 4)
+        self.assertEquals(account.requests, 4)
+
+    @testing.gen_test
+    def test_actors(self):
+        with fakes.installed(arrays={'array': 1}) as (_, rs, _):
+            yield server_array.Update('Update', {
+                'array': 'array', 'inputs': {'ELB_NAME': 'text:elb'},
+                'params': {'elasticity_params': {'bounds': {
+                    'min_count': 3}}}}).execute()
+            yield server_array.Launch('Launch', {
+                'array': 'array', 'count': 2}).execute()
+            array = [soul for kind, soul in rs._resources.values()
+                     if kind == 'server_array'][0]
+            self.assertEquals(
+                array['elasticity_params']['bounds']['min_count'], 3)
+            self.assertEquals(len(rs._instances[array['links'][0]['href']]),
+                              3)
+
+            yield server_array.Destroy('Destroy', {
+                'array': 'array'}).execute()
+            self.assertEquals([kind for kind, soul in rs._resources.values()
+                               if kind == 'server_array'], [])
+
+    @testing.gen_test
+    def test_client(self):
+        with fakes.installed(arrays={'array': 1}):
+            client = rs_api.RightScale('benchmark')
+            array = yield client.find_server_arrays('array')
+            inputs = yield client.get_server_array_inputs(array)
+            yield client.add_resource_tags(array, ['a', 'b'])
+            yield client.delete_resource_tags(array, ['a'])
+            tags = yield client.get_resource_tags(array)
+        self.assertEquals(inputs, [])
+        self.assertEquals(tags, ['b'])
+
+
+class TestFakeAWSAccount(testing.AsyncTestCase):
+
+    def setUp(self):
+        super(TestFakeAWSAccount, self).setUp()
+        self.account = fakes.FakeAWSAccount()
+        reload(iam_base)
+        reload(entities)
+        reload(s3)
+
+    def test_unsupported_calls(self):
+        conn = self.account.client('ecs')
+        self.assertEquals(conn.service, 'ecs')
+        with self.assertRaises(NotImplementedError):
+            conn.describe_services()
+        with self.assertRaises(NotImplementedError):
+            self.account.iam.delete_user('user')
+        with self.assertRaises(AttributeError):
+            conn._private
+
+    def test_latency(self):
+        account = fakes.FakeAWSAccount(latency=0.5)
+        with mock.patch.object(fakes.time, 'sleep') as sleep:
+            account.iam.get_all_users()
+        sleep.assert_called_once_with(0.5)
+        self.assertEquals(account.requests, 1)
+
+    def test_iam(self):
+        iam = self.account.iam
+        iam.create_group('admins')
+        iam.create_user('bob')
+        iam.create_role('lambda')
+        iam.add_user_to_group('admins', 'bob')
+        iam.put_user_policy('bob', 's3', '{"a": 1}')
+        iam.update_assume_role_policy('lambda', '{"b": 2}')
+
+        users = iam.get_all_users()['list_users_response']
+        self.assertEquals(
+            users['list_users_result']['users'][0]['user_name'], 'bob')
+        groups = iam.get_groups_for_user('bob')
+        self.assertEquals(
+            groups['list_groups_for_user_response'][
+                'list_groups_for_user_result']['groups'],
+            [{'group_name': 'admins'}])
+        policies = iam.get_all_user_policies('bob')
+        self.assertEquals(
+            policies['list_user_policies_response'][
+                'list_user_policies_result']['policy_names'], ['s3'])
+        policy = iam.get_user_policy('bob', 's3')
+        self.assertEquals(
+            policy['get_user_policy_response']['get_user_policy_result'][
+                'policy_document'], '%7B%22a%22%3A%201%7D')
+        role = iam.list_roles()['list_roles_response'][
+            'list_roles_result']['roles'][0]
+        self.assertEquals(role['assume_role_policy_document'],
+                          '%7B%22b%22%3A%202%7D')
+        self.assertEquals(self.account.requests, 11)
+
+    def test_iam_missing_entities(self):
+        with self.assertRaises(boto.exception.BotoServerError):
+            self.account.iam.get_all_group_policies('admins')
+        self.account.iam.create_user('bob')
+        with self.assertRaises(boto.exception.BotoServerError):
+            self.account.iam.add_user_to_group('admins', 'bob')
+
+    def test_s3(self):
+        s3_conn = self.account.client('s3', region_name='us-west-2')
+        with self.assertRaises(botocore_exceptions.ClientError):
+            s3_conn.get_bucket_logging(Bucket='logs')
+
+        s3_conn.create_bucket(Bucket='logs')
+        self.assertEquals(s3_conn.list_buckets(),
+                          {'Buckets': [{'Name': 'logs'}]})
+        for getter, code in (
+                (s3_conn.get_bucket_policy, 'NoSuchBucketPolicy'),
+                (s3_conn.get_bucket_lifecycle, 'NoSuchLifecycleConfiguration'),
+                (s3_conn.get_bucket_tagging, 'NoSuchTagSet')):
+            with self.assertRaises(botocore_exceptions.ClientError) as e:
+                getter(Bucket='logs')
+            self.assertIn(code, e.exception.message)
+
+        s3_conn.put_bucket_tagging(Bucket='logs', Tagging={'TagSet': [1]})
+        tags = s3_conn.get_bucket_tagging(Bucket='logs')
+        tags['TagSet'].append(2)
+        self.assertEquals(s3_conn.get_bucket_tagging(Bucket='logs'),
+                          {'TagSet': [1]})
+
+    @testing.gen_test
+    def test_actors_rerun_without_changes(self):
+        # A second run finds everything the first one set up, so it only
+        # reads the settings back.
+        script = deploy.aws_script(count=1)['options']['acts']
+        acts = [act for group in script for act in group['options']['acts']]
+        classes = {'aws.iam.Group': entities.Group,
+                   'aws.iam.User': entities.User,
+                   'aws.iam.Role': entities.Role,
+                   'aws.s3.Bucket': s3.Bucket}
+
+        with fakes.installed() as (_, _, aws):
+            for act in acts:
+                yield classes[act['actor']](
+                    act['desc'], act['options']).execute()
+            state = repr((aws._entities, aws._buckets))
+
+            for act in acts:
+                yield classes[act['actor']](
+                    act['desc'], act['options']).execute()
+            self.assertEquals(repr((aws._entities, aws._buckets)), state)
+
+        self.assertEquals(aws._buckets['bucket-0']['tags'],
+                          [{'Key': 'release', 'Value': '%RELEASE%'}])
+
+
+class TestFakeHTTPClient(testing.AsyncTestCase):
+
+    @testing.gen_test
+    def test_fetch(self):
+        client = fakes.FakeHTTPClient(latency=0.01)
+        response = yield client.fetch('http://example.com', method='GET')
+        self.assertEquals(response.code, 200)
+        yield client.fetch(httpclient.HTTPRequest('http://example.com'))
+        self.assertEquals(client.requests, 2)
+
+
+class TestInstalled(testing.AsyncTestCase):
+
+    def test_swaps_and_restores(self):
+        originals = (rs_api.get_session, hipchat.TOKEN,
+                     http_client.get_client, boto3.client,
+                     boto.iam.connection.IAMConnection,
+                     boto.ec2.connect_to_region)
+
+        with fakes.installed(arrays={'array': 1}) as (http, rs, aws):
+            self.assertEquals(http_client.get_client(), http)
+            self.assertEquals(boto3.client('s3'), aws.s3)
+            self.assertEquals(boto.iam.connection.IAMConnection(), aws.iam)
+            self.assertEquals(
+                boto.ec2.connect_to_region('us-west-2').service, 'ec2')
+            session = rs_api.get_session('benchmark', rs_api.DEFAULT_ENDPOINT)
+            self.assertEquals(session.client._new_session(), rs)
+
+        self.assertEquals(
+            (rs_api.get_session, hipchat.TOKEN, http_client.get_client,
+             boto3.client, boto.iam.connection.IAMConnection,
+             boto.ec2.connect_to_region),
+            originals)
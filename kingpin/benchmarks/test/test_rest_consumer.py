@@ -0,0 +1,33 @@
+"""Tests for the benchmarks.rest_consumer module."""
+
+import mock
+
+from tornado import testing
+
+from kingpin.benchmarks import rest_consumer
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+class TestRestConsumer(testing.AsyncTestCase):
+
+    def test_legacy_consumer(self):
+        legacy = rest_consumer.LegacyRestConsumer()
+        group = legacy.aws().ec2().group(id='sig-1234')
+        self.assertEquals(group._path, '/aws/ec2/group/sig-1234')
+        self.assertTrue(hasattr(group, 'http_delete'))
+
+    def test_run(self):
+        results = rest_consumer.run(iterations=10)
+        self.assertEquals(len(results), 3)
+        for name, legacy, current in results:
+            self.assertGreater(legacy, 0)
+            self.assertGreater(current, 0)
+
+    @mock.patch('sys.stdout')
+    def test_main(self, stdout):
+        with mock.patch.object(rest_consumer, 'run',
+                               return_value=[('walk', 2.0, 1.0)]):
+            rest_consumer.main()
+        out = ''.join(c[0][0] for c in stdout.write.call_args_list)
+        self.assertIn('2.0x', out)
@@ -0,0 +1,48 @@
+"""Tests for the benchmarks.startup module."""
+
+import json
+import os
+import subprocess
+
+import mock
+
+from tornado import testing
+
+from kingpin.benchmarks import startup
+
+__author__ = 'Matt Wise <matt@nextdoor.com>'
+
+
+class TestStartup(testing.AsyncTestCase):
+
+    @mock.patch.object(subprocess, 'check_call')
+    def test_run(self, check_call):
+        results = startup.run(runs=3)
+        self.assertEquals(sorted(results),
+                          ['explain', 'import', 'python', 'sleep'])
+        for fastest, median in results.values():
+            self.assertLessEqual(fastest, median)
+        self.assertEquals(check_call.call_count, 12)
+
+        # The script of the 'sleep' scenario is cleaned up afterwards
+        script = [c[0][0][-1] for c in check_call.call_args_list
+                  if '--script' in c[0][0]][0]
+        self.assertFalse(os.path.exists(script))
+
+    @mock.patch.object(subprocess, 'check_output')
+    def test_heavy_imports(self, check_output):
+        check_output.return_value = json.dumps(['boto', 'json', 'yaml'])
+        self.assertEquals(startup.heavy_imports(), ['boto', 'yaml'])
+
+    @mock.patch('sys.stdout')
+    def test_main(self, stdout):
+        results = dict((name, (0.1, 0.2)) for name in
+                       ('python', 'import', 'explain', 'sleep'))
+        with mock.patch.object(startup, 'run', return_value=results) as run:
+            with mock.patch.object(startup, 'heavy_imports',
+                                   return_value=[]):
+                with mock.patch('sys.argv', ['startup', '--runs', '2']):
+                    startup.main()
+        run.assert_called_once_with(2)
+        out = ''.join(c[0][0] for c in stdout.write.call_args_list)
+        self.assertIn('loaded by the import: none', out)
@@ -26,7 +26,14 @@ from tornado import ioloop
 from kingpin import utils
 from kingpin.actors import utils as actor_utils
 from kingpin.actors import exceptions as actor_exceptions
+from kingpin.actors import group
 from kingpin.actors.misc import Macro
+from kingpin.actors.support import checkpoint
+from kingpin.actors.support import http_client
+from kingpin.actors.support import snapshot
+from kingpin.actors.support import summary
+from kingpin.actors.support import tracing
+from kingpin.actors.support import watchdog
 from kingpin.version import __version__
 
 
@@ -60,10 +67,34 @@ parser.add_argument('-o', '--option', dest='options', action='append',
                     default=[])
 parser.add_argument('-d', '--dry', dest='dry', action='store_true',
                     help='Executes a dry run only.')
+parser.add_argument('--rehearsal-concurrency', dest='rehearsal_concurrency',
+                    type=int, default=1,
+                    help=('Max number of acts each group.Sync runs at once '
+                          'during dry runs (default: 1)'))
+parser.add_argument('--snapshot-age', dest='snapshot_age', type=float,
+                    default=0,
+                    help=('Reuse the resource reads of the rehearsal in the '
+                          'real run, when younger than this many seconds'))
 parser.add_argument('--build-only', dest='build_only', action='store_true',
                     help='Compile the input JSON without executing any runs')
 parser.add_argument('--orgchart', dest='orgchart',
                     help='Save the orgchart into file. Requires --build-only')
+parser.add_argument('--trace', dest='trace',
+                    help='Save a timing trace of the run into file')
+parser.add_argument('--trace-format', dest='trace_format', default='chrome',
+                    choices=tracing.FORMATS,
+                    help='Format of the --trace file (default: chrome)')
+parser.add_argument('--summary', dest='summary',
+                    help=('Log the end-of-run statistics, and save them into '
+                          'file as JSON'))
+parser.add_argument('--journal', dest='journal',
+                    help='Record every completed actor into a journal file')
+parser.add_argument('--resume', dest='resume',
+                    help=('Skip the actors completed according to a journal '
+                          'file (and keep recording into it)'))
+parser.add_argument('--watchdog', dest='watchdog',
+                    help=('Warn about IOLoop lag and saturated thread pools, '
+                          'and save their time series into file as JSON'))
 
 # Logging Configuration
 parser.add_argument('-l', '--level', dest='level', default='info',
@@ -112,6 +143,17 @@ def get_main_actor(dry):
                  dry=dry)
 
 
+def get_registered_actor(dry):
+    actor = get_main_actor(dry=dry)
+    if (tracing.is_enabled() or snapshot.is_enabled() or
+            args.journal or args.resume):
+        orgchart = actor.get_orgchart()
+        tracing.register_orgchart(orgchart)
+        checkpoint.register_orgchart(orgchart)
+        snapshot.register_orgchart(orgchart)
+    return actor
+
+
 @gen.coroutine
 def main():
 
@@ -150,7 +192,7 @@ def main():
         log.info('Rehearsing... Break a leg!')
 
         try:
-            dry_actor = get_main_actor(dry=True)
+            dry_actor = get_registered_actor(dry=True)
             yield dry_actor.execute()
         except actor_exceptions.ActorException as e:
             log.critical('Dry run failed. Reason:')
@@ -160,7 +202,7 @@ def main():
         log.info('Rehearsal OK! Performing!')
 
     try:
-        runner = get_main_actor(dry=args.dry)
+        runner = get_registered_actor(dry=args.dry)
 
         log.info('')
         log.warn('Lights, camera ... action!')
@@ -178,6 +220,26 @@ def begin():
         args.level = 'DEBUG'
     utils.setup_root_logger(level=args.level, color=args.color)
 
+    if args.trace:
+        tracing.enable()
+
+    group.DRY_CONCURRENCY = args.rehearsal_concurrency
+
+    # Reads are only recorded during the rehearsal
+    if args.snapshot_age and not args.dry and not os.environ.get('SKIP_DRY'):
+        snapshot.enable(args.snapshot_age)
+
+    if args.journal and args.resume:
+        kingpin_fail('You may only specify --journal or --resume, not both!')
+    if args.journal or args.resume:
+        checkpoint.open_journal(args.journal or args.resume,
+                                resume=bool(args.resume))
+
+    dog = None
+    if args.watchdog:
+        dog = watchdog.Watchdog(io_loop=ioloop.IOLoop.instance())
+        dog.start()
+
     try:
         ioloop.IOLoop.instance().run_sync(main)
     except KeyboardInterrupt:
@@ -196,6 +258,27 @@ def begin():
                 print(l)
             skip_next = False
         sys.exit(3)
+    finally:
+        # Per-host HTTP request timing, useful when tuning HTTP_MAX_CLIENTS
+        http_client.log_host_stats(log)
+
+        # Per-actor-class and per-service timing for the whole run
+        summary.log_summary(
+            log, level=logging.INFO if args.summary else logging.DEBUG)
+        if snapshot.is_enabled():
+            log.info('Reused %(reused)s rehearsal reads, read %(read)s '
+                     'afresh.' % snapshot.get_stats())
+        if args.summary:
+            summary.write(args.summary)
+
+        if args.trace:
+            tracing.write(args.trace, args.trace_format)
+
+        if dog:
+            dog.stop()
+            dog.write(args.watchdog)
+
+        checkpoint.close_journal()
 
 if __name__ == '__main__':
     begin()
@@ -12,8 +12,6 @@
 #
 # Copyright 2014 Nextdoor.com, Inc
 
-import jsonschema
-
 from kingpin.actors import exceptions
 
 
@@ -62,6 +60,8 @@ class SchemaCompareBase(object):
 
     @classmethod
     def validate(self, option):
+        # jsonschema takes `requests` with it, so only load it when needed
+        import jsonschema
         try:
             jsonschema.Draft4Validator(self.SCHEMA).validate(option)
         except jsonschema.exceptions.ValidationError as e:
@@ -12,8 +12,6 @@
 #
 # Copyright 2014 Nextdoor.com, Inc
 
-import jsonschema
-
 from kingpin import exceptions
 
 __author__ = 'Matt Wise <matt@nextdoor.com>'
@@ -87,6 +85,8 @@ def validate(config):
     Raises:
         Execption if something went wrong.
     """
+    # jsonschema takes `requests` with it, so only load it when needed
+    import jsonschema
     try:
         return jsonschema.validate(config, SCHEMA_1_0)
     except jsonschema.exceptions.ValidationError as e:
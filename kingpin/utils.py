@@ -22,7 +22,6 @@ Common package for utility functions.
 from logging import handlers
 import difflib
 import datetime
-import demjson
 import functools
 import importlib
 import logging
@@ -30,13 +29,11 @@ import os
 import pprint
 import re
 import sys
-import yaml
 import time
 
 from tornado import gen
 from tornado import ioloop
 import httplib
-import rainbow_logging_handler
 
 from kingpin import exceptions
 
@@ -113,6 +110,9 @@ def setup_root_logger(level='warn', syslog=None, color=False):
         # asked for color, we give them color. The is_tty() method calls the
         # sys.stdout.isatty() method and then refuses to give color output on
         # platforms like Jenkins, where this code is likely to be run.
+        #
+        # (Imported here, so that it is only loaded when color is used.)
+        import rainbow_logging_handler
         rainbow_logging_handler.RainbowLoggingHandler.is_tty = True
 
         handler = rainbow_logging_handler.RainbowLoggingHandler(
@@ -343,24 +343,27 @@ def convert_script_to_dict(script_file, tokens):
     parsed = populate_with_tokens(raw, tokens)
 
     # If the file ends with .json, use demjson to read it. If it ends with
-    # .yml/.yaml, use PyYAML. If neither, error.
+    # .yml/.yaml, use PyYAML. If neither, error. Both parsers are slow to
+    # import, so only the one that is needed gets loaded.
     suffix = filename.split('.')[-1].strip().lower()
-    try:
-        if suffix == 'json':
+    if suffix == 'json':
+        import demjson
+        try:
             decoded = demjson.decode(parsed)
-        elif suffix in ('yml', 'yaml'):
-            decoded = yaml.safe_load(parsed)
-            if decoded is None:
-                raise exceptions.InvalidScript(
-                    'Invalid YAML in `%s`' % filename)
-        else:
-            raise exceptions.InvalidScriptName(
-                'Invalid file extension: %s' % suffix)
-    except demjson.JSONError as e:
-        # demjson exceptions have `pretty_description()` method with
-        # much more useful info.
-        raise exceptions.InvalidScript('JSON in `%s` has an error: %s' % (
-            filename, e.pretty_description()))
+        except demjson.JSONError as e:
+            # demjson exceptions have `pretty_description()` method with
+            # much more useful info.
+            raise exceptions.InvalidScript('JSON in `%s` has an error: %s' % (
+                filename, e.pretty_description()))
+    elif suffix in ('yml', 'yaml'):
+        import yaml
+        decoded = yaml.safe_load(parsed)
+        if decoded is None:
+            raise exceptions.InvalidScript(
+                'Invalid YAML in `%s`' % filename)
+    else:
+        raise exceptions.InvalidScriptName(
+            'Invalid file extension: %s' % suffix)
     return decoded
 
 